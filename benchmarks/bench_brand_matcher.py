@@ -0,0 +1,68 @@
+"""
+Microbenchmark: Aho-Corasick brand matching vs a naive scan of the brand list.
+
+The naive baseline normalises the text once and checks every brand spelling
+with a substring test, which is what a straightforward loop over brands.json
+would do. Both report brand lookups (texts scanned) per second.
+
+Usage (from the project root):
+    python -m benchmarks.bench_brand_matcher [--seconds 2]
+"""
+
+import argparse
+import time
+
+from internal.parameter_matching.brand_matcher import normalize_text
+from internal.parameter_matching.facets_config import config
+
+SAMPLE_TEXTS = [
+    "格安のNintendo switch lite 本体のみ",
+    "ナイキのスニーカー 27cm 新品",
+    "vintage watch under 5000 yen",
+    "シャネル ＣＨＡＮＥＬ　マトラッセ バッグ",
+    "one piece manga, in 500 jpy to 800 jpy",
+    "louis vuitton 財布 美品",
+    "ソニー ワイヤレスイヤホン WF-1000XM4",
+    "kids swimsuit",
+]
+
+
+def lookups_per_second(lookup, seconds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for text in SAMPLE_TEXTS:
+            lookup(text)
+        count += len(SAMPLE_TEXTS)
+    return count / seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    brands = config.get_facet_table("brands")
+    start = time.perf_counter()
+    brand_matcher = config.brand_matcher
+    print(
+        f"Automaton: {brand_matcher.state_count:,} states over {len(brands):,} brands,"
+        f" built in {(time.perf_counter() - start) * 1000:.0f} ms\n"
+    )
+
+    spellings = []
+    for name, sub_name, brand_id in zip(
+        brands.strings("name"), brands.strings("sub_name"), brands.ints("id")
+    ):
+        for spelling in (name, sub_name):
+            if spelling and len(normalize_text(spelling)) >= 2:
+                spellings.append((normalize_text(spelling), brand_id))
+
+    def naive_scan(text):
+        normalized = normalize_text(text)
+        return [brand_id for spelling, brand_id in spellings if spelling in normalized]
+
+    naive = lookups_per_second(naive_scan, args.seconds)
+    automaton = lookups_per_second(brand_matcher.find_in_text, args.seconds)
+    print(f"{'naive scan':<12} {naive:>12,.0f} lookups/s")
+    print(f"{'automaton':<12} {automaton:>12,.0f} lookups/s  ({automaton / naive:.0f}x)")
@@ -0,0 +1,77 @@
+"""
+Startup benchmark: facet loading from the compiled snapshot vs the JSON files.
+
+Each sample runs in a fresh interpreter so the numbers include imports and
+page-cache-warm file access, which is what a CLI run or a spawned worker pays.
+
+Usage (from the project root):
+    python -m benchmarks.bench_facets_startup [--runs 10]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from internal.parameter_matching.facets_snapshot import (
+    default_facets_dir,
+    default_snapshot_path,
+    facet_source_paths,
+    write_snapshot,
+)
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+# Measures construction plus the first lookups of the most used facets.
+STARTUP_SNIPPET = """
+import time
+start = time.perf_counter()
+from internal.parameter_matching.facets_config import FacetsConfig, default_categories_file_path
+config = FacetsConfig(default_categories_file_path, use_snapshot={use_snapshot})
+config.get_category_id_by_name("レディース")
+config.get_facet_table("brands").lookup("ナイキ")
+print(time.perf_counter() - start)
+"""
+
+
+def run_startup(use_snapshot: bool, runs: int):
+    """Returns (in-process seconds, whole-process seconds) per run."""
+    in_process, whole_process = [], []
+    snippet = STARTUP_SNIPPET.format(use_snapshot=use_snapshot)
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", snippet],
+            cwd=PROJECT_ROOT,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        whole_process.append(time.perf_counter() - start)
+        in_process.append(float(output.strip().splitlines()[-1]))
+    return in_process, whole_process
+
+
+def report(label, in_process, whole_process):
+    print(
+        f"{label:<10} load+lookup median {statistics.median(in_process) * 1000:8.2f} ms"
+        f" | process median {statistics.median(whole_process) * 1000:8.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    size = write_snapshot(facet_source_paths(default_facets_dir), default_snapshot_path)
+    print(f"Snapshot: {size:,} bytes, {args.runs} runs per mode\n")
+
+    json_results = run_startup(False, args.runs)
+    snapshot_results = run_startup(True, args.runs)
+    report("json", *json_results)
+    report("snapshot", *snapshot_results)
+    speedup = statistics.median(json_results[0]) / statistics.median(snapshot_results[0])
+    print(f"\nSnapshot load is {speedup:.1f}x faster than parsing JSON.")
@@ -0,0 +1,64 @@
+"""
+Microbenchmark: vectorised pre-ranking of search results.
+
+Ranks synthetic result sets of increasing size (as if several pages were
+merged) and reports the time to build the columns and to score and select
+the top items.
+
+Usage (from the project root):
+    python -m benchmarks.bench_item_ranker [--sizes 120 1000 5000] [--top-k 10]
+"""
+
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from internal.ranking.item_ranker import ItemColumns, item_ranker
+
+TITLE_WORDS = [
+    "Nintendo", "Switch", "本体", "ケース", "保護フィルム", "有機EL", "ジョイコン",
+    "ソフト", "マリオカート", "美品", "ジャンク", "充電器", "ドック", "lite", "新品",
+]
+
+
+def make_items(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        SimpleNamespace(
+            id_=f"m{i}",
+            name=" ".join(rng.sample(TITLE_WORDS, rng.randint(2, 6))),
+            price=rng.choice([300, 800, 1500, 9000, 18000, 24000, 32000]),
+            item_condition_id=rng.randint(1, 6),
+        )
+        for i in range(count)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[120, 1000, 5000])
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    query, brands = "nintendo switch 本体", ["Nintendo", "ニンテンドー"]
+    print(f"{'items':>7} {'columns ms':>11} {'score+top-k ms':>15}")
+    for size in args.sizes:
+        items = make_items(size)
+        column_times, score_times = [], []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            columns = ItemColumns.from_items(items)
+            middle = time.perf_counter()
+            item_ranker.top_k_indices(item_ranker.scores(columns, query, brands), args.top_k)
+            column_times.append(middle - start)
+            score_times.append(time.perf_counter() - middle)
+        print(
+            f"{size:>7,} {min(column_times) * 1000:>11.2f} {min(score_times) * 1000:>15.2f}"
+        )
+
+    top = item_ranker.rank(make_items(200), query, brands, args.top_k)
+    print("\nTop items for", repr(query))
+    for item in top[:5]:
+        print(f"  ¥{item.price:>6,} cond {item.item_condition_id}  {item.name}")
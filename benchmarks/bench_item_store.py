@@ -0,0 +1,146 @@
+"""
+Memory benchmark of the compact item representations against mercapi's result objects.
+
+Builds N search result items from an API-like response body the way mercapi
+does (json.loads, then map_to_class over items with IDs, titles, prices,
+timestamps and thumbnail URLs) and measures the memory each representation
+retains afterwards with tracemalloc, strings included:
+
+  - mercapi: list of SearchResultItem (what the pipeline used to hold)
+  - CompactItem: list of __slots__ records with interned strings
+  - ItemStore: interned string columns plus int arrays
+
+The "x N fetches" rows hold the same results fetched N times (cache entries,
+concurrent sessions searching alike): mercapi keeps N copies of every string,
+the compact forms share the interned ones. Build times include parsing. The serialisation of the store is
+timed too (pickle, JSON columns, JSONL records).
+
+Usage (from the project root):
+    python -m benchmarks.bench_item_store [--items 10000 100000] [--fetches 5]
+"""
+
+import argparse
+import gc
+import json
+import pickle
+import random
+import time
+import tracemalloc
+
+from mercapi.mapping import map_to_class
+from mercapi.models import SearchResultItem
+
+from internal.api_client.item_store import CompactItem, ItemStore
+
+_TITLE_WORDS = [
+    "Nintendo", "Switch", "Lite", "本体", "美品", "ケース", "セット", "まとめ売り", "ジャンク", "限定",
+    "箱あり", "中古", "新品", "ワイヤレス", "イヤホン", "ヴィンテージ", "腕時計", "SEIKO", "レディース", "バッグ",
+]
+
+
+def make_response_body(count, seed=0):
+    """API-like JSON response body with count search results."""
+    rng = random.Random(seed)
+    now = int(time.time())
+    items = [
+        {
+            "id": f"m{rng.randrange(10**10, 10**11)}",
+            "sellerId": str(rng.randrange(10**8, 10**9)),
+            "status": "ITEM_STATUS_ON_SALE",
+            "name": " ".join(rng.sample(_TITLE_WORDS, rng.randint(3, 7))),
+            "price": str(rng.randint(300, 50_000)),
+            "created": str(now - rng.randint(0, 10**6)),
+            "updated": str(now - rng.randint(0, 10**5)),
+            "thumbnails": [f"https://static.mercdn.net/c!/w=240/thumb/photos/m{index}_1.jpg"],
+            "itemType": "ITEM_TYPE_MERCARI",
+            "itemConditionId": str(rng.randint(1, 6)),
+            "shippingPayerId": str(rng.choice([1, 2])),
+            "shippingMethodId": str(rng.randint(1, 14)),
+            "categoryId": str(rng.randint(1, 3000)),
+            "isNoPrice": False,
+        }
+        for index in range(count)
+    ]
+    return json.dumps({"items": items}, ensure_ascii=False)
+
+
+def parse_items(body):
+    return [map_to_class(raw, SearchResultItem) for raw in json.loads(body)["items"]]
+
+
+def retained(build):
+    """Returns (value, bytes retained by value, seconds to build it)."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    value = build()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, size, seconds
+
+
+def timed(function):
+    start = time.perf_counter()
+    value = function()
+    return value, time.perf_counter() - start
+
+
+def run(count, fetches):
+    body = make_response_body(count)
+    mercapi_items, mercapi_bytes, mercapi_seconds = retained(lambda: parse_items(body))
+    del mercapi_items
+    _, mercapi_repeated_bytes, _ = retained(lambda: [parse_items(body) for _ in range(fetches)])
+    _, compact_repeated_bytes, _ = retained(
+        lambda: [[CompactItem.from_item(item) for item in parse_items(body)] for _ in range(fetches)]
+    )
+    _, store_repeated_bytes, _ = retained(
+        lambda: [ItemStore.from_items(parse_items(body)) for _ in range(fetches)]
+    )
+    compact_items, compact_bytes, compact_seconds = retained(
+        lambda: [CompactItem.from_item(item) for item in parse_items(body)]
+    )
+    sample = [item.to_dict() for item in compact_items[:100]]
+    del compact_items  # Otherwise the store would reuse its interned strings
+    store, store_bytes, store_seconds = retained(lambda: ItemStore.from_items(parse_items(body)))
+
+    print(f"\n{count:,} items")
+    print(f"  {'representation':<16} {'retained MB':>12} {'bytes/item':>11} {'build ms':>9}")
+    for label, size, seconds in [
+        ("mercapi", mercapi_bytes, mercapi_seconds),
+        ("CompactItem", compact_bytes, compact_seconds),
+        ("ItemStore", store_bytes, store_seconds),
+    ]:
+        print(f"  {label:<16} {size / 2**20:>12.1f} {size / count:>11.0f} {seconds * 1000:>9.1f}")
+    for label, size in [
+        ("mercapi", mercapi_repeated_bytes),
+        ("CompactItem", compact_repeated_bytes),
+        ("ItemStore", store_repeated_bytes),
+    ]:
+        print(f"  {label + f' x {fetches} fetches':<26} {size / 2**20:>7.1f} MB")
+
+    pickled, pickle_seconds = timed(lambda: pickle.dumps(store, protocol=pickle.HIGHEST_PROTOCOL))
+    _, unpickle_seconds = timed(lambda: pickle.loads(pickled))
+    columns_json, columns_seconds = timed(lambda: json.dumps(store.to_columns(), ensure_ascii=False))
+    jsonl, jsonl_seconds = timed(
+        lambda: "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in store.to_records())
+    )
+    print(f"  {'serialisation':<16} {'size MB':>12} {'':>11} {'ms':>9}")
+    for label, size, seconds in [
+        ("pickle", len(pickled), pickle_seconds),
+        ("unpickle", len(pickled), unpickle_seconds),
+        ("JSON columns", len(columns_json.encode("utf-8")), columns_seconds),
+        ("JSONL records", len(jsonl.encode("utf-8")), jsonl_seconds),
+    ]:
+        print(f"  {label:<16} {size / 2**20:>12.1f} {'':>11} {seconds * 1000:>9.1f}")
+    assert store.to_records()[:100] == sample
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--fetches", type=int, default=5, help="Repeated fetches of the same results.")
+    args = parser.parse_args()
+    for count in args.items:
+        run(count, args.fetches)
@@ -0,0 +1,153 @@
+"""
+Microbenchmark: near-duplicate clustering of listings before pre-ranking.
+
+Builds synthetic result sets in which every product is listed several times
+with the variations sellers add (【美品】-style notes, ★送料無料★, spacing,
+width, hiragana/katakana, a trailing decoration word), in one condition and at prices
+within 20% of each other. Some products also come as a junk copy and as an
+empty box ("... ジャンク", "... 箱のみ"), which are different products. Then
+reports:
+
+  - the time to cluster sets of increasing size (per item, to show that it
+    grows linearly), and the clusters found against the true products with
+    the precision and recall of the item pairs put into one cluster
+  - how many distinct products the ITEM_COUNT_FOR_RECOMMENDATION items sent
+    to the LLM cover, and the prompt tokens per distinct product, with and
+    without deduplication
+
+Usage (from the project root):
+    python -m benchmarks.bench_listing_dedup [--sizes 120 1000 5000 20000] [--copies 4]
+"""
+
+import argparse
+import random
+import time
+from collections import Counter
+
+import numpy as np
+
+from internal.api_client.item_store import ItemStore
+from internal.llm.prompt_builder import estimate_tokens, format_item_row
+from internal.ranking.item_ranker import item_ranker
+from internal.ranking.listing_deduplicator import listing_deduplicator
+from internal.utils.constants import ITEM_COUNT_FOR_RECOMMENDATION
+
+PRODUCT_WORDS = [
+    "Nintendo Switch", "Switch Lite", "有機ELモデル", "本体のみ", "ジョイコン", "マリオカート8",
+    "ポケモン", "スプラトゥーン3", "プロコン", "ドック", "グレー", "ネオンブルー", "ホワイト",
+    "ターコイズ", "コーラル", "限定版", "セット", "ソフト", "ケース", "保護フィルム", "充電スタンド",
+    "PlayStation5", "PS4 Pro", "DualSense", "iPhone 13", "iPad Air", "AirPods Pro", "Apple Watch",
+    "SEIKO", "CASIO", "G-SHOCK", "腕時計", "ヴィンテージ", "レディース", "メンズ", "ワンピース",
+    "スニーカー", "NIKE", "adidas", "ナイキ", "エアマックス", "ジャケット", "デニム", "ブラック",
+    "ネイビー", "Mサイズ", "Lサイズ", "26cm", "ワイヤレス", "イヤホン", "ヘッドホン", "カメラ",
+    "レンズ", "Canon", "一眼レフ", "まとめ売り", "トレカ", "BOX", "フィギュア", "ぬいぐるみ",
+]
+NOTES = ["【美品】", "【送料無料】", "★即購入OK★", "[匿名配送]", "≪値下げ≫", ""]
+SUFFIXES = ["", " 早い者勝ち", " 即日発送", " 値下げ"]
+# (title suffix, item condition, price factor) of the junk and empty-box products made from a product
+SIBLINGS = [(" ジャンク", 6, 0.2), (" 箱のみ", 3, 0.05)]
+
+
+def make_products(count, rng):
+    """
+    (title, item condition, price) of distinct products: titles of 3 to 5 product
+    words (in a fixed order, so no two differ only in word order), and for about
+    a quarter of them a junk copy and an empty box too.
+    """
+    titles = set()
+    products = []
+    while len(products) < count:
+        words = sorted(rng.sample(range(len(PRODUCT_WORDS)), rng.randint(3, 5)))
+        title = " ".join(PRODUCT_WORDS[index] for index in words)
+        if title in titles:
+            continue
+        titles.add(title)
+        price = rng.randint(10, 300) * 100
+        products.append((title, rng.randint(1, 5), price))
+        if rng.random() < 0.25:
+            products += [(title + suffix, condition, int(price * factor)) for suffix, condition, factor in SIBLINGS]
+    return products[:count]
+
+
+def vary(title, rng):
+    """One seller's spelling of a product title."""
+    if rng.random() < 0.3:
+        title = title.replace(" ", "　")
+    if rng.random() < 0.3:
+        title = title.upper()
+    if rng.random() < 0.2:
+        title = title.replace("ポケモン", "ぽけもん").replace("マリオカート", "まりおかーと")
+    return f"{rng.choice(NOTES)}{title}{rng.choice(SUFFIXES)}{rng.choice(NOTES)}"
+
+
+def make_listings(count, copies, seed=0):
+    """(items, product of every item): about count / copies products, each listed 1 to 2 * copies times."""
+    rng = random.Random(seed)
+    products = make_products(max(1, count // copies), rng)
+    product_ids = [rng.randrange(len(products)) for _ in range(count)]
+    items = ItemStore(
+        ids=[f"m{index:08d}" for index in range(count)],
+        names=[vary(products[product][0], rng) for product in product_ids],
+        prices=[int(products[product][2] * rng.uniform(0.9, 1.1)) for product in product_ids],
+        condition_ids=[products[product][1] for product in product_ids],
+    )
+    return items, np.array(product_ids)
+
+
+def pair_scores(labels, products):
+    """Precision and recall of the item pairs put into one cluster, against the true products."""
+    def pairs(counter):
+        return sum(size * (size - 1) // 2 for size in counter.values())
+
+    clustered = pairs(Counter(labels.tolist()))
+    same_product = pairs(Counter(products.tolist()))
+    both = pairs(Counter(zip(labels.tolist(), products.tolist())))
+    return both / clustered if clustered else 1.0, both / same_product if same_product else 1.0
+
+
+def prompt_coverage(candidates, items, products, query):
+    """(distinct products, estimated tokens) of the ranked candidates that would go into the prompt."""
+    top = item_ranker.rank(candidates, query, (), ITEM_COUNT_FOR_RECOMMENDATION)
+    index_by_id = {item_id: index for index, item_id in enumerate(items.ids)}
+    covered = {products[index_by_id[item.id_]] for item in top}
+    return len(covered), sum(estimate_tokens(format_item_row(item)) for item in top)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[120, 1000, 5000, 20000])
+    parser.add_argument("--copies", type=int, default=4, help="Average listings per product.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'items':>7} {'products':>9} {'clusters':>9} {'precision':>10} {'recall':>7} {'ms':>9} {'us/item':>8}")
+    for size in args.sizes:
+        items, products = make_listings(size, args.copies)
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            clusters = listing_deduplicator.cluster(items)
+            times.append(time.perf_counter() - start)
+        precision, recall = pair_scores(clusters.labels, products)
+        print(
+            f"{size:>7,} {len(set(products.tolist())):>9,} {len(clusters.representatives):>9,}"
+            f" {precision:>10.3f} {recall:>7.3f} {min(times) * 1000:>9.1f} {min(times) / size * 1e6:>8.1f}"
+        )
+
+    items, products = make_listings(args.sizes[0], args.copies)
+    clusters = listing_deduplicator.cluster(items)
+    query = "nintendo switch 本体"
+    representatives = clusters.select(items)
+    print()
+    for label, candidates in (("without dedup", items), ("with dedup", representatives)):
+        distinct, tokens = prompt_coverage(candidates, items, products, query)
+        print(
+            f"Prompt {label:<14} {distinct:>2} distinct products in {ITEM_COUNT_FOR_RECOMMENDATION} rows,"
+            f" {tokens} tokens ({tokens / distinct:.0f} per product)"
+        )
+    print(f"\nLargest cluster of {len(items)} items (* = kept):")
+    largest = Counter(clusters.labels.tolist()).most_common(1)[0][0]
+    kept_indices = set(clusters.representatives.tolist())
+    for index in np.flatnonzero(clusters.labels == largest)[:6]:
+        kept = "*" if index in kept_indices else " "
+        print(f" {kept} ¥{items.prices[index]:>6,} cond {items.condition_ids[index]}  {items.names[index]}")
@@ -0,0 +1,169 @@
+"""
+Benchmark and behaviour check of the multi-endpoint LLM scheduler.
+
+Starts several fake Ollama servers (benchmarks.stand_ins) in child processes.
+Each serves `parallel` generations at once, and a share of its requests are
+stragglers that wait --tail-latency extra seconds before the first token.
+Then it runs four scenarios against them:
+
+  1. One endpoint vs. the pool, without and with hedging, at the load one
+     endpoint can take: p50/p95/p99 generation latency, and how many hedges
+     were sent and won.
+  2. Priorities: a batch backlog is queued, then interactive calls arrive. The
+     scenario reports the mean queue wait per class; interactive calls should
+     overtake the backlog.
+  3. Failover: one server is killed mid-run. Every call must still succeed
+     (the benchmark exits with an error otherwise),
+     and the dead endpoint is ejected.
+  4. Concurrency caps: the pool never runs more than `parallel` calls per
+     endpoint.
+
+Usage (from the project root):
+    python -m benchmarks.bench_llm_scheduler [--endpoints 3] [--calls 120] [--concurrency 12]
+        [--tail-fraction 0.05] [--tail-latency 2.0]
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from benchmarks.stand_ins import SAMPLE_REQUESTS, start_fake_ollama_process
+from internal.llm.llm_scheduler import OllamaScheduler
+from internal.llm.prompt_builder import prompt_builder
+from internal.prompts.parameter_extraction_prompt import PARAM_EXTRACTION_PROMPT
+from internal.utils.constants import LLM_PRIORITY_BATCH, LLM_PRIORITY_INTERACTIVE
+
+PROMPTS = [prompt_builder.build(PARAM_EXTRACTION_PROMPT, user_request=text).text for text in SAMPLE_REQUESTS]
+
+
+async def timed_call(scheduler, index, priority=None):
+    start = time.perf_counter()
+    await scheduler.agenerate(PROMPTS[index % len(PROMPTS)], priority=priority)
+    return time.perf_counter() - start
+
+
+async def run_calls(scheduler, calls, concurrency, return_exceptions=False):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(index):
+        async with slots:
+            return await timed_call(scheduler, index)
+
+    return await asyncio.gather(*(one(index) for index in range(calls)), return_exceptions=return_exceptions)
+
+
+def latency_summary(latencies):
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return f"p50 {p50 * 1000:7.0f} ms  p95 {p95 * 1000:7.0f} ms  p99 {p99 * 1000:7.0f} ms"
+
+
+def make_scheduler(urls, parallel, **options):
+    scheduler = OllamaScheduler.from_urls(urls, max_concurrency=parallel, **options)
+    scheduler.start()
+    return scheduler
+
+
+async def scenario_latency(urls, args):
+    print(f"\n1. Latency at the same offered load ({args.parallel} concurrent calls)")
+    configurations = [
+        ("1 endpoint", urls[:1], {"hedge_percentile": None}),
+        (f"{len(urls)} endpoints", urls, {"hedge_percentile": None}),
+        (f"{len(urls)} endpoints + hedging", urls, {"hedge_percentile": args.hedge_percentile}),
+    ]
+    for label, endpoint_urls, options in configurations:
+        scheduler = make_scheduler(endpoint_urls, args.parallel, hedge_min_samples=20, **options)
+        try:
+            await run_calls(scheduler, 20, args.parallel)  # Warm-up and latency samples
+            scheduler.hedges_sent = scheduler.hedges_won = 0
+            latencies = await run_calls(scheduler, args.calls, args.parallel)
+            hedges = f"  hedges {scheduler.hedges_sent} sent / {scheduler.hedges_won} won" if options["hedge_percentile"] else ""
+            print(f"  {label:<28} {latency_summary(latencies)}{hedges}")
+        finally:
+            scheduler.close()
+
+
+async def scenario_priorities(urls, args):
+    print("\n2. Priorities (batch backlog, then interactive calls)")
+    scheduler = make_scheduler(urls, args.parallel, hedge_percentile=None)
+    try:
+        backlog = [
+            asyncio.ensure_future(timed_call(scheduler, index, LLM_PRIORITY_BATCH))
+            for index in range(args.parallel * len(urls) * 4)
+        ]
+        await asyncio.sleep(0.05)
+        interactive = [
+            asyncio.ensure_future(timed_call(scheduler, index, LLM_PRIORITY_INTERACTIVE))
+            for index in range(args.parallel * len(urls))
+        ]
+        batch_latencies = await asyncio.gather(*backlog)
+        interactive_latencies = await asyncio.gather(*interactive)
+        print(f"  batch        ({len(batch_latencies):3d} calls) mean {np.mean(batch_latencies) * 1000:7.0f} ms")
+        print(f"  interactive  ({len(interactive_latencies):3d} calls) mean {np.mean(interactive_latencies) * 1000:7.0f} ms")
+    finally:
+        scheduler.close()
+
+
+async def scenario_failover(urls, processes, args):
+    print("\n3. Failover (one server killed mid-run)")
+    scheduler = make_scheduler(urls, args.parallel, hedge_percentile=None, health_check_interval=0.5)
+    try:
+        calls = asyncio.ensure_future(run_calls(scheduler, args.calls, args.concurrency, return_exceptions=True))
+        await asyncio.sleep(1.0)
+        processes[-1].kill()
+        peak = 0
+        while not calls.done():  # 4. Per-endpoint caps hold under load
+            peak = max(peak, *(endpoint.in_flight for endpoint in scheduler.endpoints))
+            await asyncio.sleep(0.01)
+        errors = [result for result in calls.result() if isinstance(result, BaseException)]
+        latencies = [result for result in calls.result() if not isinstance(result, BaseException)]
+        print(f"  {len(latencies)}/{args.calls} calls succeeded  {latency_summary(latencies)}")
+        for endpoint in scheduler.stats()["endpoints"]:
+            print(
+                f"  {endpoint['url']}: healthy={endpoint['healthy']} completed={endpoint['completed']}"
+                f" failures={endpoint['failures']}"
+            )
+        print(f"\n4. Peak calls in flight on one endpoint: {peak} (cap {args.parallel})")
+        if errors:
+            raise SystemExit(f"Failover: {len(errors)} calls failed, e.g. {errors[0]!r}")
+        if peak > args.parallel:
+            raise SystemExit(f"Concurrency cap exceeded: {peak} calls on one endpoint")
+    finally:
+        scheduler.close()
+
+
+async def main(args):
+    started = [
+        start_fake_ollama_process(
+            token_rate=args.token_rate,
+            latency=args.latency,
+            parallel=args.parallel,
+            tail_fraction=args.tail_fraction,
+            tail_latency=args.tail_latency,
+        )
+        for _ in range(args.endpoints)
+    ]
+    processes = [process for process, _ in started]
+    urls = [url for _, url in started]
+    try:
+        await scenario_latency(urls, args)
+        await scenario_priorities(urls, args)
+        await scenario_failover(urls, processes, args)
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--endpoints", type=int, default=3)
+    parser.add_argument("--parallel", type=int, default=2, help="Generations per fake server at once.")
+    parser.add_argument("--calls", type=int, default=120)
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--token-rate", type=float, default=400.0)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tail-fraction", type=float, default=0.05, help="Share of straggler requests.")
+    parser.add_argument("--tail-latency", type=float, default=2.0, help="Extra first-token delay of a straggler (s).")
+    parser.add_argument("--hedge-percentile", type=float, default=90.0)
+    asyncio.run(main(parser.parse_args()))
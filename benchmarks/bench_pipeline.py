@@ -0,0 +1,200 @@
+"""
+End-to-end benchmark of the shopper pipeline against local stand-ins.
+
+Starts the fake Ollama server (benchmarks.stand_ins) in a child process and
+runs the CLI's handle_* stages (extraction -> search -> recommendation)
+through the batch runner against a FakeMercapi, at each concurrency level.
+Reports per-stage p50/p95/p99 latency, throughput and peak RSS. Needs no
+network and no Ollama installation.
+
+The LLM response caches (exact and semantic) and the search result cache
+are disabled unless --llm-cache / --search-cache are given, so every request
+does the full work.
+Peak RSS is the process high-water mark, so it never decreases between levels.
+Stage timings exclude waiting for a concurrency slot; "total" includes it.
+With --telemetry PREFIX, spans are written to PREFIX.jsonl and the metrics to
+PREFIX.prom; compare against a run without it to see the tracing overhead.
+
+Usage (from the project root):
+    python -m benchmarks.bench_pipeline [--requests 40] [--concurrency 1 4 16]
+        [--token-rate 40] [--latency 0.1] [--page-latency 0.3] [--json results.json]
+        [--pushdown price categories brands] [--telemetry PREFIX]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import resource
+import time
+
+import numpy as np
+
+from benchmarks.stand_ins import SAMPLE_REQUESTS, FakeMercapi, start_fake_ollama_process
+from internal.api_client import mercari_api_client
+from internal.api_client.query_planner import query_planner
+from internal.api_client.search_engine import MercariSearchEngine
+from internal.llm import llm_parameter_extraction
+from internal.llm.ollama_client import ollama_client
+from internal.llm.response_cache import llm_response_cache
+from internal.llm.semantic_cache import semantic_cache
+from internal.parameter_matching.fast_path_extractor import fast_path_extractor
+from internal.pipeline.batch_runner import BatchRunner, BatchStages
+from internal.utils.telemetry import telemetry
+
+STAGES = ("extraction", "search", "recommendation", "total")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is in KiB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def summarize(results, wall_seconds):
+    summary = {
+        "requests": len(results),
+        "ok": sum(result["status"] == "ok" for result in results),
+        "throughput_rps": len(results) / wall_seconds if wall_seconds else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        "search_pages": sum(result.get("pages_fetched") or 0 for result in results),
+        "stages": {},
+    }
+    for stage in STAGES:
+        timings = [result["timings_ms"][stage] for result in results if stage in result["timings_ms"]]
+        if timings:
+            p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+            summary["stages"][stage] = {"count": len(timings), "p50": p50, "p95": p95, "p99": p99}
+    return summary
+
+
+def run_level(stages, requests, concurrency):
+    """Runs all requests with `concurrency` for both the LLM and the search stages."""
+    runner = BatchRunner(stages, llm_concurrency=concurrency, search_concurrency=concurrency)
+    input_file = io.StringIO(
+        "".join(json.dumps({"request_id": i, "request": text}) + "\n" for i, text in enumerate(requests))
+    )
+    output_file = io.StringIO()
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        asyncio.run(runner.run(input_file, output_file, progress_file=None))
+    wall_seconds = time.perf_counter() - start
+    results = [json.loads(line) for line in output_file.getvalue().splitlines()]
+    return summarize(results, wall_seconds)
+
+
+def print_summary(concurrency, summary):
+    print(
+        f"\nconcurrency {concurrency}: {summary['ok']}/{summary['requests']} ok,"
+        f" {summary['throughput_rps']:.2f} req/s, {summary['search_pages']} search pages,"
+        f" peak RSS {summary['peak_rss_mb']:.0f} MB"
+    )
+    print(f"  {'stage':<15} {'n':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, stats in summary["stages"].items():
+        print(
+            f"  {stage:<15} {stats['count']:>4} {stats['p50']:>9.1f} {stats['p95']:>9.1f} {stats['p99']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=40, help="Requests per concurrency level.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--token-rate", type=float, default=40.0, help="Fake LLM tokens/s per request.")
+    parser.add_argument("--prompt-rate", type=float, default=1000.0, help="Fake prompt tokens/s.")
+    parser.add_argument("--latency", type=float, default=0.1, help="Fake LLM latency per call (s).")
+    parser.add_argument("--parallel", type=int, default=4, help="Generations the fake LLM serves at once.")
+    parser.add_argument(
+        "--cache-slots", type=int, help="Prompts the fake LLM keeps for prefix reuse (0 disables it)."
+    )
+    parser.add_argument(
+        "--malformed-fraction", type=float, help="Share of fake LLM outputs that are not bare JSON without `format`."
+    )
+    parser.add_argument(
+        "--output-format", choices=["schema", "json", "none"], help="Override OLLAMA_OUTPUT_FORMAT."
+    )
+    parser.add_argument(
+        "--pushdown",
+        nargs="*",
+        metavar="FILTER",
+        help="Filters sent to the fake Mercari API, the rest run client-side (default: MERCARI_PUSHDOWN_FILTERS).",
+    )
+    parser.add_argument("--page-latency", type=float, default=0.3, help="Fake Mercari page latency (s).")
+    parser.add_argument("--page-size", type=int, default=120)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--responses", help="JSON file of canned extraction outputs by request.")
+    parser.add_argument("--llm-cache", action="store_true", help="Keep the LLM response cache enabled.")
+    parser.add_argument("--search-cache", action="store_true", help="Keep the search result cache enabled.")
+    parser.add_argument("--no-fast-path", action="store_true", help="Send every request to the LLM.")
+    parser.add_argument("--json", metavar="FILE", help="Also write the results as JSON.")
+    parser.add_argument("--telemetry", metavar="PREFIX", help="Record spans and metrics to PREFIX.jsonl/.prom.")
+    args = parser.parse_args()
+
+    # Imported here so the stages pick up the reconfigured shared clients
+    from cli.mercari_shopper_app import (
+        handle_mercari_search_simulation,
+        handle_parameter_extraction,
+        handle_recommendation_generation,
+    )
+
+    llm_response_cache.db_path = None  # Never touch the user's cache files
+    semantic_cache.path = None
+    if not args.llm_cache:
+        llm_response_cache.ttl_seconds = 0
+        semantic_cache.enabled = False
+    if args.output_format:
+        llm_parameter_extraction.output_format = args.output_format
+    if args.pushdown is not None:
+        query_planner.pushdown = frozenset(args.pushdown)
+    if args.no_fast_path:
+        fast_path_extractor.min_coverage = float("inf")
+
+    process, base_url = start_fake_ollama_process(
+        token_rate=args.token_rate,
+        prompt_rate=args.prompt_rate,
+        latency=args.latency,
+        parallel=args.parallel,
+        cache_slots=args.cache_slots,
+        malformed_fraction=args.malformed_fraction,
+        responses=args.responses,
+    )
+    ollama_client.base_url = base_url
+    engine_options = {} if args.search_cache else {"cache_ttl_seconds": 0}
+    mercari_api_client.search_engine = MercariSearchEngine(
+        mercapi_factory=lambda: FakeMercapi(args.page_latency, args.page_size, args.pages),
+        **engine_options,
+    )
+
+    stages = BatchStages(
+        extract=handle_parameter_extraction,
+        search=handle_mercari_search_simulation,
+        recommend=handle_recommendation_generation,
+    )
+    telemetry_log = None
+    if args.telemetry:
+        telemetry_log = open(f"{args.telemetry}.jsonl", "w", encoding="utf-8")
+        telemetry.configure(enabled=True, log_file=telemetry_log)
+
+    requests = list(itertools.islice(itertools.cycle(SAMPLE_REQUESTS), args.requests))
+    all_results = {}
+    try:
+        # Warm-up: facet indexes and connections, so the first level is not penalised
+        run_level(stages, SAMPLE_REQUESTS[:2], 1)
+        for concurrency in args.concurrency:
+            summary = run_level(stages, requests, concurrency)
+            all_results[concurrency] = summary
+            print_summary(concurrency, summary)
+        print(f"\nFast path: {fast_path_extractor.stats()}")
+    finally:
+        process.terminate()
+        mercari_api_client.search_engine.close()
+        if telemetry_log is not None:
+            telemetry_log.close()
+            with open(f"{args.telemetry}.prom", "w", encoding="utf-8") as f:
+                f.write(telemetry.render_prometheus())
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(all_results, f, indent=2)
@@ -0,0 +1,147 @@
+"""
+Benchmark of watch mode with thousands of saved searches.
+
+Runs a WatchRunner over --searches saved searches against a FakeListingFeed,
+where every query gains listings at its own rate (most are quiet, a few
+busy), for --duration seconds with short poll intervals. The parameters are
+given up front, so no LLM is involved; the recommend stage only ranks the
+new items with the local ranker.
+
+Reports polls per second, search pages, new listings detected against the
+feed's ground truth (listings added between each search's first and last
+poll), the poll intervals of quiet and busy searches after adapting,
+scheduling lag (its p99 includes the burst of first polls), the memory and state file size of the seen-item filters,
+and the items ranked on the deltas against re-ranking full result pages on
+every poll.
+
+Usage (from the project root):
+    python -m benchmarks.bench_watch [--searches 2000] [--duration 60]
+        [--min-interval 2] [--max-interval 15] [--page-latency 0.05]
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.stand_ins import FakeListingFeed
+from internal.api_client.search_engine import MercariSearchEngine
+from internal.pipeline.watch_runner import WatchRunner, WatchStages, WatchStore
+from internal.ranking.item_ranker import item_ranker
+from internal.utils.constants import ITEM_COUNT_FOR_RECOMMENDATION, PRE_RANKING_CANDIDATE_COUNT
+
+
+class RecordingFeed(FakeListingFeed):
+    """Remembers each query's listing count at its first and latest search (the ground truth)."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.first_counts = {}
+        self.last_counts = {}
+
+    def make_page(self, search_kwargs, page):
+        items = super().make_page(search_kwargs, page)
+        if page == 0 and items:
+            query = search_kwargs.get("query") or "item"
+            count = int(items[0].id_[-8:]) + 1  # The newest listing's sequence number
+            self.first_counts.setdefault(query, count)
+            self.last_counts[query] = count
+        return items
+
+
+def rank_delta(user_request, search_result, extracted_params):
+    ranked = item_ranker.rank(search_result.items, extracted_params["query"], (), ITEM_COUNT_FOR_RECOMMENDATION)
+    return {"recommendations": [{"item_id": item.id_} for item in ranked]}
+
+
+def state_file_stats(runner):
+    """Saves and reloads the state once; returns (bytes, save seconds, load seconds)."""
+    with tempfile.TemporaryDirectory() as directory:
+        store = WatchStore(os.path.join(directory, "watch_state.npz"))
+        start = time.perf_counter()
+        store.save(list(runner.watches.values()))
+        save_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded = store.load()
+        load_seconds = time.perf_counter() - start
+        assert len(loaded) == len(runner.watches)
+        return os.path.getsize(store.path), save_seconds, load_seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--searches", type=int, default=2000, help="Saved searches to watch.")
+    parser.add_argument("--duration", type=float, default=60.0, help="Seconds to run.")
+    parser.add_argument("--initial-interval", type=float, default=5.0)
+    parser.add_argument("--min-interval", type=float, default=2.0)
+    parser.add_argument("--max-interval", type=float, default=15.0)
+    parser.add_argument("--search-concurrency", type=int, default=64)
+    parser.add_argument("--page-latency", type=float, default=0.05, help="Fake Mercari page latency (s).")
+    parser.add_argument("--max-rate", type=float, default=0.5, help="New listings/s of the busiest query.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    feed = RecordingFeed(page_latency=args.page_latency, max_rate=args.max_rate)
+    engine = MercariSearchEngine(
+        max_concurrent_searches=args.search_concurrency, mercapi_factory=lambda: feed, cache_ttl_seconds=0
+    )
+    runner = WatchRunner(
+        WatchStages(extract=lambda request: None, recommend=rank_delta),
+        engine=engine,
+        store=WatchStore(path=None),
+        llm_concurrency=4,
+        search_concurrency=args.search_concurrency,
+        initial_interval=args.initial_interval,
+        min_interval=args.min_interval,
+        max_interval=args.max_interval,
+        rng=random.Random(args.seed),
+    )
+    queries = [f"saved search {index:05d}" for index in range(args.searches)]
+    for index, query in enumerate(queries):
+        runner.add(str(index), query, params={"query": query})
+
+    start = time.perf_counter()
+    try:
+        asyncio.run(runner.run(io.StringIO(), duration=args.duration, progress_file=None))
+    finally:
+        engine.close()
+    wall_seconds = time.perf_counter() - start
+
+    watches = list(runner.watches.values())
+    true_new = sum(feed.last_counts[query] - feed.first_counts[query] for query in feed.first_counts)
+    # Busy: at least one new listing per max_interval on average
+    busy = [watch.interval for watch in watches if feed.rate(watch.request) * args.max_interval >= 1]
+    quiet = [watch.interval for watch in watches if feed.rate(watch.request) * args.max_interval < 1]
+    lags = np.array(runner.poll_lags) * 1000
+    full_rerun_items = runner.polls * PRE_RANKING_CANDIDATE_COUNT
+    state_bytes, save_seconds, load_seconds = state_file_stats(runner)
+    seen_bytes = sum(watch.seen.state().nbytes for watch in watches)
+
+    print(f"{len(watches)} saved searches for {wall_seconds:.1f} s")
+    print(
+        f"  polls: {runner.polls} ({runner.polls / wall_seconds:.0f}/s), {runner.errors} errors,"
+        f" {feed.requests} search pages ({feed.requests / max(1, runner.polls):.2f} per poll)"
+    )
+    print(
+        f"  new listings: {runner.new_items} detected of {true_new} added"
+        f" ({true_new - runner.new_items} missed)"
+    )
+    for label, intervals in (("busy", busy), ("quiet", quiet)):
+        if intervals:
+            p10, p50, p90 = np.percentile(intervals, [10, 50, 90])
+            print(f"  {label:<17} {len(intervals):>5} searches, interval p10/p50/p90 {p10:.1f}/{p50:.1f}/{p90:.1f} s")
+    if len(lags):
+        print(f"  scheduling lag: p50 {np.percentile(lags, 50):.1f} ms, p99 {np.percentile(lags, 99):.1f} ms")
+    print(
+        f"  seen filters: {seen_bytes / 1024:.0f} KiB ({seen_bytes // len(watches)} bytes per search),"
+        f" state file {state_bytes / 1024:.0f} KiB, save {save_seconds * 1000:.0f} ms, load {load_seconds * 1000:.0f} ms"
+    )
+    print(
+        f"  items ranked: {runner.items_ranked} on deltas vs {full_rerun_items} re-ranking"
+        f" {PRE_RANKING_CANDIDATE_COUNT} candidates per poll"
+    )
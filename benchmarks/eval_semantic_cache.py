@@ -0,0 +1,155 @@
+"""
+Hit rate and false-reuse rate of the semantic parameter cache on a request log.
+
+Replays the log in order through an empty SemanticCache at each threshold:
+a request that misses stores its recorded parameters, a request that hits
+reuses the parameters of the earlier request it matched. A hit is a false
+reuse when those parameters would run a different search than the
+request's own recorded ones: a different price range, category, brand,
+condition, shipping payer, size, color or sort order, or a query sharing
+less than half of its terms. "Reusable" counts requests whose search matches an earlier
+request's, the most a perfect cache could serve.
+
+The log is JSONL with "request" and "params" per line, e.g. the output of
+`--batch`. Without --log, a built-in set of paraphrases and near misses
+(other prices, brands, conditions, sizes, colors and models) is used.
+
+Usage (from the project root):
+    python -m benchmarks.eval_semantic_cache [--log results.jsonl] [--encoder hashing|ollama]
+        [--thresholds 0.7 0.8 0.9] [--show 0.8]
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from internal.llm.semantic_cache import SemanticCache, make_encoder
+from internal.ranking.item_ranker import query_terms
+
+
+def params(query, **fields):
+    return {"query": query, **fields}
+
+
+# (request, recorded parameters); groups of paraphrases followed by near misses
+SAMPLE_LOG = [
+    ("cheap nintendo switch lite console only", params("nintendo switch lite")),
+    ("nintendo switch lite console only, cheap", params("nintendo switch lite")),
+    ("Nintendo Switch Lite 本体のみ 格安", params("nintendo switch lite")),
+    ("ｎｉｎｔｅｎｄｏ　ｓｗｉｔｃｈ　ｌｉｔｅ console only", params("nintendo switch lite")),
+    ("nintendo switch oled console", params("nintendo switch oled")),
+    ("vintage watch under 5000 yen", params("vintage watch", price_max=5000)),
+    ("vintage watch below 5000 yen", params("vintage watch", price_max=5000)),
+    ("under 5000 yen vintage watch", params("vintage watch", price_max=5000)),
+    ("vintage watch under 3000 yen", params("vintage watch", price_max=3000)),
+    ("vintage seiko watch under 5000 yen", params("vintage watch", price_max=5000, brands=["SEIKO"])),
+    ("new wireless earphones", params("wireless earphones", item_conditions=["new"])),
+    ("wireless earphones, new", params("wireless earphones", item_conditions=["new"])),
+    ("brand new wireless earphones", params("wireless earphones", item_conditions=["new"])),
+    ("used wireless earphones", params("wireless earphones", item_conditions=["used"])),
+    ("ワイヤレスイヤホン 新品", params("ワイヤレスイヤホン", item_conditions=["new"])),
+    ("ワイヤレスイヤホン　新品未使用", params("ワイヤレスイヤホン", item_conditions=["new"])),
+    ("louis vuitton bag", params("bag", brands=["Louis Vuitton"])),
+    ("louis vuitton handbag", params("handbag", brands=["Louis Vuitton"])),
+    ("bag louis vuitton", params("bag", brands=["Louis Vuitton"])),
+    ("gucci bag", params("bag", brands=["GUCCI"])),
+    ("pokemon cards", params("pokemon cards")),
+    ("pokemon card lot", params("pokemon cards")),
+    ("pokemon cards free shipping", params("pokemon cards", shipping_payer=["seller"])),
+    ("pokemon cards with free shipping", params("pokemon cards", shipping_payer=["seller"])),
+    ("iphone 13 case", params("iphone 13 case")),
+    ("case for iphone 13", params("iphone 13 case")),
+    ("iphone 14 case", params("iphone 14 case")),
+    ("cheapest iphone 13 case", params("iphone 13 case", sort_by="price", sort_order="asc")),
+    ("レディース バッグ 黒", params("バッグ 黒", categories=["レディース"])),
+    ("黒 レディース バッグ", params("バッグ 黒", categories=["レディース"])),
+    ("mens jacket size L", params("jacket", categories=["メンズ"], sizes=["L"])),
+    ("men's jacket, size L", params("jacket", categories=["メンズ"], sizes=["L"])),
+    ("mens jacket size S", params("jacket", categories=["メンズ"], sizes=["S"])),
+    ("nintendo switch lite console", params("nintendo switch lite")),
+    ("nintendo switch oled console only", params("nintendo switch oled")),
+    ("black leather handbag", params("leather handbag", colors=["black"])),
+    ("a black leather handbag please", params("leather handbag", colors=["black"])),
+    ("red leather handbag", params("leather handbag", colors=["red"])),
+]
+
+_LIST_FIELDS = ("categories", "brands", "item_conditions", "shipping_payer", "sizes", "colors")
+_SCALAR_FIELDS = ("price_min", "price_max", "sort_by", "sort_order")
+
+
+def same_search(reused, recorded, min_query_overlap=0.5):
+    """True if two parameter dicts would run the same search (see the module docstring)."""
+    for key in _SCALAR_FIELDS:
+        if (reused.get(key) or None) != (recorded.get(key) or None):
+            return False
+    for key in _LIST_FIELDS:
+        if {str(value) for value in reused.get(key) or []} != {str(value) for value in recorded.get(key) or []}:
+            return False
+    reused_terms = set(query_terms(reused.get("query") or ""))
+    recorded_terms = set(query_terms(recorded.get("query") or ""))
+    union = reused_terms | recorded_terms
+    return not union or len(reused_terms & recorded_terms) / len(union) >= min_query_overlap
+
+
+def load_log(path):
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if record.get("request") and isinstance(record.get("params"), dict):
+                    records.append((record["request"], record["params"]))
+    return records
+
+
+def replay(records, vectors, encoder, threshold):
+    """Returns (hits, false reuses as (request, matched request, similarity), reusable)."""
+    cache = SemanticCache(encoder, threshold=threshold)
+    hits, false_reuses, reusable = 0, [], 0
+    seen = []
+    for (text, recorded), vector in zip(records, vectors):
+        reusable += any(same_search(earlier, recorded) for earlier in seen)
+        seen.append(recorded)
+        hit = cache.lookup(text, vector=vector)
+        if hit is None:
+            cache.store(text, json.dumps(recorded, ensure_ascii=False), vector=vector)
+            continue
+        hits += 1
+        if not same_search(json.loads(hit.value), recorded):
+            false_reuses.append((text, hit.text, hit.similarity))
+    return hits, false_reuses, reusable
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--log", help="JSONL request log with request and params (default: built-in sample).")
+    parser.add_argument("--encoder", default="hashing", choices=["hashing", "ollama"])
+    parser.add_argument(
+        "--thresholds", type=float, nargs="+", default=[0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95]
+    )
+    parser.add_argument("--show", type=float, help="List the false reuses at this threshold.")
+    args = parser.parse_args()
+
+    records = load_log(args.log) if args.log else SAMPLE_LOG
+    encoder = make_encoder(args.encoder)
+    start = time.perf_counter()
+    vectors = np.vstack([encoder.encode([text]) for text, _ in records])
+    encode_ms = (time.perf_counter() - start) * 1000 / len(records)
+    print(f"{len(records)} requests, encoder {encoder.name}, {encode_ms:.2f} ms per request to encode")
+
+    print(f"\n  {'threshold':>9} {'hits':>5} {'hit rate':>9} {'false':>6} {'false-reuse rate':>17} {'reusable':>9}")
+    for threshold in sorted(set(args.thresholds + ([args.show] if args.show else []))):
+        hits, false_reuses, reusable = replay(records, vectors, encoder, threshold)
+        false_rate = len(false_reuses) / hits if hits else 0.0
+        print(
+            f"  {threshold:>9.2f} {hits:>5} {hits / len(records):>9.1%} {len(false_reuses):>6}"
+            f" {false_rate:>17.1%} {reusable:>9}"
+        )
+        if args.show is not None and threshold == args.show:
+            shown = false_reuses
+    if args.show is not None:
+        print(f"\nFalse reuses at {args.show:.2f}:")
+        for text, matched, similarity in shown:
+            print(f"  {similarity:.2f}  {text!r} reused {matched!r}")
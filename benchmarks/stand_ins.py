@@ -0,0 +1,494 @@
+"""
+Local stand-ins for Ollama and the Mercari API, for benchmarks without network.
+
+FakeOllamaHandler serves /api/generate like Ollama: it waits for the prompt
+evaluation (latency plus prompt tokens / prompt_rate), then streams the canned
+output token by token at token_rate tokens per second and ends with Ollama's
+final statistics. Extraction prompts get the canned output for their user
+request (or a generic one); recommendation prompts get the first items of the
+item table in the prompt. Without a `format` in the request, a
+malformed_fraction of the outputs is wrapped in prose or breaks off, and
+options.num_predict caps the output (done_reason "length"). With
+break_after_tokens, the connection is dropped mid-stream, like a server
+that dies. Like Ollama's per-slot KV cache, it keeps the last
+cache_slots prompts and only evaluates the part of a prompt after its longest
+common prefix with one of them. /api/embed returns character n-gram vectors
+(HashingEncoder) instead of a model's embeddings.
+
+FakeMercapi implements the part of mercapi.Mercapi that the search engine
+uses: search() and SearchResults.next_page(), with a configurable page latency,
+page size and number of pages. Results are deterministic per query.
+
+Run the Ollama stand-in on its own with:
+    python -m benchmarks.stand_ins --token-rate 40 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from internal.llm.prompt_builder import ITEM_TABLE_DELIMITER, estimate_tokens
+from internal.llm.semantic_cache import HashingEncoder
+
+_EMBEDDER = HashingEncoder(dimensions=256)
+
+# Canned extraction outputs for the sample requests (names, as the LLM returns them)
+CANNED_EXTRACTIONS = {
+    "vintage watch under 5000 yen": {
+        "query": "vintage watch", "price_min": None, "price_max": 5000, "categories": [],
+        "brands": [], "item_conditions": [], "shipping_payer": [], "sizes": [], "colors": [],
+        "sort_by": "", "sort_order": "",
+    },
+    "one piece manga, in 500 jpy to 800 jpy": {
+        "query": "one piece", "price_min": 500, "price_max": 800, "categories": ["manga"],
+        "brands": [], "item_conditions": [], "shipping_payer": [], "sizes": [], "colors": [],
+        "sort_by": "", "sort_order": "",
+    },
+    "I'm looking for a nintendo switch for my son, not too expensive, preferably new": {
+        "query": "nintendo switch", "price_min": None, "price_max": 30000, "categories": ["games"],
+        "brands": ["Nintendo"], "item_conditions": ["new"], "shipping_payer": [], "sizes": [],
+        "colors": [], "sort_by": "", "sort_order": "",
+    },
+    "ナイキのスニーカーで、できれば送料込みで状態がいいもの": {
+        "query": "スニーカー", "price_min": None, "price_max": None, "categories": ["スニーカー"],
+        "brands": ["ナイキ"], "item_conditions": ["美品"], "shipping_payer": ["seller"],
+        "sizes": [], "colors": [], "sort_by": "", "sort_order": "",
+    },
+    "a nice gift for my mother who likes louis vuitton wallets": {
+        "query": "ルイヴィトン 財布", "price_min": None, "price_max": None, "categories": [],
+        "brands": ["Louis Vuitton"], "item_conditions": [], "shipping_payer": [], "sizes": [],
+        "colors": [], "sort_by": "", "sort_order": "",
+    },
+    "black one-piece dress in size M, new, with free shipping": {
+        "query": "ワンピース", "price_min": None, "price_max": None, "categories": ["レディース"],
+        "brands": [], "item_conditions": ["new"], "shipping_payer": ["seller"], "sizes": ["M"],
+        "colors": ["black"], "sort_by": "", "sort_order": "",
+    },
+}
+SAMPLE_REQUESTS = list(CANNED_EXTRACTIONS)
+
+_USER_REQUEST_RE = re.compile(r"User Request:\n(.*?)\n", re.S)
+_ITEM_TABLE_HEADER = "Mercari search results, one item per line"
+
+
+def split_tokens(text: str) -> List[str]:
+    """Splits text into pseudo-tokens of about four characters (one per CJK character)."""
+    tokens, current = [], ""
+    for ch in text:
+        current += ch
+        if ord(ch) > 127 or len(current) >= 4:
+            tokens.append(current)
+            current = ""
+    if current:
+        tokens.append(current)
+    return tokens
+
+
+def malformed(text: str, rng: random.Random) -> str:
+    """What a model does when only the prompt asks for JSON: wraps it in prose, or breaks off."""
+    if rng.random() < 0.5:
+        return f"Sure! Here is the JSON you asked for:\n```json\n{text}\n```\nLet me know if you need anything else."
+    return "I found these parameters: " + text[: len(text) // 2]
+
+
+def canned_response(prompt: str, extractions: Dict[str, Dict[str, Any]]) -> str:
+    """The output the stand-in generates for a prompt."""
+    if _ITEM_TABLE_HEADER in prompt:
+        recommendations = []
+        table = prompt.split(_ITEM_TABLE_HEADER, 1)[1].splitlines()[1:]
+        for row in table:
+            columns = row.split(ITEM_TABLE_DELIMITER)
+            if len(columns) != 4:
+                break
+            item_id, price, condition, title = columns
+            recommendations.append(
+                {
+                    "item_name": title,
+                    "item_price": int(price),
+                    "item_condition": condition,
+                    "item_id": item_id,
+                    "reason": "Matches the requested item type and is in good condition.",
+                }
+            )
+            if len(recommendations) == 3:
+                break
+        return json.dumps({"recommendations": recommendations}, ensure_ascii=False)
+
+    match = _USER_REQUEST_RE.search(prompt)
+    user_request = match.group(1).strip() if match else ""
+    extraction = extractions.get(user_request) or {
+        "query": user_request, "price_min": None, "price_max": None, "categories": [],
+        "brands": [], "item_conditions": [], "shipping_payer": [], "sizes": [], "colors": [],
+        "sort_by": "", "sort_order": "",
+    }
+    return json.dumps(extraction, ensure_ascii=False, indent=2)
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Streams canned /api/generate responses; timing settings live on the server."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_chunk(self, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n"
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _send_json(self, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/api/tags":  # Health checks
+            self.send_error(404)
+            return
+        self._send_json({"models": [{"name": "llama3.2:latest"}]})
+
+    def do_POST(self):
+        if self.path not in ("/api/generate", "/api/embed"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path == "/api/embed":  # Character n-gram vectors instead of a model
+            texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            self._send_json({"model": body.get("model"), "embeddings": _EMBEDDER.encode(texts).tolist()})
+            return
+        with self.server.slots:  # Like OLLAMA_NUM_PARALLEL, further requests queue
+            try:
+                self._generate(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The client cancelled (e.g. a hedged request that lost)
+
+    def _generate(self, body: Dict[str, Any]) -> None:
+        server = self.server
+        start = time.perf_counter()
+        prompt = body.get("prompt", "")
+        prompt_tokens = estimate_tokens(prompt)
+        evaluated_tokens = prompt_tokens - self._cached_prefix_tokens(prompt)
+        prompt_eval_seconds = server.latency + evaluated_tokens / server.prompt_rate
+        if server.tail_fraction and random.random() < server.tail_fraction:
+            prompt_eval_seconds += server.tail_latency  # A straggler
+        time.sleep(prompt_eval_seconds)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        text = canned_response(prompt, server.extractions)
+        if "format" not in body and server.malformed_fraction and random.random() < server.malformed_fraction:
+            text = malformed(text, random)  # A JSON format or schema would have constrained the output
+        tokens = split_tokens(text)
+        num_predict = (body.get("options") or {}).get("num_predict")
+        done_reason = "stop"
+        if num_predict is not None and num_predict >= 0 and len(tokens) > num_predict:
+            tokens, done_reason = tokens[:num_predict], "length"
+        eval_start = time.perf_counter()
+        for index, token in enumerate(tokens):
+            if index == server.break_after_tokens:  # Dies mid-stream
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            time.sleep(1.0 / server.token_rate)
+            self._send_chunk({"model": body.get("model"), "response": token, "done": False})
+        now = time.perf_counter()
+        self._send_chunk(
+            {
+                "model": body.get("model"),
+                "response": "",
+                "done": True,
+                "done_reason": done_reason,
+                "context": list(range(prompt_tokens + len(tokens))),
+                "total_duration": int((now - start) * 1e9),
+                "prompt_eval_count": evaluated_tokens,
+                "prompt_eval_duration": int(prompt_eval_seconds * 1e9),
+                "eval_count": len(tokens),
+                "eval_duration": int((now - eval_start) * 1e9),
+            }
+        )
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _cached_prefix_tokens(self, prompt: str) -> int:
+        """Tokens of the longest prefix shared with a recent prompt; remembers this prompt."""
+        server = self.server
+        with server.prompt_cache_lock:
+            prefix = max((os.path.commonprefix([prompt, cached]) for cached in server.prompt_cache), key=len, default="")
+            if server.prompt_cache.maxlen:
+                server.prompt_cache.append(prompt)
+        # Ollama always evaluates at least the last prompt token
+        return min(estimate_tokens(prefix), max(0, estimate_tokens(prompt) - 1))
+
+
+def make_fake_ollama_server(
+    port: int = 0,
+    token_rate: float = 40.0,
+    prompt_rate: float = 1000.0,
+    latency: float = 0.1,
+    extractions: Optional[Dict[str, Dict[str, Any]]] = None,
+    parallel: int = 1,
+    tail_fraction: float = 0.0,
+    tail_latency: float = 0.0,
+    cache_slots: Optional[int] = None,
+    malformed_fraction: float = 0.0,
+    break_after_tokens: Optional[int] = None,
+) -> ThreadingHTTPServer:
+    """
+    Creates (but does not start) a fake Ollama server on 127.0.0.1.
+
+    Args:
+        port: TCP port, 0 for any free port.
+        token_rate: Generated tokens per second (per request).
+        prompt_rate: Prompt tokens evaluated per second.
+        latency: Fixed seconds before prompt evaluation (model scheduling).
+        extractions: Canned extraction outputs by user request (defaults to CANNED_EXTRACTIONS).
+        parallel: Generations served at once; further requests wait (Ollama's OLLAMA_NUM_PARALLEL).
+        tail_fraction: Share of requests delayed by tail_latency extra seconds (stragglers).
+        tail_latency: Extra delay of a straggler before its first token.
+        cache_slots: Recent prompts kept for prefix reuse (defaults to parallel; 0 disables it).
+        malformed_fraction: Share of responses to requests without `format` that are not bare JSON.
+        break_after_tokens: Drop the connection after streaming this many tokens (None streams everything).
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.token_rate = token_rate
+    server.prompt_rate = prompt_rate
+    server.latency = latency
+    server.extractions = extractions if extractions is not None else CANNED_EXTRACTIONS
+    server.slots = threading.BoundedSemaphore(parallel)
+    server.tail_fraction = tail_fraction
+    server.tail_latency = tail_latency
+    server.prompt_cache = deque(maxlen=parallel if cache_slots is None else cache_slots)
+    server.prompt_cache_lock = threading.Lock()
+    server.malformed_fraction = malformed_fraction
+    server.break_after_tokens = break_after_tokens
+    return server
+
+
+def start_fake_ollama_process(**options: Any) -> Tuple[subprocess.Popen, str]:
+    """
+    Runs the fake Ollama server in a child process, so it does not compete
+    with the measured pipeline for the GIL.
+
+    Returns:
+        (process, base_url); terminate the process when done.
+    """
+    args = [sys.executable, "-m", "benchmarks.stand_ins"]
+    for name, value in options.items():
+        if value is not None:
+            args += [f"--{name.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, text=True)
+    port = int(process.stdout.readline().strip())
+    return process, f"http://127.0.0.1:{port}"
+
+
+# --- Mercari ---
+
+_TITLE_EXTRAS = ["本体", "美品", "ケース", "セット", "まとめ売り", "ジャンク", "限定", "箱あり", "中古", "新品"]
+
+
+@dataclass
+class FakeSearchResultItem:
+    """The fields of mercapi's SearchResultItem that the pipeline reads."""
+
+    id_: str
+    name: str
+    price: int
+    item_condition_id: int
+    shipping_payer_id: int
+    category_id: int
+    seller_id: str = "seller"
+    status: str = "ITEM_STATUS_ON_SALE"
+    thumbnails: List[str] = field(default_factory=list)
+    item_type: str = "ITEM_TYPE_MERCARI"
+    shipping_method_id: int = 0
+    is_no_price: bool = False
+
+
+@dataclass
+class FakeSearchMeta:
+    next_page_token: str
+    prev_page_token: str
+    num_found: int
+
+
+class FakeSearchResults:
+    def __init__(self, mercapi: "FakeMercapi", search_kwargs: Dict[str, Any], page: int) -> None:
+        self._mercapi = mercapi
+        self._search_kwargs = search_kwargs
+        self.page = page
+        self.items = mercapi.make_page(search_kwargs, page)
+        has_next = page + 1 < mercapi.pages
+        self.meta = FakeSearchMeta(
+            next_page_token=f"page{page + 1}" if has_next else "",
+            prev_page_token=f"page{page - 1}" if page else "",
+            num_found=mercapi.pages * mercapi.page_size,
+        )
+
+    async def next_page(self) -> "FakeSearchResults":
+        await self._mercapi.wait_page()
+        return FakeSearchResults(self._mercapi, self._search_kwargs, self.page + 1)
+
+
+class FakeMercapi:
+    """
+    In-memory stand-in for mercapi.Mercapi.
+
+    Every search returns `pages` pages of `page_size` items after page_latency
+    seconds each. Titles mix the query words with accessory words, prices and
+    conditions vary, and the same query always yields the same items. Price,
+    category, condition and shipping payer filters are honoured.
+    """
+
+    def __init__(self, page_latency: float = 0.3, page_size: int = 120, pages: int = 5) -> None:
+        self.page_latency = page_latency
+        self.page_size = page_size
+        self.pages = pages
+        self.requests = 0
+
+    async def wait_page(self) -> None:
+        self.requests += 1
+        await asyncio.sleep(self.page_latency)
+
+    def make_page(self, search_kwargs: Dict[str, Any], page: int) -> List[FakeSearchResultItem]:
+        query = search_kwargs.get("query") or "item"
+        seed = hashlib.sha256(f"{query}:{page}".encode("utf-8")).digest()
+        rng = random.Random(seed)
+        price_min = search_kwargs.get("price_min") or 300
+        price_max = search_kwargs.get("price_max") or 50_000
+        categories = search_kwargs.get("categories") or [0]
+        # Like the API, pushed-down conditions and shipping payers only return matching items
+        condition_ids = search_kwargs.get("item_conditions") or range(1, 7)
+        shipping_payer_ids = search_kwargs.get("shipping_payer") or [1, 2]
+        return [
+            FakeSearchResultItem(
+                id_=f"m{seed.hex()[:6]}{page:02d}{index:04d}",
+                name=f"{query} {' '.join(rng.sample(_TITLE_EXTRAS, rng.randint(1, 3)))}",
+                price=rng.randint(price_min, max(price_min, price_max)),
+                item_condition_id=rng.choice(condition_ids),
+                shipping_payer_id=rng.choice(shipping_payer_ids),
+                category_id=rng.choice(categories),
+            )
+            for index in range(self.page_size)
+        ]
+
+    async def search(self, query: str = "", **search_kwargs: Any) -> FakeSearchResults:
+        await self.wait_page()
+        return FakeSearchResults(self, {"query": query, **search_kwargs}, 0)
+
+
+class FakeListingFeed(FakeMercapi):
+    """
+    FakeMercapi whose listings keep arriving, for watch mode.
+
+    Every query starts with initial_items listings and gains new ones at its
+    own rate: max_rate listings per second times the cube of a per-query
+    number in [0, 1), so most searches are quiet and a few are busy. Results
+    are newest first, so a poll sees the listings added since the last one.
+    """
+
+    def __init__(
+        self,
+        page_latency: float = 0.05,
+        page_size: int = 120,
+        pages: int = 5,
+        max_rate: float = 0.5,
+        initial_items: int = 600,
+        clock=time.monotonic,
+    ) -> None:
+        super().__init__(page_latency, page_size, pages)
+        self.max_rate = max_rate
+        self.initial_items = initial_items
+        self.clock = clock
+        self.started_at = clock()
+
+    def rate(self, query: str) -> float:
+        """New listings per second for query."""
+        share = int.from_bytes(hashlib.sha256(query.encode("utf-8")).digest()[:4], "little") / 2**32
+        return self.max_rate * share**3
+
+    def listing_count(self, query: str) -> int:
+        return self.initial_items + int(self.rate(query) * (self.clock() - self.started_at))
+
+    def make_page(self, search_kwargs: Dict[str, Any], page: int) -> List[FakeSearchResultItem]:
+        query = search_kwargs.get("query") or "item"
+        prefix = hashlib.sha256(query.encode("utf-8")).hexdigest()[:6]
+        price_min = search_kwargs.get("price_min") or 300
+        price_span = max(1, (search_kwargs.get("price_max") or 50_000) - price_min)
+        condition_ids = search_kwargs.get("item_conditions") or range(1, 7)
+        shipping_payer_ids = search_kwargs.get("shipping_payer") or [1, 2]
+        newest = self.listing_count(query) - 1 - page * self.page_size
+        items = []
+        for sequence in range(newest, max(-1, newest - self.page_size), -1):
+            value = int.from_bytes(hashlib.blake2b(f"{query}:{sequence}".encode("utf-8"), digest_size=8).digest(), "little")
+            items.append(
+                FakeSearchResultItem(
+                    id_=f"m{prefix}{sequence:08d}",
+                    name=f"{query} {_TITLE_EXTRAS[value % len(_TITLE_EXTRAS)]}",
+                    price=price_min + value % price_span,
+                    item_condition_id=condition_ids[(value >> 16) % len(condition_ids)],
+                    shipping_payer_id=shipping_payer_ids[(value >> 24) % len(shipping_payer_ids)],
+                    category_id=0,
+                )
+            )
+        return items
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the fake Ollama /api/generate endpoint.")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--token-rate", type=float, default=40.0)
+    parser.add_argument("--prompt-rate", type=float, default=1000.0)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--parallel", type=int, default=1)
+    parser.add_argument("--tail-fraction", type=float, default=0.0)
+    parser.add_argument("--tail-latency", type=float, default=0.0)
+    parser.add_argument("--cache-slots", type=int, help="Prompts kept for prefix reuse (default: --parallel).")
+    parser.add_argument("--malformed-fraction", type=float, default=0.0)
+    parser.add_argument("--break-after-tokens", type=int, help="Drop every stream after this many tokens.")
+    parser.add_argument(
+        "--responses", help="JSON file mapping user requests to canned extraction outputs."
+    )
+    args = parser.parse_args()
+
+    extractions = None
+    if args.responses:
+        with open(args.responses, "r", encoding="utf-8") as f:
+            extractions = json.load(f)
+    server = make_fake_ollama_server(
+        args.port,
+        args.token_rate,
+        args.prompt_rate,
+        args.latency,
+        extractions,
+        args.parallel,
+        args.tail_fraction,
+        args.tail_latency,
+        args.cache_slots,
+        args.malformed_fraction,
+        args.break_after_tokens,
+    )
+    print(server.server_address[1], flush=True)  # The parent reads the port from here
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -1,12 +1,37 @@
+import argparse
+import asyncio
+import contextlib
 import json
 import os
 import sys
 
-from internal.api_client.mercari_api_client import simulate_mercari_search
+from internal.api_client.mercari_api_client import search_mercari_items
 from internal.llm.llm_parameter_extraction import (
     extract_search_parameters_with_llm_ollama,
 )
-from internal.utils.constants import ITEM_COUNT_FOR_RECOMMENDATION
+from internal.pipeline.batch_runner import BatchRunner, BatchStages
+from internal.pipeline.http_service import ShopperService
+from internal.parameter_matching.facets_config import config
+from internal.parameter_matching.fast_path_extractor import fast_path_extractor
+from internal.pipeline.speculative_search import SpeculativeSearch
+from internal.pipeline.watch_runner import WatchRunner, WatchStages, WatchStore
+from internal.ranking.item_ranker import item_ranker
+from internal.ranking.listing_deduplicator import listing_deduplicator
+from internal.utils.constants import (
+    BATCH_LLM_CONCURRENCY,
+    BATCH_SEARCH_CONCURRENCY,
+    ITEM_COUNT_FOR_RECOMMENDATION,
+    LISTING_DEDUP_ENABLED,
+    PRE_RANKING_CANDIDATE_COUNT,
+    SERVICE_HOST,
+    SERVICE_LLM_CONCURRENCY,
+    SERVICE_PORT,
+    SERVICE_SEARCH_CONCURRENCY,
+    WATCH_LLM_CONCURRENCY,
+    WATCH_SEARCH_CONCURRENCY,
+    WATCH_STATE_PATH,
+)
+from internal.utils.telemetry import telemetry
 
 
 def get_user_search_request():
@@ -21,9 +46,29 @@ def display_user_request(user_request):
     print(f'\n--- User Request: "{user_request}" ---')
 
 
-def handle_parameter_extraction(user_request):
-    """Extracts search parameters using LLM. Handles JSON parsing errors."""
-    extracted_params_json = extract_search_parameters_with_llm_ollama(user_request)
+def handle_parameter_extraction(user_request, on_field=None):
+    """Extracts search parameters using LLM. Handles JSON parsing errors.
+    Simple requests are handled by the rule-based fast path without calling the LLM.
+    on_field, if given, receives each parameter as soon as the LLM has streamed it."""
+    with telemetry.span("extraction"):
+        return _extract_parameters(user_request, on_field)
+
+
+def _extract_parameters(user_request, on_field):
+    with telemetry.span("fast_path") as span:
+        fast_path_result = fast_path_extractor.extract(user_request)
+        span.set(coverage=round(fast_path_result.coverage, 3), confident=fast_path_result.confident)
+    telemetry.count(
+        "fast_path_total", result="served" if fast_path_result.confident else "fallback"
+    )
+    if fast_path_result.confident:
+        print("Parameters extracted by the fast path (no LLM call):")
+        print(json.dumps(fast_path_result.params, indent=2, ensure_ascii=False))
+        return fast_path_result.params
+
+    extracted_params_json = extract_search_parameters_with_llm_ollama(
+        user_request, on_field=on_field
+    )
     if not extracted_params_json:
         print("Parameter extraction failed.")
         return None
@@ -37,10 +82,31 @@ def handle_parameter_extraction(user_request):
         return None
 
 
-def handle_mercari_search_simulation(extracted_params):
-    """Simulates Mercari search using extracted parameters."""
+def handle_mercari_search_simulation(extracted_params, speculative_search=None):
+    """Simulates Mercari search using extracted parameters.
+    Fetches further result pages only while fewer than PRE_RANKING_CANDIDATE_COUNT
+    items pass the filters. A speculative search started during
+    extraction is reused when it was run with the same parameters."""
     print("Simulating Mercari search...")
-    mercari_search_result = simulate_mercari_search(extracted_params)
+    with telemetry.span("search") as span:
+        mercari_search_result = search_mercari_items(
+            extracted_params, PRE_RANKING_CANDIDATE_COUNT, speculative_search
+        )
+        if mercari_search_result:
+            span.set(
+                items=len(mercari_search_result.items),
+                pages=mercari_search_result.pages_fetched,
+                stop_reason=mercari_search_result.stop_reason,
+                filters=",".join(
+                    f"{name}:{placement}"
+                    for name, placement in mercari_search_result.filter_placements.items()
+                ),
+            )
+        if speculative_search is not None:
+            span.set(
+                speculative=speculative_search.outcome,
+                speculative_restarts=speculative_search.restarts,
+            )
     if not mercari_search_result:
         print("\n--- Mercari Simulation Status: Failure ---")
         print("Search failed, but parameter extraction was successful.")
@@ -48,15 +114,51 @@ def handle_mercari_search_simulation(extracted_params):
     return mercari_search_result
 
 
-def handle_recommendation_generation(user_request, mercari_search_result):
-    """Generates item recommendations using LLM and search results."""
+def rank_items_for_recommendation(user_request, items, extracted_params=None):
+    """Pre-ranks the search results locally and returns the best
+    ITEM_COUNT_FOR_RECOMMENDATION items for the recommendation prompt."""
+    extracted_params = extracted_params or {}
+    query = extracted_params.get("query") or user_request
+    brand_names = (
+        config.brand_matcher.names_for_ids(extracted_params["brands"])
+        if extracted_params.get("brands")
+        else ()
+    )
+    with telemetry.span("ranking", candidates=len(items)):
+        return item_ranker.rank(items, query, brand_names, ITEM_COUNT_FOR_RECOMMENDATION)
+
+
+def handle_recommendation_generation(
+    user_request, mercari_search_result, extracted_params=None
+):
+    """Generates item recommendations using LLM and search results.
+    Near-identical listings are collapsed first (see deduplicate_items), and only the best
+    pre-ranked items (see rank_items_for_recommendation) are sent to the LLM."""
     if not mercari_search_result or not mercari_search_result.items:
         return None  # No recommendations if no search results
 
-    items_for_recommendation = (
-        mercari_search_result.items[:ITEM_COUNT_FOR_RECOMMENDATION]
-        if len(mercari_search_result.items) > ITEM_COUNT_FOR_RECOMMENDATION
-        else mercari_search_result.items
+    with telemetry.span("recommendation"):
+        return _generate_recommendations(
+            user_request, mercari_search_result, extracted_params
+        )
+
+
+def deduplicate_items(items):
+    """Keeps one item per cluster of near-identical listings (see ListingDeduplicator).
+    Returns the kept items and the cluster size of each by item ID."""
+    with telemetry.span("dedup", items=len(items)) as span:
+        clusters = listing_deduplicator.cluster(items)
+        span.set(clusters=len(clusters.representatives))
+    telemetry.count("listing_duplicates_total", clusters.duplicates)
+    return clusters.select(items), clusters.size_by_id(items)
+
+
+def _generate_recommendations(user_request, mercari_search_result, extracted_params):
+    items, cluster_sizes = mercari_search_result.items, {}
+    if LISTING_DEDUP_ENABLED:
+        items, cluster_sizes = deduplicate_items(items)
+    items_for_recommendation = rank_items_for_recommendation(
+        user_request, items, extracted_params
     )
     recommendation_params_json = extract_search_parameters_with_llm_ollama(
         user_request, items_for_recommendation
@@ -66,10 +168,14 @@ def handle_recommendation_generation(user_request, mercari_search_result):
 
     try:
         recommendation_params = json.loads(recommendation_params_json)
-        return recommendation_params
     except json.JSONDecodeError as e:
         print(f"Error parsing Recommendation JSON: {e}")
         return None
+    for recommendation in recommendation_params.get("recommendations", []):
+        similar_listings = cluster_sizes.get(recommendation.get("item_id"), 1) - 1
+        if similar_listings:
+            recommendation["similar_listings"] = similar_listings
+    return recommendation_params
 
 
 def display_recommendations(recommendation_params):
@@ -87,6 +193,8 @@ def display_recommendations(recommendation_params):
                 f"   Price: ¥{recommendation['item_price']:,} (Condition: {recommendation['item_condition']})"
             )
             print(f"   Reason: {recommendation['reason']}")
+            if recommendation.get("similar_listings"):
+                print(f"   Similar listings: {recommendation['similar_listings']} more")
             print(f"   [View on Mercari]({item_url})\n")
     else:
         print("No recommendations found in LLM response.")
@@ -103,7 +211,8 @@ def display_mercari_simulation_status(mercari_search_result):
         print("\n--- Mercari Simulation Status: Failure ---")
 
 
-if __name__ == "__main__":
+def run_interactive():
+    """Runs the interactive request loop until the user types 'exit'."""
     print("Welcome to Mercari Shopper!")
     while True:
         user_request = get_user_search_request()
@@ -113,14 +222,205 @@ if __name__ == "__main__":
 
         display_user_request(user_request)
 
-        extracted_params = handle_parameter_extraction(user_request)
+        # Start searching as soon as the query and prices have streamed
+        speculative_search = SpeculativeSearch(max_items=PRE_RANKING_CANDIDATE_COUNT)
+        extracted_params = handle_parameter_extraction(
+            user_request, on_field=speculative_search.on_field
+        )
         if not extracted_params:
+            speculative_search.cancel()
             continue  # Skip to next iteration if parameter extraction failed
 
-        mercari_search_result = handle_mercari_search_simulation(extracted_params)
+        mercari_search_result = handle_mercari_search_simulation(
+            extracted_params, speculative_search
+        )
 
         recommendation_params = handle_recommendation_generation(
-            user_request, mercari_search_result
+            user_request, mercari_search_result, extracted_params
         )
         display_recommendations(recommendation_params)
         display_mercari_simulation_status(mercari_search_result)
+
+
+def run_batch(input_path, output_path, llm_concurrency, search_concurrency):
+    """Processes a JSONL file of requests concurrently and writes JSONL results.
+    Per-request console output is suppressed; progress is printed to stderr."""
+    runner = BatchRunner(
+        BatchStages(
+            extract=handle_parameter_extraction,
+            search=handle_mercari_search_simulation,
+            recommend=handle_recommendation_generation,
+        ),
+        llm_concurrency=llm_concurrency,
+        search_concurrency=search_concurrency,
+    )
+    with open(input_path, "r", encoding="utf-8") as input_file, open(
+        output_path, "w", encoding="utf-8"
+    ) as output_file, open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            asyncio.run(runner.run(input_file, output_file))
+    fast_path_stats = fast_path_extractor.stats()
+    print(
+        f"Processed {runner.completed} requests ({runner.failed} failed), results in {output_path}",
+        file=sys.stderr,
+    )
+    print(
+        f"Fast path served {fast_path_stats['served']} of {fast_path_stats['attempts']} extractions"
+        f" ({fast_path_stats['fast_path_share']:.0%}) without the LLM",
+        file=sys.stderr,
+    )
+
+
+def run_service(host, port, llm_concurrency, search_concurrency):
+    """Serves the pipeline over HTTP (see ShopperService) until interrupted.
+    Per-request console output is suppressed."""
+    service = ShopperService(
+        BatchStages(
+            extract=handle_parameter_extraction,
+            search=handle_mercari_search_simulation,
+            recommend=handle_recommendation_generation,
+        ),
+        llm_concurrency=llm_concurrency,
+        search_concurrency=search_concurrency,
+    )
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            asyncio.run(service.serve(host, port))
+        except KeyboardInterrupt:
+            pass
+
+
+def run_watch(input_path, output_path, state_path, llm_concurrency, search_concurrency):
+    """Watches the saved searches in a JSONL file (added to those in the state file)
+    until interrupted, appending only new listings and their recommendations as JSONL.
+    Per-request console output is suppressed; progress is printed to stderr."""
+    runner = WatchRunner(
+        WatchStages(
+            extract=handle_parameter_extraction,
+            recommend=handle_recommendation_generation,
+        ),
+        store=WatchStore(state_path),
+        llm_concurrency=llm_concurrency,
+        search_concurrency=search_concurrency,
+    )
+    runner.load()
+    with open(input_path, "r", encoding="utf-8") as input_file:
+        runner.add_requests(input_file)
+    print(
+        f"Watching {len(runner.watches)} saved searches, new listings in {output_path} (Ctrl+C to stop)",
+        file=sys.stderr,
+    )
+    with open(output_path, "a", encoding="utf-8") as output_file, open(
+        os.devnull, "w"
+    ) as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            asyncio.run(runner.run(output_file))
+        except KeyboardInterrupt:
+            pass
+    print(
+        f"Polled {runner.polls} times ({runner.errors} failed), found {runner.new_items} new listings",
+        file=sys.stderr,
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Search Mercari Japan using natural language requests."
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE.jsonl",
+        help="Process the requests in a JSONL file instead of prompting interactively.",
+    )
+    parser.add_argument(
+        "--watch",
+        metavar="FILE.jsonl",
+        help="Keep polling the requests in a JSONL file as saved searches and report only new listings.",
+    )
+    parser.add_argument(
+        "--watch-state",
+        metavar="FILE.npz",
+        default=WATCH_STATE_PATH,
+        help=f"Saved searches and seen listings of --watch (default: {WATCH_STATE_PATH}).",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="FILE.jsonl",
+        help="Batch results / watch report file (default: <input file>.results.jsonl / .watch.jsonl).",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Serve the pipeline over HTTP (/extract, /search, /recommend, /shop) instead of prompting.",
+    )
+    parser.add_argument(
+        "--host", default=SERVICE_HOST, help="Address to listen on with --serve."
+    )
+    parser.add_argument(
+        "--port", type=int, default=SERVICE_PORT, help="Port to listen on with --serve."
+    )
+    parser.add_argument(
+        "--llm-concurrency",
+        type=int,
+        help=f"Maximum concurrent LLM calls in batch/service/watch mode (default: {BATCH_LLM_CONCURRENCY}/{SERVICE_LLM_CONCURRENCY}/{WATCH_LLM_CONCURRENCY}).",
+    )
+    parser.add_argument(
+        "--search-concurrency",
+        type=int,
+        help=f"Maximum concurrent Mercari searches in batch/service/watch mode (default: {BATCH_SEARCH_CONCURRENCY}/{SERVICE_SEARCH_CONCURRENCY}/{WATCH_SEARCH_CONCURRENCY}).",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics at http://127.0.0.1:PORT/metrics (enables telemetry).",
+    )
+    parser.add_argument(
+        "--log-json",
+        metavar="FILE",
+        help="Write spans and diagnostics as JSON lines to FILE ('-' for stderr; enables telemetry).",
+    )
+    return parser.parse_args(argv)
+
+
+def configure_telemetry(metrics_port=None, log_json=None):
+    """Enables telemetry if metrics or JSON logs were requested."""
+    if metrics_port is None and not log_json:
+        return
+    log_file = None
+    if log_json:
+        log_file = sys.stderr if log_json == "-" else open(log_json, "a", encoding="utf-8")
+    telemetry.configure(enabled=True, log_file=log_file)
+    if metrics_port is not None:
+        telemetry.start_http_server(metrics_port)
+        print(f"Metrics at http://127.0.0.1:{metrics_port}/metrics", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    configure_telemetry(args.metrics_port, args.log_json)
+    if args.batch:
+        output_path = args.output or f"{os.path.splitext(args.batch)[0]}.results.jsonl"
+        run_batch(
+            args.batch,
+            output_path,
+            args.llm_concurrency or BATCH_LLM_CONCURRENCY,
+            args.search_concurrency or BATCH_SEARCH_CONCURRENCY,
+        )
+    elif args.watch:
+        output_path = args.output or f"{os.path.splitext(args.watch)[0]}.watch.jsonl"
+        run_watch(
+            args.watch,
+            output_path,
+            args.watch_state,
+            args.llm_concurrency or WATCH_LLM_CONCURRENCY,
+            args.search_concurrency or WATCH_SEARCH_CONCURRENCY,
+        )
+    elif args.serve:
+        run_service(
+            args.host,
+            args.port,
+            args.llm_concurrency or SERVICE_LLM_CONCURRENCY,
+            args.search_concurrency or SERVICE_SEARCH_CONCURRENCY,
+        )
+    else:
+        run_interactive()
@@ -0,0 +1,270 @@
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union, overload
+
+# array typecodes: prices as signed 64-bit ints, condition and shipping payer IDs as signed bytes (0 = unknown)
+_PRICE_TYPECODE = "q"
+_CONDITION_TYPECODE = "b"
+_SHIPPING_PAYER_TYPECODE = "b"
+_COLUMNS = ("id_", "name", "price", "item_condition_id", "shipping_payer_id")
+
+
+def _intern(value: Any) -> str:
+    return sys.intern(str(value)) if value is not None else ""
+
+
+class CompactItem:
+    """
+    One search result with only the fields the pipeline reads.
+
+    Has the same attribute names as mercapi's SearchResultItem (id_, name,
+    price, item_condition_id, shipping_payer_id), so it can be used wherever a result item is
+    expected, at a fraction of the memory.
+    """
+
+    __slots__ = _COLUMNS
+
+    def __init__(
+        self, id_: str, name: str, price: int, item_condition_id: int, shipping_payer_id: int = 0
+    ) -> None:
+        self.id_ = id_
+        self.name = name
+        self.price = price
+        self.item_condition_id = item_condition_id
+        self.shipping_payer_id = shipping_payer_id
+
+    @classmethod
+    def from_item(cls, item: Any) -> "CompactItem":
+        """Copies the fields of a mercapi result item (or any object with the same attributes)."""
+        if isinstance(item, cls):
+            return item
+        return cls(
+            _intern(item.id_),
+            _intern(item.name),
+            int(item.price or 0),
+            int(item.item_condition_id or 0),
+            int(getattr(item, "shipping_payer_id", 0) or 0),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {column: getattr(self, column) for column in _COLUMNS}
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, CompactItem):
+            return NotImplemented
+        return all(getattr(self, column) == getattr(other, column) for column in _COLUMNS)
+
+    def __repr__(self) -> str:
+        return (
+            f"CompactItem(id_={self.id_!r}, name={self.name!r}, price={self.price},"
+            f" item_condition_id={self.item_condition_id}, shipping_payer_id={self.shipping_payer_id})"
+        )
+
+
+class ItemStore(Sequence):
+    """
+    Search results as columns: interned ID and title strings, and prices,
+    condition IDs and shipping payer IDs in typed arrays (8, 1 and 1 bytes
+    per item).
+
+    Built once at the client boundary (see CompactSearchResults), so the
+    search cache, the speculative search and every session hold columns
+    instead of mercapi objects. Indexing returns a CompactItem (created on
+    access), slicing and select() return another ItemStore, and the arrays
+    can be wrapped by NumPy without copying (see ItemColumns.from_items and
+    ItemFilter.mask). Pickling copies the arrays as raw bytes;
+    to_columns() / from_columns() give the JSON form.
+    """
+
+    __slots__ = ("ids", "names", "prices", "condition_ids", "shipping_payer_ids")
+
+    def __init__(
+        self,
+        ids: Optional[List[str]] = None,
+        names: Optional[List[str]] = None,
+        prices: Optional[Iterable[int]] = None,
+        condition_ids: Optional[Iterable[int]] = None,
+        shipping_payer_ids: Optional[Iterable[int]] = None,
+    ) -> None:
+        self.ids: List[str] = ids if ids is not None else []
+        self.names: List[str] = names if names is not None else []
+        self.prices = array(_PRICE_TYPECODE, prices if prices is not None else ())
+        self.condition_ids = array(_CONDITION_TYPECODE, condition_ids if condition_ids is not None else ())
+        if shipping_payer_ids is None:
+            shipping_payer_ids = bytes(len(self.ids))  # Unknown
+        self.shipping_payer_ids = array(_SHIPPING_PAYER_TYPECODE, shipping_payer_ids)
+        if not (
+            len(self.ids) == len(self.names) == len(self.prices)
+            == len(self.condition_ids) == len(self.shipping_payer_ids)
+        ):
+            raise ValueError("ItemStore columns must have the same length.")
+
+    @classmethod
+    def from_items(cls, items: Iterable[Any]) -> "ItemStore":
+        """Builds a store from mercapi result items (or CompactItems, or another store)."""
+        store = cls()
+        store.extend(items)
+        return store
+
+    def append(self, item: Any) -> None:
+        self.ids.append(_intern(item.id_))
+        self.names.append(_intern(item.name))
+        self.prices.append(int(item.price or 0))
+        self.condition_ids.append(int(item.item_condition_id or 0))
+        self.shipping_payer_ids.append(int(getattr(item, "shipping_payer_id", 0) or 0))
+
+    def extend(self, items: Iterable[Any]) -> None:
+        if isinstance(items, ItemStore):
+            self.ids.extend(items.ids)
+            self.names.extend(items.names)
+            self.prices.extend(items.prices)
+            self.condition_ids.extend(items.condition_ids)
+            self.shipping_payer_ids.extend(items.shipping_payer_ids)
+            return
+        for item in items:
+            self.append(item)
+
+    def copy(self) -> "ItemStore":
+        return ItemStore(
+            list(self.ids), list(self.names), self.prices, self.condition_ids, self.shipping_payer_ids
+        )
+
+    def select(self, indices: Iterable[int]) -> "ItemStore":
+        """A new store with the items at indices, in that order (e.g. a filter or a ranking)."""
+        indices = [int(index) for index in indices]
+        return ItemStore(
+            [self.ids[index] for index in indices],
+            [self.names[index] for index in indices],
+            [self.prices[index] for index in indices],
+            [self.condition_ids[index] for index in indices],
+            [self.shipping_payer_ids[index] for index in indices],
+        )
+
+    def filter(self, predicate) -> "ItemStore":
+        """A new store with the items for which predicate(item) is true."""
+        return self.select(index for index, item in enumerate(self) if predicate(item))
+
+    # --- Sequence ---
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @overload
+    def __getitem__(self, index: int) -> CompactItem: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "ItemStore": ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[CompactItem, "ItemStore"]:
+        if isinstance(index, slice):
+            return ItemStore(*(column[index] for column in self._columns()))
+        return CompactItem(*(column[index] for column in self._columns()))
+
+    def __iter__(self) -> Iterator[CompactItem]:
+        for values in zip(*self._columns()):
+            yield CompactItem(*values)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, ItemStore):
+            return NotImplemented
+        return self._columns() == other._columns()
+
+    def __repr__(self) -> str:
+        return f"ItemStore({len(self)} items)"
+
+    def _columns(self) -> tuple:
+        return (self.ids, self.names, self.prices, self.condition_ids, self.shipping_payer_ids)
+
+    # --- Serialisation ---
+
+    def to_columns(self) -> Dict[str, list]:
+        """The store as JSON-ready columns: {"id_": [...], "name": [...], "price": [...], ...}."""
+        return {
+            "id_": self.ids,
+            "name": self.names,
+            "price": self.prices.tolist(),
+            "item_condition_id": self.condition_ids.tolist(),
+            "shipping_payer_id": self.shipping_payer_ids.tolist(),
+        }
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, list]) -> "ItemStore":
+        """Inverse of to_columns()."""
+        return cls(
+            [_intern(value) for value in columns["id_"]],
+            [_intern(value) for value in columns["name"]],
+            columns["price"],
+            columns["item_condition_id"],
+            columns.get("shipping_payer_id"),
+        )
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """One dict per item (e.g. for JSONL output)."""
+        return [dict(zip(_COLUMNS, values)) for values in zip(*self._columns())]
+
+    def __getstate__(self):
+        return (
+            self.ids,
+            self.names,
+            self.prices.tobytes(),
+            self.condition_ids.tobytes(),
+            self.shipping_payer_ids.tobytes(),
+        )
+
+    def __setstate__(self, state) -> None:
+        ids, names, prices, condition_ids, shipping_payer_ids = state
+        self.ids = [sys.intern(value) for value in ids]
+        self.names = [sys.intern(value) for value in names]
+        self.prices = array(_PRICE_TYPECODE)
+        self.prices.frombytes(prices)
+        self.condition_ids = array(_CONDITION_TYPECODE)
+        self.condition_ids.frombytes(condition_ids)
+        self.shipping_payer_ids = array(_SHIPPING_PAYER_TYPECODE)
+        self.shipping_payer_ids.frombytes(shipping_payer_ids)
+
+
+class CompactSearchResults:
+    """
+    One result page with its items converted to an ItemStore.
+
+    Wraps mercapi's SearchResults (or a stand-in): the mercapi item objects
+    are dropped as soon as the page arrives, and only the request needed for
+    next_page() is kept.
+    """
+
+    __slots__ = ("items", "meta", "_results")
+
+    def __init__(self, items: ItemStore, meta: Any, results: Any = None) -> None:
+        self.items = items
+        self.meta = meta
+        self._results = results
+
+    @classmethod
+    def from_mercapi(cls, results: Any) -> "CompactSearchResults":
+        items = ItemStore.from_items(results.items)
+        results.items = []  # Only the request and meta are needed for the next page
+        return cls(items, results.meta, results)
+
+    async def next_page(self) -> "CompactSearchResults":
+        return CompactSearchResults.from_mercapi(await self._results.next_page())
+
+
+if __name__ == "__main__":
+    import pickle
+    from dataclasses import dataclass
+
+    @dataclass
+    class Item:
+        id_: str
+        name: str
+        price: int
+        item_condition_id: int
+        shipping_payer_id: int
+
+    store = ItemStore.from_items(
+        [Item("m1", "Nintendo Switch Lite 本体", 14800, 3, 2), Item("m2", "Switch Lite ケース", 900, 1, 1)]
+    )
+    print(store, list(store))
+    print("Cheaper than 10,000 yen:", list(store.filter(lambda item: item.price < 10_000)))
+    print("Columns:", store.to_columns())
+    print("Pickle round trip:", pickle.loads(pickle.dumps(store)) == store, len(pickle.dumps(store)), "bytes")
@@ -1,44 +1,47 @@
-import asyncio
-
-from mercapi import Mercapi
+from internal.api_client.search_engine import search_engine
+from internal.utils.telemetry import telemetry
 
 
 def simulate_mercari_search(search_params):
-    """Simulates a Mercari search using mercapi library and returns raw search results.
+    """Simulates a Mercari search using mercapi library and returns the first result page.
+
+    The search runs on the shared MercariSearchEngine, which keeps one event loop
+    and one Mercapi client (with warm connections) for the whole process. Async
+    callers should await search_engine.search(search_params) instead.
+
     Args:
         search_params: A dictionary containing search parameters.
     Returns:
-        A list of Mercari items as search results.
+        CompactSearchResults whose `items` is an ItemStore, or None if the search failed.
     """
+    try:
+        return search_engine.search_sync(search_params)
 
-    mercari_params = {}
-    mercari_params["query"] = search_params.get("query", "")
-    mercari_params["price_min"] = search_params.get("price_min")
-    mercari_params["price_max"] = search_params.get("price_max")
+    except Exception as e:
+        telemetry.event("error", "search_failed", f"Error during mercapi search in mercari_api_client: {e}")
+        return None
 
-    category_ids = search_params.get("categories", [])
-    mercari_params["categories"] = category_ids
 
-    mercari_params["brands"] = search_params.get("brands", [])
-    mercari_params["item_conditions"] = search_params.get("item_conditions", [])
-    mercari_params["shipping_payer"] = search_params.get("shipping_payer", [])
+def search_mercari_items(search_params, max_items, speculative=None):
+    """Searches Mercari page by page until max_items items pass the client-side filters.
 
+    Pages are prefetched while the previous page is filtered, and no further
+    page is requested once enough items were found or the page/time budget
+    (MERCARI_MAX_PAGES / MERCARI_PAGE_TIME_BUDGET_SECONDS) runs out.
+
+    Args:
+        search_params: A dictionary containing search parameters.
+        max_items: Number of matching items to collect before stopping.
+        speculative: (Optional) SpeculativeSearch started while the parameters were
+            still streaming; its result is reused if the final parameters match.
+    Returns:
+        A StreamedSearchResult (with an `items` ItemStore), or None if the search failed.
+    """
     try:
-        m = Mercapi()
-        results = asyncio.run(
-            m.search(
-                query=mercari_params["query"],
-                price_min=mercari_params["price_min"],
-                price_max=mercari_params["price_max"],
-                categories=mercari_params["categories"],
-                # TODO Handle with same logic as categories
-                # brands=mercari_params["brands"], # Facet params commented out for now
-                # item_conditions=mercari_params["item_conditions"],
-                # shipping_payer=mercari_params["shipping_payer"],
-            )
-        )
-        return results
+        if speculative is not None:
+            return speculative.result_for(search_params)
+        return search_engine.collect_items_sync(search_params, max_items)
 
     except Exception as e:
-        print(f"\n--- Error during mercapi search in mercari_api_client: {e} ---")
+        telemetry.event("error", "search_failed", f"Error during mercapi search in mercari_api_client: {e}")
         return None
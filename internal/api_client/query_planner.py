@@ -0,0 +1,278 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional
+
+import numpy as np
+from mercapi.requests.search import SearchRequestData
+
+from internal.api_client.item_store import ItemStore
+from internal.parameter_matching.facets_config import config
+from internal.utils.constants import MERCARI_PUSHDOWN_FILTERS
+from internal.utils.telemetry import telemetry
+from internal.utils.text_utils import fold_text
+
+# Filters the search API accepts, with the Mercapi.search argument(s) each one sets
+API_FILTERS = {
+    "price": ("price_min", "price_max"),
+    "categories": ("categories",),
+    "brands": ("brands",),
+    "item_conditions": ("item_conditions",),
+    "shipping_payer": ("shipping_payer",),
+    "sizes": ("sizes",),
+    "colors": ("colors",),
+}
+# Filters on fields that result items carry, so they can also run client-side
+CLIENT_FILTERS = frozenset({"price", "item_conditions", "shipping_payer"})
+
+SortBy, SortOrder = SearchRequestData.SortBy, SearchRequestData.SortOrder
+# Extracted sort_by / sort_order values (lowercase) to Mercapi.search arguments
+SORT_BY_NAMES = {
+    "price": SortBy.SORT_PRICE,
+    "created_time": SortBy.SORT_CREATED_TIME,
+    "created": SortBy.SORT_CREATED_TIME,
+    "newest": SortBy.SORT_CREATED_TIME,
+    "date": SortBy.SORT_CREATED_TIME,
+    "num_likes": SortBy.SORT_NUM_LIKES,
+    "likes": SortBy.SORT_NUM_LIKES,
+    "popularity": SortBy.SORT_NUM_LIKES,
+    "score": SortBy.SORT_SCORE,
+    "relevance": SortBy.SORT_SCORE,
+}
+SORT_ORDER_NAMES = {
+    "asc": SortOrder.ORDER_ASC,
+    "ascending": SortOrder.ORDER_ASC,
+    "desc": SortOrder.ORDER_DESC,
+    "descending": SortOrder.ORDER_DESC,
+}
+
+
+def _ids(values) -> List[int]:
+    return sorted({int(value) for value in values or []})
+
+
+@dataclass
+class ItemFilter:
+    """
+    The client-side part of a search plan: a price range and sets of
+    condition and shipping payer IDs.
+
+    mask() evaluates it over a whole ItemStore at once, on NumPy views of
+    the store's typed arrays; calling the filter with a single item keeps it
+    usable as a plain predicate.
+    """
+
+    price_min: Optional[int] = None
+    price_max: Optional[int] = None
+    condition_ids: List[int] = field(default_factory=list)
+    shipping_payer_ids: List[int] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return any(value is not None and value != [] for value in self.to_dict().values())
+
+    def mask(self, items: ItemStore) -> np.ndarray:
+        """Boolean array, True for the items that pass."""
+        keep = np.ones(len(items), dtype=bool)
+        if not len(items):
+            return keep
+        if self.price_min is not None or self.price_max is not None:
+            prices = np.frombuffer(items.prices, dtype=np.int64)
+            if self.price_min is not None:
+                keep &= prices >= self.price_min
+            if self.price_max is not None:
+                keep &= prices <= self.price_max
+        if self.condition_ids:
+            keep &= np.isin(np.frombuffer(items.condition_ids, dtype=np.int8), self.condition_ids)
+        if self.shipping_payer_ids:
+            keep &= np.isin(np.frombuffer(items.shipping_payer_ids, dtype=np.int8), self.shipping_payer_ids)
+        return keep
+
+    def apply(self, items: ItemStore) -> ItemStore:
+        """A new store with the items that pass."""
+        return items.select(np.flatnonzero(self.mask(items)))
+
+    def __call__(self, item: Any) -> bool:
+        if self.price_min is not None and item.price < self.price_min:
+            return False
+        if self.price_max is not None and item.price > self.price_max:
+            return False
+        if self.condition_ids and item.item_condition_id not in self.condition_ids:
+            return False
+        if self.shipping_payer_ids and getattr(item, "shipping_payer_id", 0) not in self.shipping_payer_ids:
+            return False
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "price_min": self.price_min,
+            "price_max": self.price_max,
+            "condition_ids": self.condition_ids,
+            "shipping_payer_ids": self.shipping_payer_ids,
+        }
+
+
+@dataclass
+class SearchPlan:
+    """
+    Where each filter of a search runs.
+
+    Attributes:
+        search_kwargs: Keyword arguments for Mercapi.search (the pushed-down filters).
+        item_filter: Client-side post-filter, or None if every filter was pushed down.
+        placements: Filter name -> "api", "client" or "skipped" (neither supported), for
+            the filters the parameters set.
+        unmatched: Parameter -> extracted values that matched no facet ID (not filtered on).
+    """
+
+    search_kwargs: Dict[str, Any]
+    item_filter: Optional[ItemFilter] = None
+    placements: Dict[str, str] = field(default_factory=dict)
+    unmatched: Dict[str, List[str]] = field(default_factory=dict)
+
+    def signature(self) -> str:
+        """
+        Equal for two plans exactly when they produce the same collected items:
+        the canonical API arguments (query folded for width, case and whitespace)
+        and the client-side filter.
+        """
+        search_kwargs = dict(self.search_kwargs)
+        search_kwargs["query"] = fold_text(str(search_kwargs["query"]))
+        return json.dumps(
+            [search_kwargs, self.item_filter.to_dict() if self.item_filter else None],
+            sort_keys=True,
+            ensure_ascii=False,
+            default=lambda value: value.name,  # Sort enums
+        )
+
+
+class QueryPlanner:
+    """
+    Turns extracted search parameters into a SearchPlan.
+
+    Category and brand IDs are taken as they are (the extraction already
+    mapped them); condition, shipping payer, size and color names are mapped
+    to IDs with the facet lookup tables (see FacetValueMatcher). Every filter
+    in `pushdown` is sent to the API, so each result page holds only matching
+    items; the others run as a vectorised post-filter if the result items
+    carry the field, and are skipped otherwise.
+    """
+
+    def __init__(self, pushdown: FrozenSet[str] = MERCARI_PUSHDOWN_FILTERS, facets_config=config) -> None:
+        """
+        Args:
+            pushdown: Filters to send to the API (see API_FILTERS); unknown names are ignored.
+            facets_config: FacetsConfig providing the facet value lookup tables.
+        """
+        self.pushdown = frozenset(pushdown)
+        self.facets_config = facets_config
+
+    def plan(self, search_params: Dict[str, Any]) -> SearchPlan:
+        """
+        Plans one search.
+
+        Args:
+            search_params: A dictionary containing search parameters.
+
+        Returns:
+            The SearchPlan. Its search_kwargs always contain the query and every
+            filter argument, empty or None where the filter is unset or not pushed
+            down, and sort_by / sort_order if the parameters name a known sort.
+        """
+        price_min = search_params.get("price_min")
+        price_max = search_params.get("price_max")
+        filters: Dict[str, Any] = {
+            "price": (
+                int(price_min) if price_min is not None else None,
+                int(price_max) if price_max is not None else None,
+            ),
+            "categories": _ids(search_params.get("categories")),
+            "brands": _ids(search_params.get("brands")),
+        }
+        unmatched = {}
+        matcher = self.facets_config.facet_value_matcher
+        for parameter in ("item_conditions", "shipping_payer", "sizes", "colors"):
+            filters[parameter], unmatched_values = matcher.match(parameter, search_params.get(parameter))
+            if unmatched_values:
+                unmatched[parameter] = unmatched_values
+
+        search_kwargs: Dict[str, Any] = {"query": search_params.get("query") or ""}
+        sort_by = SORT_BY_NAMES.get(str(search_params.get("sort_by") or "").strip().lower())
+        if sort_by is not None:
+            # Cheapest first unless stated otherwise; newest / most liked first
+            default_order = SortOrder.ORDER_ASC if sort_by is SortBy.SORT_PRICE else SortOrder.ORDER_DESC
+            search_kwargs["sort_by"] = sort_by
+            search_kwargs["sort_order"] = SORT_ORDER_NAMES.get(
+                str(search_params.get("sort_order") or "").strip().lower(), default_order
+            )
+        client: Dict[str, Any] = {}
+        placements = {}
+        for name, arguments in API_FILTERS.items():
+            value = filters[name]
+            pushed = name in self.pushdown
+            if name == "price":
+                search_kwargs.update(zip(arguments, value if pushed else (None, None)))
+                is_set = value != (None, None)
+            else:
+                search_kwargs[arguments[0]] = value if pushed else []
+                is_set = bool(value)
+            if not is_set:
+                continue
+            if pushed:
+                placements[name] = "api"
+            elif name in CLIENT_FILTERS:
+                client[name] = value
+                placements[name] = "client"
+            else:
+                placements[name] = "skipped"
+
+        item_filter = ItemFilter(
+            price_min=client.get("price", (None, None))[0],
+            price_max=client.get("price", (None, None))[1],
+            condition_ids=client.get("item_conditions", []),
+            shipping_payer_ids=client.get("shipping_payer", []),
+        )
+        return SearchPlan(search_kwargs, item_filter or None, placements, unmatched)
+
+    @staticmethod
+    def record(plan: SearchPlan) -> None:
+        """Counts where each filter ran and reports unmatched and skipped filters."""
+        for name, placement in plan.placements.items():
+            telemetry.count("search_filters_total", filter=name, placement=placement)
+            if placement == "skipped":
+                telemetry.event(
+                    "warning",
+                    "search_filter_skipped",
+                    f"The '{name}' filter can neither be sent to the API nor applied to the results and is ignored.",
+                    filter=name,
+                )
+        for parameter, values in plan.unmatched.items():
+            telemetry.count("facet_values_total", len(values), parameter=parameter, result="unmatched")
+            telemetry.event(
+                "warning",
+                "facet_values_unmatched",
+                f"Extracted {parameter} values {values} match no Mercari ID and will be ignored.",
+                parameter=parameter,
+                values=values,
+            )
+
+
+# Shared planner - pushes down MERCARI_PUSHDOWN_FILTERS
+query_planner = QueryPlanner()
+
+if __name__ == "__main__":
+    example_params = {
+        "query": "ワンピース",
+        "price_max": 5000,
+        "categories": [],
+        "brands": [],
+        "item_conditions": ["美品", "new"],
+        "shipping_payer": ["free shipping"],
+        "sizes": ["M"],
+        "colors": ["navy", "rainbow"],
+    }
+    for pushdown in (MERCARI_PUSHDOWN_FILTERS, frozenset({"categories", "brands"})):
+        example_plan = QueryPlanner(pushdown).plan(example_params)
+        print("Pushdown:", sorted(pushdown))
+        print("  Search kwargs:", example_plan.search_kwargs)
+        print("  Item filter:", example_plan.item_filter)
+        print("  Placements:", example_plan.placements)
+        print("  Unmatched:", example_plan.unmatched)
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from internal.utils.constants import (
+    MERCARI_SEARCH_CACHE_MAX_ENTRIES,
+    MERCARI_SEARCH_CACHE_TTL_SECONDS,
+)
+from internal.utils.telemetry import telemetry
+
+
+class SearchResultCache:
+    """
+    Short-lived LRU cache for Mercari search results with single-flight coalescing.
+
+    While a fetch for a key is in flight, further requests for the same key wait
+    for it instead of starting their own, so N concurrent identical searches
+    make one upstream request. The shared fetch is cancelled when every
+    request waiting for it has been cancelled. Successful results are kept for ttl_seconds
+    (listings change, so this should be short); failures are not cached. At
+    most max_entries results are held, least recently used evicted first.
+
+    Not thread-safe: all calls must come from one event loop (the search
+    engine's loop).
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = MERCARI_SEARCH_CACHE_TTL_SECONDS,
+        max_entries: int = MERCARI_SEARCH_CACHE_MAX_ENTRIES,
+    ) -> None:
+        """
+        Args:
+            ttl_seconds: Time to live of a result; 0 disables caching but keeps coalescing.
+            max_entries: Capacity of the cache.
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}  # In-flight fetch -> requests awaiting it
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Returns the cached result for key, or None on a miss or expired entry."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Any]],
+        cacheable: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """
+        Returns the cached result for key, joins an identical fetch in flight, or starts fetch().
+
+        Cancelling one waiter does not cancel the shared fetch for the others;
+        cancelling the last one cancels the fetch.
+
+        Args:
+            key: Hashable cache key (e.g. built from search_signature()).
+            fetch: Creates the coroutine that performs the upstream request.
+            cacheable: (Optional) Predicate deciding whether a fetched result is stored.
+        """
+        kind = key[0] if isinstance(key, tuple) else "search"
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            telemetry.count("search_cache_lookups_total", cache=kind, result="hit")
+            return value
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            telemetry.count("search_cache_lookups_total", cache=kind, result="coalesced")
+        else:
+            self.misses += 1
+            telemetry.count("search_cache_lookups_total", cache=kind, result="miss")
+            task = asyncio.ensure_future(fetch())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done, cacheable))
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():  # Every waiter was cancelled
+                    task.cancel()
+
+    def _finish(self, key: Hashable, task: asyncio.Future, cacheable) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if task.cancelled() or task.exception() is not None or task.result() is None:
+            return
+        if cacheable is None or cacheable(task.result()):
+            self.put(key, task.result())
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters; coalesced requests count as saved upstream calls."""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "in_flight": len(self._in_flight),
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
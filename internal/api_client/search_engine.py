@@ -0,0 +1,395 @@
+import asyncio
+import atexit
+import concurrent.futures
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, AsyncIterator, Callable, Coroutine, Dict, Optional
+
+from mercapi import Mercapi
+
+from internal.api_client.item_store import CompactSearchResults, ItemStore
+from internal.api_client.query_planner import ItemFilter, query_planner
+from internal.api_client.search_cache import SearchResultCache
+from internal.utils.constants import (
+    MERCARI_MAX_CONCURRENT_SEARCHES,
+    MERCARI_MAX_PAGES,
+    MERCARI_PAGE_TIME_BUDGET_SECONDS,
+    MERCARI_SEARCH_CACHE_MAX_ENTRIES,
+    MERCARI_SEARCH_CACHE_TTL_SECONDS,
+    MERCARI_SEARCH_TIMEOUT_SECONDS,
+)
+from internal.utils.telemetry import telemetry
+
+
+def build_search_kwargs(search_params):
+    """
+    Converts extracted search parameters into keyword arguments for Mercapi.search:
+    the query and every filter the planner pushes down to the API (see QueryPlanner).
+
+    Args:
+        search_params: A dictionary containing search parameters.
+
+    Returns:
+        A dictionary of Mercapi.search keyword arguments.
+    """
+    return query_planner.plan(search_params).search_kwargs
+
+
+def search_signature(search_params):
+    """
+    Returns a string that is equal for two parameter sets exactly when they
+    produce the same collect_items() result (same API query and client-side filters).
+    """
+    return query_planner.plan(search_params).signature()
+
+
+def build_item_filter(search_params):
+    """
+    Builds the client-side ItemFilter for the filters in search_params that
+    are not pushed down to the API, or None if there is nothing to filter on.
+    """
+    return query_planner.plan(search_params).item_filter
+
+
+@dataclass
+class StreamedSearchResult:
+    """Items collected from one or more result pages."""
+
+    items: ItemStore = field(default_factory=ItemStore)
+    pages_fetched: int = 0
+    items_seen: int = 0  # Before client-side filtering
+    stop_reason: str = ""
+    filter_placements: Dict[str, str] = field(default_factory=dict)  # Filter -> "api", "client" or "skipped"
+
+
+class MercariSearchEngine:
+    """
+    Long-lived Mercari search engine.
+
+    Owns one event loop (on a background thread), one Mercapi instance and its
+    HTTP connection pool for the life of the process, so searches run over warm
+    connections. Searches can be awaited from any event loop or called
+    synchronously from any thread; at most max_concurrent_searches run at once.
+
+    Results are cached for a short TTL, keyed on the canonicalised parameters,
+    and concurrent identical searches share one upstream request (see
+    SearchResultCache).
+
+    Every page is converted to a CompactSearchResults as it arrives, so the
+    mercapi item objects never leave the engine: results, the cache and the
+    callers hold ItemStore columns.
+    """
+
+    def __init__(
+        self,
+        max_concurrent_searches: int = MERCARI_MAX_CONCURRENT_SEARCHES,
+        mercapi_factory: Callable[[], Any] = Mercapi,
+        cache_ttl_seconds: float = MERCARI_SEARCH_CACHE_TTL_SECONDS,
+        cache_max_entries: int = MERCARI_SEARCH_CACHE_MAX_ENTRIES,
+    ) -> None:
+        """
+        Args:
+            max_concurrent_searches: Upper bound on searches in flight.
+            mercapi_factory: Creates the Mercapi client (a stand-in may be passed for benchmarks).
+            cache_ttl_seconds: Time to live of cached results (0 disables caching, not coalescing).
+            cache_max_entries: Maximum number of cached results.
+        """
+        self.max_concurrent_searches = max_concurrent_searches
+        self._mercapi_factory = mercapi_factory
+        self.result_cache = SearchResultCache(cache_ttl_seconds, cache_max_entries)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._mercapi: Any = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The engine's event loop, started on first use."""
+        if self._loop is None:
+            self.start()
+        return self._loop
+
+    @property
+    def mercapi(self) -> Any:
+        if self._mercapi is None:
+            self.start()
+        return self._mercapi
+
+    def start(self) -> None:
+        """Starts the event loop thread and creates the Mercapi client on it."""
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_forever, name="mercari-search-engine", daemon=True
+            )
+            thread.start()
+            self._loop, self._thread = loop, thread
+            asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+
+    async def _setup(self) -> None:
+        self._mercapi = self._mercapi_factory()
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_searches)
+
+    def submit(self, coroutine: Coroutine) -> concurrent.futures.Future:
+        """Schedules a coroutine on the engine loop and returns a thread-safe future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    async def run(self, coroutine: Coroutine) -> Any:
+        """Awaits a coroutine on the engine loop from whichever loop the caller is on."""
+        loop = self.loop
+        try:
+            if asyncio.get_running_loop() is loop:
+                return await coroutine
+        except RuntimeError:
+            pass
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, loop))
+
+    async def _fetch_first_page(self, search_params: Dict[str, Any]) -> CompactSearchResults:
+        async with self._semaphore:
+            with telemetry.span("search_page", page="first") as span:
+                results = CompactSearchResults.from_mercapi(
+                    await self._mercapi.search(**build_search_kwargs(search_params))
+                )
+                span.set(items=len(results.items))
+                return results
+
+    async def _search(self, search_params: Dict[str, Any], use_cache: bool = True) -> Any:
+        if not use_cache:
+            return await self._fetch_first_page(search_params)
+        cache_key = ("search", search_signature(search_params))
+        return await self.result_cache.get_or_fetch(
+            cache_key, lambda: self._fetch_first_page(search_params)
+        )
+
+    async def search(self, search_params: Dict[str, Any], use_cache: bool = True) -> Any:
+        """
+        Runs one search and returns its first page as CompactSearchResults.
+
+        Args:
+            search_params: A dictionary containing search parameters.
+            use_cache: If False, always query Mercari (the fresh result is not cached either).
+        """
+        return await self.run(self._search(search_params, use_cache))
+
+    async def _fetch_next_page(self, results: CompactSearchResults) -> CompactSearchResults:
+        async with self._semaphore:
+            with telemetry.span("search_page", page="next") as span:
+                next_results = await results.next_page()
+                span.set(items=len(next_results.items))
+                return next_results
+
+    async def iter_pages(
+        self,
+        search_params: Dict[str, Any],
+        item_filter: Optional[Callable[[Any], bool]] = None,
+        max_pages: int = MERCARI_MAX_PAGES,
+        time_budget: Optional[float] = MERCARI_PAGE_TIME_BUDGET_SECONDS,
+        stats: Optional[StreamedSearchResult] = None,
+        use_cache: bool = True,
+        prefetch: bool = True,
+    ) -> AsyncIterator[ItemStore]:
+        """
+        Yields result pages as ItemStores of the items that pass item_filter.
+
+        The next page is requested as soon as a page arrives, so it downloads
+        while the caller processes the current one. Fetching stops after
+        max_pages pages, on the last page, or when time_budget seconds have
+        passed; breaking out of the loop cancels the prefetch.
+
+        Args:
+            search_params: A dictionary containing search parameters.
+            item_filter: (Optional) ItemFilter (applied to whole pages) or predicate applied
+                to every item client-side.
+            max_pages: Maximum number of pages to fetch.
+            time_budget: (Optional) Seconds after which no further page is awaited.
+            stats: (Optional) Updated with pages fetched, items seen and the stop reason.
+            use_cache: If True, the first page may come from result_cache.
+            prefetch: If False, the next page is only requested when the caller asks for it
+                (for callers that usually stop after the first page).
+        """
+        stats = stats if stats is not None else StreamedSearchResult()
+        deadline = time.monotonic() + time_budget if time_budget is not None else None
+        pending = asyncio.ensure_future(self.run(self._search(search_params, use_cache)))
+        try:
+            while pending is not None:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    stats.stop_reason = "time_budget"
+                    return
+                try:
+                    results = await asyncio.wait_for(asyncio.shield(pending), remaining)
+                except asyncio.TimeoutError:
+                    stats.stop_reason = "time_budget"
+                    return
+                pending = None
+                stats.pages_fetched += 1
+                stats.items_seen += len(results.items)
+
+                has_next = False
+                if stats.pages_fetched >= max_pages:
+                    stats.stop_reason = "max_pages"
+                elif not results.items or not results.meta.next_page_token:
+                    stats.stop_reason = "last_page"
+                else:
+                    has_next = True
+                if has_next and prefetch:  # Prefetch while the caller works on this page
+                    pending = asyncio.ensure_future(self.run(self._fetch_next_page(results)))
+
+                items = results.items
+                if isinstance(item_filter, ItemFilter):
+                    items = item_filter.apply(items)
+                elif item_filter is not None:
+                    items = items.filter(item_filter)
+                yield items
+                if has_next and pending is None:
+                    pending = asyncio.ensure_future(self.run(self._fetch_next_page(results)))
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def iter_items(
+        self,
+        search_params: Dict[str, Any],
+        max_items: Optional[int] = None,
+        **page_options: Any,
+    ) -> AsyncIterator[Any]:
+        """
+        Yields items page by page (see iter_pages) until max_items items passed the filters.
+        """
+        yielded = 0
+        async for items in self.iter_pages(search_params, **page_options):
+            for item in items:
+                yield item
+                yielded += 1
+                if max_items is not None and yielded >= max_items:
+                    return
+
+    async def collect_items(
+        self,
+        search_params: Dict[str, Any],
+        max_items: int,
+        use_client_filter: bool = True,
+        use_cache: bool = True,
+        **page_options: Any,
+    ) -> StreamedSearchResult:
+        """
+        Collects whole pages until at least max_items items passed the client-side
+        filters, or the page/time budget runs out. Filters the API supports are
+        pushed down (see QueryPlanner), so usually every item of a page passes.
+
+        Args:
+            search_params: A dictionary containing search parameters.
+            max_items: Number of filtered items after which no further page is fetched.
+            use_client_filter: If True, apply build_item_filter(search_params).
+            use_cache: If True, identical collections are served from (or joined to) result_cache.
+            **page_options: max_pages / time_budget overrides for iter_pages.
+
+        Returns:
+            A StreamedSearchResult with the filtered items of every fetched page and
+            where each filter ran.
+        """
+        if not use_cache:
+            return await self._collect_items(
+                search_params, max_items, use_client_filter, use_cache=False, **page_options
+            )
+        cache_key = (
+            "items",
+            search_signature(search_params),
+            max_items,
+            use_client_filter,
+            tuple(sorted(page_options.items())),
+        )
+        result = await self.run(
+            self.result_cache.get_or_fetch(
+                cache_key,
+                lambda: self._collect_items(
+                    search_params, max_items, use_client_filter, **page_options
+                ),
+                # A collection cut short by the time budget is not worth replaying
+                cacheable=lambda result: result.stop_reason != "time_budget",
+            )
+        )
+        # Callers may modify their result, so each gets its own items
+        return replace(result, items=result.items.copy())
+
+    async def _collect_items(
+        self,
+        search_params: Dict[str, Any],
+        max_items: int,
+        use_client_filter: bool,
+        **page_options: Any,
+    ) -> StreamedSearchResult:
+        plan = query_planner.plan(search_params)
+        query_planner.record(plan)
+        result = StreamedSearchResult(filter_placements=plan.placements)
+        item_filter = plan.item_filter if use_client_filter else None
+        async for items in self.iter_pages(
+            search_params, item_filter=item_filter, stats=result, **page_options
+        ):
+            result.items.extend(items)
+            if len(result.items) >= max_items:
+                result.stop_reason = "enough_items"
+                break
+        return result
+
+    def collect_items_sync(
+        self,
+        search_params: Dict[str, Any],
+        max_items: int,
+        timeout: Optional[float] = MERCARI_SEARCH_TIMEOUT_SECONDS,
+        **options: Any,
+    ) -> StreamedSearchResult:
+        """Blocking wrapper around collect_items() for non-async callers."""
+        future = self.submit(self.collect_items(search_params, max_items, **options))
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def search_sync(
+        self,
+        search_params: Dict[str, Any],
+        timeout: Optional[float] = MERCARI_SEARCH_TIMEOUT_SECONDS,
+        use_cache: bool = True,
+    ) -> Any:
+        """
+        Blocking wrapper around search() for non-async callers.
+
+        Raises:
+            concurrent.futures.TimeoutError: If the search takes longer than timeout seconds.
+        """
+        future = self.submit(self._search(search_params, use_cache))
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def close(self) -> None:
+        """Closes the HTTP client and stops the event loop thread."""
+        with self._start_lock:
+            loop, self._loop = self._loop, None
+            if loop is None:
+                return
+            client = getattr(self._mercapi, "_client", None)
+            if client is not None and hasattr(client, "aclose"):
+                try:
+                    asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(5)
+                except Exception as e:
+                    telemetry.event(
+                        "warning", "search_client_close_failed", f"Could not close the Mercari HTTP client: {e}"
+                    )
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join(5)
+            loop.close()
+            self._mercapi = None
+
+
+# Shared engine instance - the loop and Mercapi client are created on first use
+search_engine = MercariSearchEngine()
+atexit.register(search_engine.close)
@@ -1,18 +1,146 @@
 import json
 import re
 
-import requests
-
+from internal.llm.llm_scheduler import llm_scheduler
+from internal.llm.ollama_client import OllamaError
+from internal.llm.prompt_builder import prompt_builder
+from internal.llm.response_cache import llm_response_cache, make_cache_key, prompt_template_hash
+from internal.llm.semantic_cache import semantic_cache
+from internal.llm.structured_output import (
+    EXTRACTION_SCHEMA,
+    RECOMMENDATION_SCHEMA,
+    ExtractedParameters,
+    OutputValidationError,
+    Recommendations,
+    parse_output,
+)
+from internal.llm.streaming_json_parser import StreamingJSONObjectParser
 from internal.prompts.recommendation_prompt import RECOMMENDATION_PROMPT
 from internal.prompts.parameter_extraction_prompt import PARAM_EXTRACTION_PROMPT
 from internal.parameter_matching.parameter_matcher import parameter_matcher
 from internal.utils.constants import (
-    ENG_TO_JPN_CATEGORY_MAP,
-    ITEM_CONDITION_ID_TO_NAME_MAP,
+    LLM_OUTPUT_MAX_ATTEMPTS,
+    LLM_RETRY_TEMPERATURE,
+    LLM_TEMPERATURE,
+    OLLAMA_CONTEXT_TOKENS,
+    OLLAMA_OUTPUT_FORMAT,
+    PROMPT_RESERVED_OUTPUT_TOKENS,
 )
+from internal.utils.telemetry import telemetry
+
+# "schema", "json" or "none" (see generation_parameters); benchmarks may switch it
+output_format = OLLAMA_OUTPUT_FORMAT
+
+
+def resolve_extracted_facet(key, value, user_request_text):
+    """
+    Maps an extracted "categories" or "brands" value from names to Mercari IDs.
+
+    Args:
+        key: The parameter name.
+        value: The value extracted by the LLM.
+        user_request_text: The user's request, scanned for brands if no brand name matches.
+
+    Returns:
+        The list of IDs, None if no name matched, or value unchanged for other parameters.
+    """
+    # --- Category Name Matching and ID Conversion ---
+    if key == "categories":
+        with telemetry.span("category_matching", names=len(value or [])):
+            matched_category_ids = parameter_matcher.match_category_names_to_ids(
+                value
+            )  # Use parameter_matcher
+        if matched_category_ids:
+            return matched_category_ids  # Replace category names with IDs
+        telemetry.event(
+            "warning",
+            "no_category_ids",
+            "No valid category IDs found for extracted category names.",
+            categories=value,
+        )
+        return None
+
+    # --- Brand Name Matching and ID Conversion ---
+    if key == "brands" and value:
+        with telemetry.span("brand_matching", names=len(value)):
+            matched_brand_ids = parameter_matcher.match_brand_names_to_ids(
+                value, user_request_text
+            )
+        if matched_brand_ids:
+            return matched_brand_ids
+        telemetry.event(
+            "warning",
+            "no_brand_ids",
+            "No valid brand IDs found for extracted brand names.",
+            brands=value,
+        )
+        return None
+
+    return value
+
+
+def report_prompt_cache(generation, stage):
+    """Records how much of the prompt Ollama served from its KV cache (counters and span attributes)."""
+    cached_tokens = generation.cached_prompt_tokens
+    if cached_tokens is None:
+        return
+    seconds_saved = generation.prompt_eval_seconds_saved or 0.0
+    telemetry.count("ollama_cached_prompt_tokens_total", cached_tokens, stage=stage)
+    telemetry.count("ollama_prompt_eval_seconds_saved_total", seconds_saved, stage=stage)
+    telemetry.annotate(cached_prompt_tokens=cached_tokens, prompt_eval_ms_saved=round(seconds_saved * 1000, 1))
 
 
-def extract_search_parameters_with_llm_ollama(user_request_text, mercari_items=None):
+def generation_parameters(schema, temperature=LLM_TEMPERATURE):
+    """
+    The /api/generate fields of one call.
+
+    Sampling settings go under `options`: Ollama ignores top-level
+    max_tokens / stop_sequence / temperature. The output is capped with
+    num_predict, and the output format follows output_format:
+        - "schema": `format` is the JSON schema, so only matching JSON can be generated
+        - "json": `format` is "json" (any JSON object; for Ollama versions before 0.5)
+        - "none": prompt instructions only; a blank line after the object stops the generation
+    """
+    options = {
+        "num_ctx": OLLAMA_CONTEXT_TOKENS,
+        "num_predict": PROMPT_RESERVED_OUTPUT_TOKENS,
+        "temperature": temperature,
+    }
+    params = {"options": options}
+    if output_format == "schema":
+        params["format"] = schema
+    elif output_format == "json":
+        params["format"] = "json"
+    else:
+        options["stop"] = ["\n\n"]
+    return params
+
+
+def parse_generation(generation, result_type, stage):
+    """
+    Parses one generation into result_type and records the outcome in
+    llm_generations_total{result="valid"|"repaired"|"invalid"}. The output
+    tokens of an invalid generation are counted as llm_wasted_tokens_total.
+
+    Returns:
+        The validated result, or None if the output is unusable.
+    """
+    if generation.stats.get("done_reason") == "length":
+        telemetry.count("llm_output_truncated_total", stage=stage)
+    try:
+        result, repaired = parse_output(generation.text.strip(), result_type)
+    except OutputValidationError as e:
+        telemetry.count("llm_generations_total", stage=stage, result="invalid")
+        telemetry.count("llm_wasted_tokens_total", generation.stats.get("eval_count") or 0, stage=stage)
+        telemetry.event("warning", "llm_invalid_output", f"Unusable LLM output ({stage}): {e}", stage=stage)
+        return None
+    telemetry.count("llm_generations_total", stage=stage, result="repaired" if repaired else "valid")
+    return result
+
+
+def extract_search_parameters_with_llm_ollama(
+    user_request_text, mercari_items=None, use_cache=True, client=None, on_field=None
+):
     """
     Extracts Mercari Japan search parameters from user request text using a local Ollama LLM (Llama3.2).
     Uses parameter_matcher to validate and match extracted category names to category IDs.
@@ -20,84 +148,170 @@ def extract_search_parameters_with_llm_ollama(user_request_text, mercari_items=N
     Args:
         user_request_text: The user's natural language request (string).
         mercari_items: (Optional) List of Mercari items (search results). If provided, the function will generate recommendations instead of just extracting parameters.
+        use_cache: If True, identical generations are served from llm_response_cache, and
+            parameters extracted for a similar earlier request from semantic_cache.
+        client: (Optional) OllamaClient (or OllamaScheduler) to use instead of the shared llm_scheduler.
+        on_field: (Optional) Called as on_field(key, value) for every top-level parameter as soon
+            as it has been streamed, with categories and brands already mapped to IDs. Lets callers
+            start work (e.g. a speculative search) before the LLM has finished. Parameter extraction only.
 
     Returns:
         A dictionary containing the extracted search parameters and top 3 item recommendations (if available).
         Returns None if an error occurs during the process.
     """
 
-    if mercari_items:
-        top_mercari_items = mercari_items
-        search_results_formatted = "\n\n**Mercari Search Results (Top Items for recommendation generation):**\n"
-
-        for item in top_mercari_items:
-            condition_name = ITEM_CONDITION_ID_TO_NAME_MAP.get(
-                item.item_condition_id, "Condition Unknown"
+    stage = "recommendation" if mercari_items else "extraction"
+    with telemetry.span("prompt_build", stage=stage) as span:
+        if mercari_items:
+            # Items are passed best first; the builder keeps as many as fit the context
+            prompt_template = RECOMMENDATION_PROMPT
+            built_prompt = prompt_builder.build(
+                RECOMMENDATION_PROMPT, items=mercari_items, user_request=user_request_text
+            )
+            prompt_variables = built_prompt.items_block
+        else:
+            prompt_template = PARAM_EXTRACTION_PROMPT
+            built_prompt = prompt_builder.build(
+                PARAM_EXTRACTION_PROMPT, user_request=user_request_text
             )
-            search_results_formatted += f"- Item Name: {item.name}, Price: ¥{item.price}, Condition: {condition_name}, Item ID: {item.id_}\n"
-        formatted_prompt = RECOMMENDATION_PROMPT.format(
-            search_results_placeholder=search_results_formatted,
+            prompt_variables = ""
+        span.set(
+            estimated_tokens=built_prompt.estimated_tokens,
+            items=built_prompt.item_count,
+            items_dropped=built_prompt.items_dropped,
+            static_prefix_tokens=built_prompt.static_prefix_tokens,
         )
-        print(search_results_formatted)
+    telemetry.observe("prompt_estimated_tokens", built_prompt.estimated_tokens, stage=stage)
+    formatted_prompt = built_prompt.text
+
+    client = client or llm_scheduler
+    if mercari_items:
+        result_type, schema = Recommendations, RECOMMENDATION_SCHEMA
     else:
-        formatted_prompt = PARAM_EXTRACTION_PROMPT.format(
-            user_request=user_request_text
+        result_type, schema = ExtractedParameters, EXTRACTION_SCHEMA
+    generation_params = generation_parameters(schema)
+
+    cache_key = make_cache_key(
+        user_request_text,
+        prompt_template,
+        client.model,
+        generation_params,
+        prompt_variables,
+    )
+    json_text = llm_response_cache.get(cache_key) if use_cache else None
+    is_cached_response = json_text is not None
+    if use_cache:
+        telemetry.count(
+            "llm_cache_lookups_total", stage=stage, result="hit" if is_cached_response else "miss"
         )
 
-    ollama_api_url = "http://localhost:11434/api/generate"
+    # Paraphrases of an earlier request reuse its extracted parameters
+    semantic_namespace = None
+    if use_cache and not mercari_items and semantic_cache.enabled:
+        semantic_namespace = f"{client.model}:{prompt_template_hash(prompt_template)}"
+        if not is_cached_response:
+            with telemetry.span("semantic_cache_lookup") as span:
+                semantic_hit = semantic_cache.lookup(user_request_text, semantic_namespace)
+                span.set(hit=semantic_hit is not None)
+            if semantic_hit is not None:
+                telemetry.event(
+                    "info",
+                    "semantic_cache_reuse",
+                    f"Reusing the parameters of a similar request (similarity {semantic_hit.similarity:.2f}):"
+                    f" {semantic_hit.text!r}",
+                    similarity=round(semantic_hit.similarity, 4),
+                    matched_request=semantic_hit.text,
+                )
+                json_text = semantic_hit.value
+                is_cached_response = True
 
-    data = {
-        "model": "llama3.2",
-        "prompt": formatted_prompt,
-        "max_tokens": 750,
-        "temperature": 0.5,
-        "stop_sequence": "\n\n",
-    }
+    resolved_facets = {}  # Each value is only matched once, while streaming or afterwards
+
+    def resolve(key, value):
+        memo_key = (key, json.dumps(value, sort_keys=True))
+        if memo_key not in resolved_facets:
+            resolved_facets[memo_key] = resolve_extracted_facet(key, value, user_request_text)
+        return resolved_facets[memo_key]
+
+    on_text = None
+    if on_field is not None and not mercari_items:
+        stream_parser = StreamingJSONObjectParser()
+
+        def on_text(text):
+            for key, value in stream_parser.feed(text):
+                on_field(key, resolve(key, value))
 
     try:
-        response = requests.post(ollama_api_url, json=data, stream=True)
-        response.raise_for_status()
-
-        json_text_builder = []
-        for line in response.iter_lines():
-            if line:
-                try:
-                    json_line = json.loads(line)
-                    if "response" in json_line:
-                        json_text_builder.append(json_line["response"])
-                except json.JSONDecodeError:
-                    print(f"Warning: Could not decode JSON line: {line}")
-
-        json_text = "".join(json_text_builder).strip()
-
-        try:
-            extracted_params_json = json.loads(json_text)
-
-            # --- Category Name Matching and ID Conversion ---
-            if "categories" in extracted_params_json:
-                extracted_category_names = extracted_params_json["categories"]
-                matched_category_ids = parameter_matcher.match_category_names_to_ids(
-                    extracted_category_names
-                )  # Use parameter_matcher
-                if matched_category_ids:
-                    extracted_params_json["categories"] = (
-                        matched_category_ids  # Replace category names with IDs
-                    )
-                else:
-                    extracted_params_json["categories"] = None
-                    print(
-                        "Warning: No valid category IDs found for extracted category names."
-                    )
-
-            return json.dumps(extracted_params_json)
-
-        except json.JSONDecodeError as json_err:
-            print(f"Error: JSON Decode Error in llm_parameter_extraction: {json_err}")
+        result = None
+        if is_cached_response:
+            try:
+                result, _ = parse_output(json_text, result_type)
+                if on_text is not None:
+                    on_text(json_text)
+            except OutputValidationError:
+                is_cached_response = False  # An entry from an older format; generate afresh
+
+        # One bounded retry policy: the first generation streams, a retry is greedy
+        for attempt in range(LLM_OUTPUT_MAX_ATTEMPTS if result is None else 0):
+            if attempt:
+                telemetry.count("llm_output_retries_total", stage=stage)
+                telemetry.event(
+                    "warning",
+                    "llm_output_retry",
+                    f"Retrying the generation (attempt {attempt + 1} of {LLM_OUTPUT_MAX_ATTEMPTS})...",
+                    stage=stage,
+                    attempt=attempt + 1,
+                )
+                generation_params = generation_parameters(schema, temperature=LLM_RETRY_TEMPERATURE)
+            with telemetry.span("llm_generate", stage=stage, model=client.model, attempt=attempt + 1):
+                generation = client.generate(
+                    formatted_prompt, on_text=on_text if attempt == 0 else None, **generation_params
+                )
+                telemetry.record_ollama_stats(generation.stats, stage)
+            report_prompt_cache(generation, stage)
+            result = parse_generation(generation, result_type, stage)
+            if result is not None:
+                break
+        if result is None:
             return None
 
-    except requests.exceptions.RequestException as req_err:
-        print(f"Request error in llm_parameter_extraction: {req_err}")
+        if mercari_items:
+            prompt_item_ids = [str(item.id_) for item in mercari_items[: built_prompt.item_count]]
+            dropped = result.keep_known_items(prompt_item_ids)
+            if dropped:
+                telemetry.event(
+                    "warning",
+                    "unknown_recommended_items",
+                    f"Dropped {dropped} recommendation(s) of items that were not in the prompt.",
+                    stage=stage,
+                )
+
+        output = result.to_dict()
+        if use_cache and not is_cached_response:
+            # Only validated responses are worth replaying
+            json_text = json.dumps(output, ensure_ascii=False)
+            llm_response_cache.put(cache_key, json_text)
+            if semantic_namespace is not None:
+                semantic_cache.store(user_request_text, json_text, semantic_namespace)
+
+        if not mercari_items:
+            for key in ("categories", "brands"):
+                output[key] = resolve(key, output[key])
+        return json.dumps(output)
+
+    except OllamaError as req_err:
+        telemetry.event(
+            "error",
+            "llm_request_error",
+            f"Request error in llm_parameter_extraction: {req_err}",
+            stage=stage,
+        )
         return None
     except Exception as e:
-        print(f"Unexpected error in llm_parameter_extraction: {e}")
+        telemetry.event(
+            "error",
+            "llm_unexpected_error",
+            f"Unexpected error in llm_parameter_extraction: {e}",
+            stage=stage,
+        )
         return None
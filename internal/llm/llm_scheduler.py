@@ -0,0 +1,535 @@
+import asyncio
+import atexit
+import concurrent.futures
+import contextlib
+import contextvars
+import heapq
+import itertools
+import queue
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence
+
+import httpx
+
+from internal.llm.ollama_client import OllamaClient, OllamaError, OllamaGeneration, ollama_client
+from internal.utils.constants import (
+    LLM_EJECT_AFTER_FAILURES,
+    LLM_HEALTH_CHECK_INTERVAL_SECONDS,
+    LLM_HEALTH_CHECK_TIMEOUT_SECONDS,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_HEDGE_PERCENTILE,
+    LLM_LATENCY_WINDOW,
+    LLM_MAX_ATTEMPTS,
+    LLM_PRIORITY_INTERACTIVE,
+    OLLAMA_ENDPOINT_MAX_CONCURRENCY,
+    OLLAMA_EXTRA_BASE_URLS,
+)
+from internal.utils.telemetry import telemetry
+
+_llm_priority: contextvars.ContextVar = contextvars.ContextVar(
+    "llm_priority", default=LLM_PRIORITY_INTERACTIVE
+)
+_DONE = object()
+
+
+@contextlib.contextmanager
+def llm_priority(priority: int) -> Iterator[None]:
+    """Runs the LLM calls made inside the block at priority (lower runs first), e.g. LLM_PRIORITY_BATCH."""
+    token = _llm_priority.set(priority)
+    try:
+        yield
+    finally:
+        _llm_priority.reset(token)
+
+
+def percentile(values: Sequence[float], percent: float) -> float:
+    """Nearest-rank percentile of a non-empty sequence."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+class Endpoint:
+    """One Ollama server in the pool and its load and health."""
+
+    def __init__(self, client: OllamaClient, max_concurrency: int, latency_window: int) -> None:
+        self.client = client
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.completed = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.healthy = True
+        self.first_token_seconds: Deque[float] = deque(maxlen=latency_window)
+
+    @property
+    def url(self) -> str:
+        return self.client.base_url
+
+    @property
+    def load(self) -> float:
+        return self.in_flight / self.max_concurrency
+
+    @property
+    def typical_latency(self) -> float:
+        """Median first-token latency (0 until measured), used to break load ties."""
+        return percentile(self.first_token_seconds, 50) if self.first_token_seconds else 0.0
+
+
+class _Attempt:
+    """One request of a generation to one endpoint (the primary or a hedge)."""
+
+    __slots__ = ("endpoint", "task", "started", "hedge")
+
+    def __init__(self, endpoint: Endpoint, started: float, hedge: bool) -> None:
+        self.endpoint = endpoint
+        self.task: Optional[asyncio.Task] = None
+        self.started = started
+        self.hedge = hedge
+
+
+class _EndpointFailed(Exception):
+    """All attempts of one round failed before any text reached the caller; the next round may fail over."""
+
+    def __init__(self, endpoints: List[Endpoint], error: BaseException) -> None:
+        super().__init__(str(error))
+        self.endpoints = endpoints
+        self.error = error
+
+
+class OllamaScheduler:
+    """
+    Spreads generations over a pool of Ollama servers.
+
+    Drop-in for OllamaClient's generate()/agenerate() (plus a priority
+    argument). Scheduling runs on its own event loop thread, like
+    MercariSearchEngine, so sync callers on worker threads and async callers
+    share one view of the load:
+
+      * Each call goes to the healthy endpoint with the lowest in_flight /
+        max_concurrency, with ties broken by median first-token latency. No
+        endpoint gets more than max_concurrency calls.
+      * When every endpoint is full, calls wait in a priority queue. Lower
+        values go first, then arrival order. The priority comes from the
+        argument or the enclosing llm_priority() block, so interactive
+        shoppers overtake batch jobs.
+      * Hedging: if the first token has not arrived after the
+        hedge_percentile of recent first-token latencies, the same call is
+        sent to another endpoint with a free slot. The first attempt to stream
+        text wins; the other is cancelled, which closes its connection. Since
+        only the winner streams to on_text, callers never see duplicate text.
+      * A call that fails before any text reached on_text (also mid-stream,
+        or at any point if there is no on_text) is retried on another
+        endpoint, up to max_attempts endpoints.
+      * An endpoint is ejected after eject_after_failures consecutive failures
+        or a failed health check (GET /api/tags every health_check_interval
+        seconds). It is readmitted when a check succeeds. If every endpoint is
+        ejected, all are used rather than failing outright.
+    """
+
+    def __init__(
+        self,
+        clients: Sequence[OllamaClient],
+        max_concurrency: int = OLLAMA_ENDPOINT_MAX_CONCURRENCY,
+        hedge_percentile: Optional[float] = LLM_HEDGE_PERCENTILE,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        latency_window: int = LLM_LATENCY_WINDOW,
+        max_attempts: int = LLM_MAX_ATTEMPTS,
+        eject_after_failures: int = LLM_EJECT_AFTER_FAILURES,
+        health_check_interval: Optional[float] = LLM_HEALTH_CHECK_INTERVAL_SECONDS,
+        health_check_timeout: float = LLM_HEALTH_CHECK_TIMEOUT_SECONDS,
+    ) -> None:
+        """
+        Args:
+            clients: One OllamaClient per server (all serving the same model).
+            max_concurrency: Calls in flight per endpoint (match the server's OLLAMA_NUM_PARALLEL).
+            hedge_percentile: First-token latency percentile after which a hedge is sent; None disables hedging.
+            hedge_min_samples: Latencies observed before hedging starts.
+            latency_window: Recent first-token latencies kept.
+            max_attempts: Endpoints tried per generation before giving up.
+            eject_after_failures: Consecutive failures that eject an endpoint.
+            health_check_interval: Seconds between health checks; None disables them.
+            health_check_timeout: Timeout of one health check.
+        """
+        if not clients:
+            raise ValueError("OllamaScheduler needs at least one client")
+        self.endpoints = [Endpoint(client, max_concurrency, latency_window) for client in clients]
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.max_attempts = max_attempts
+        self.eject_after_failures = eject_after_failures
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.first_token_seconds: Deque[float] = deque(maxlen=latency_window)
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self._waiters: List[tuple] = []  # Heap of (priority, sequence, future, excluded endpoints)
+        self._sequence = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._start_lock = threading.Lock()
+
+    @classmethod
+    def from_urls(cls, urls: Sequence[str], **options: Any) -> "OllamaScheduler":
+        """A scheduler over new clients for urls; failover replaces the clients' own retries."""
+        return cls([OllamaClient(url, max_retries=0) for url in urls], **options)
+
+    @property
+    def model(self) -> str:
+        return self.endpoints[0].client.model
+
+    # --- Event loop ---
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            self.start()
+        return self._loop
+
+    def start(self) -> None:
+        """Starts the scheduling loop thread (and the health checks)."""
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="llm-scheduler", daemon=True)
+            thread.start()
+            self._loop, self._thread = loop, thread
+            if self.health_check_interval and len(self.endpoints) > 1:
+                asyncio.run_coroutine_threadsafe(self._start_health_checks(), loop).result()
+
+    async def _start_health_checks(self) -> None:
+        self._health_task = asyncio.ensure_future(self._health_check_loop())
+
+    def close(self) -> None:
+        """Cancels the calls in flight and the health checks, then stops the loop thread."""
+        with self._start_lock:
+            loop, self._loop = self._loop, None
+            if loop is None:
+                return
+            with contextlib.suppress(Exception):
+                asyncio.run_coroutine_threadsafe(self._cancel_tasks(), loop).result(5)
+            for endpoint in self.endpoints:
+                with contextlib.suppress(Exception):
+                    asyncio.run_coroutine_threadsafe(endpoint.client.aclose(), loop).result(5)
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join(5)
+            self._waiters.clear()
+            self._health_task = None
+            if self._thread.is_alive():  # Still running a callback; closing it would raise
+                telemetry.event(
+                    "warning", "llm_scheduler_close_timeout", "The LLM scheduler loop did not stop within 5 s"
+                )
+                return
+            loop.close()
+
+    async def _cancel_tasks(self) -> None:
+        """Cancels every other task on the scheduler loop and waits for them to finish."""
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # --- Public interface ---
+
+    def generate(
+        self,
+        prompt: str,
+        options: Optional[Dict[str, Any]] = None,
+        on_text: Optional[Callable[[str], None]] = None,
+        priority: Optional[int] = None,
+        **fields: Any,
+    ) -> OllamaGeneration:
+        """
+        Blocking generation on the best endpoint (see OllamaClient.generate()).
+
+        on_text is called on the calling thread, in order.
+
+        Raises:
+            OllamaError: If every attempt failed.
+        """
+        priority = _llm_priority.get() if priority is None else priority
+        pieces: Optional[queue.SimpleQueue] = queue.SimpleQueue() if on_text is not None else None
+        future = asyncio.run_coroutine_threadsafe(
+            self._generate(prompt, options, pieces.put if pieces else None, priority, fields),
+            self.loop,
+        )
+        if pieces is not None:
+            future.add_done_callback(lambda _: pieces.put(_DONE))
+            try:
+                for piece in iter(pieces.get, _DONE):
+                    on_text(piece)
+            except BaseException:
+                future.cancel()
+                raise
+        try:
+            return future.result()
+        except concurrent.futures.CancelledError as e:
+            raise OllamaError("Generation was cancelled") from e
+
+    async def agenerate(
+        self,
+        prompt: str,
+        options: Optional[Dict[str, Any]] = None,
+        on_text: Optional[Callable[[str], None]] = None,
+        priority: Optional[int] = None,
+        **fields: Any,
+    ) -> OllamaGeneration:
+        """Async version of generate(); on_text is called on the caller's event loop."""
+        priority = _llm_priority.get() if priority is None else priority
+        caller_loop = asyncio.get_running_loop()
+        forward = None
+        if on_text is not None:
+            if caller_loop is self.loop:
+                forward = on_text
+            else:
+                def forward(text: str) -> None:
+                    caller_loop.call_soon_threadsafe(on_text, text)
+        coroutine = self._generate(prompt, options, forward, priority, fields)
+        if caller_loop is self.loop:
+            return await coroutine
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self.loop))
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-endpoint load and health, queue length and hedging counts."""
+        return {
+            "queued": sum(1 for *_, future, _ in self._waiters if not future.done()),
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            "hedge_after_seconds": self.hedge_delay(),
+            "endpoints": [
+                {
+                    "url": endpoint.url,
+                    "healthy": endpoint.healthy,
+                    "in_flight": endpoint.in_flight,
+                    "completed": endpoint.completed,
+                    "failures": endpoint.failures,
+                    "median_first_token_seconds": endpoint.typical_latency,
+                }
+                for endpoint in self.endpoints
+            ],
+        }
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds without a first token after which a call is hedged, or None if not hedging."""
+        if (
+            self.hedge_percentile is None
+            or len(self.endpoints) < 2
+            or len(self.first_token_seconds) < self.hedge_min_samples
+        ):
+            return None
+        return percentile(self.first_token_seconds, self.hedge_percentile)
+
+    # --- Endpoint selection (scheduler loop only) ---
+
+    def _pick(self, exclude: Sequence[Endpoint] = ()) -> Optional[Endpoint]:
+        """The least-loaded endpoint with a free slot, or None if all are busy."""
+        pool = [endpoint for endpoint in self.endpoints if endpoint not in exclude] or self.endpoints
+        healthy = [endpoint for endpoint in pool if endpoint.healthy] or pool  # All ejected: use all
+        free = [endpoint for endpoint in healthy if endpoint.in_flight < endpoint.max_concurrency]
+        if not free:
+            return None
+        endpoint = min(free, key=lambda candidate: (candidate.load, candidate.typical_latency))
+        endpoint.in_flight += 1
+        return endpoint
+
+    async def _acquire(self, priority: int, exclude: Sequence[Endpoint]) -> Endpoint:
+        if not self._waiters:
+            endpoint = self._pick(exclude)
+            if endpoint is not None:
+                return endpoint
+        future = self.loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future, tuple(exclude)))
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():  # A slot was granted as the caller gave up
+                self._release(future.result())
+            raise
+
+    def _release(self, endpoint: Endpoint) -> None:
+        endpoint.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hands free slots to the waiters, highest priority first."""
+        while self._waiters:
+            _, _, future, exclude = self._waiters[0]
+            if future.done():  # Cancelled while queued
+                heapq.heappop(self._waiters)
+                continue
+            endpoint = self._pick(exclude)
+            if endpoint is None:
+                return
+            heapq.heappop(self._waiters)
+            future.set_result(endpoint)
+
+    def _record_failure(self, endpoint: Endpoint, error: BaseException) -> None:
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.healthy and endpoint.consecutive_failures >= self.eject_after_failures:
+            self._eject(endpoint, f"{endpoint.consecutive_failures} consecutive failures: {error}")
+
+    def _record_success(self, endpoint: Endpoint) -> None:
+        endpoint.completed += 1
+        endpoint.consecutive_failures = 0
+        if not endpoint.healthy:
+            self._readmit(endpoint)
+
+    def _eject(self, endpoint: Endpoint, reason: str) -> None:
+        endpoint.healthy = False
+        telemetry.count("llm_endpoint_ejections_total", endpoint=endpoint.url)
+        telemetry.event(
+            "warning", "llm_endpoint_ejected", f"Ollama endpoint {endpoint.url} ejected after {reason}",
+            endpoint=endpoint.url,
+        )
+
+    def _readmit(self, endpoint: Endpoint) -> None:
+        endpoint.healthy = True
+        endpoint.consecutive_failures = 0
+        self._dispatch()
+
+    async def _health_check_loop(self) -> None:
+        async with httpx.AsyncClient(timeout=self.health_check_timeout) as client:
+            while True:
+                await asyncio.sleep(self.health_check_interval)
+                results = await asyncio.gather(
+                    *(client.get(f"{endpoint.url}/api/tags") for endpoint in self.endpoints),
+                    return_exceptions=True,
+                )
+                for endpoint, result in zip(self.endpoints, results):
+                    ok = not isinstance(result, BaseException) and result.status_code == 200
+                    if ok and not endpoint.healthy:
+                        self._readmit(endpoint)
+                    elif not ok and endpoint.healthy:
+                        reason = result if isinstance(result, BaseException) else f"HTTP {result.status_code}"
+                        self._eject(endpoint, f"a failed health check: {reason}")
+
+    # --- Generation (scheduler loop only) ---
+
+    async def _generate(
+        self,
+        prompt: str,
+        options: Optional[Dict[str, Any]],
+        on_text: Optional[Callable[[str], None]],
+        priority: int,
+        fields: Dict[str, Any],
+    ) -> OllamaGeneration:
+        failed: List[Endpoint] = []
+        last_error: Optional[BaseException] = None
+        for _ in range(self.max_attempts):
+            try:
+                return await self._generate_once(prompt, options, on_text, priority, fields, failed)
+            except _EndpointFailed as e:
+                failed.extend(e.endpoints)
+                last_error = e.error
+        raise OllamaError(f"Generation failed on {len(failed)} endpoint attempts: {last_error}")
+
+    def _start_attempt(self, endpoint, hedge, prompt, options, fields, state, on_text) -> _Attempt:
+        loop = asyncio.get_running_loop()
+        attempt = _Attempt(endpoint, loop.time(), hedge)
+
+        def forward(text: str) -> None:
+            if state["winner"] is None:
+                self._declare_winner(attempt, state)
+            if state["winner"] is attempt and on_text is not None:
+                state["forwarded"] = True
+                on_text(text)
+
+        attempt.task = loop.create_task(
+            endpoint.client.agenerate(prompt, options, on_text=forward, **fields)
+        )
+        # The slot is freed only once the request has really ended (also when cancelled)
+        attempt.task.add_done_callback(lambda _: self._release(endpoint))
+        state["attempts"].append(attempt)
+        return attempt
+
+    def _declare_winner(self, attempt: _Attempt, state: Dict[str, Any]) -> None:
+        state["winner"] = attempt
+        first_token = asyncio.get_running_loop().time() - attempt.started
+        self.first_token_seconds.append(first_token)
+        attempt.endpoint.first_token_seconds.append(first_token)
+        telemetry.observe("llm_first_token_seconds", first_token, endpoint=attempt.endpoint.url)
+        if attempt.hedge:
+            self.hedges_won += 1
+            telemetry.count("llm_hedges_total", result="won")
+        for other in state["attempts"]:
+            if other is not attempt:
+                other.task.cancel()
+
+    async def _generate_once(self, prompt, options, on_text, priority, fields, exclude) -> OllamaGeneration:
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        endpoint = await self._acquire(priority, exclude)
+        telemetry.observe("llm_queue_wait_seconds", loop.time() - queued_at, priority=priority)
+
+        state: Dict[str, Any] = {"winner": None, "attempts": [], "forwarded": False}
+        primary = self._start_attempt(endpoint, False, prompt, options, fields, state, on_text)
+        hedge_delay = self.hedge_delay()
+        hedged = hedge_delay is None
+        errors: List[BaseException] = []
+        try:
+            while True:
+                pending = [attempt for attempt in state["attempts"] if not attempt.task.done()]
+                if not pending:
+                    break
+                timeout = None
+                if not hedged and state["winner"] is None:
+                    timeout = max(0.0, primary.started + hedge_delay - loop.time())
+                done, _ = await asyncio.wait(
+                    [attempt.task for attempt in pending],
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:  # Hedge delay over; tasks only complete at the end of the stream
+                    hedged = True
+                    if state["winner"] is not None or self._waiters:
+                        continue  # Already streaming, or never take a slot from a queued call
+                    hedge_endpoint = self._pick([attempt.endpoint for attempt in state["attempts"]])
+                    if hedge_endpoint is not None and hedge_endpoint is not endpoint:
+                        self.hedges_sent += 1
+                        telemetry.count("llm_hedges_total", result="sent")
+                        self._start_attempt(hedge_endpoint, True, prompt, options, fields, state, on_text)
+                    elif hedge_endpoint is not None:
+                        self._release(hedge_endpoint)
+                    continue
+
+                for attempt in pending:
+                    task = attempt.task
+                    if not task.done() or task.cancelled():
+                        continue
+                    error = task.exception()
+                    if error is None:
+                        if state["winner"] is None:  # Finished without streaming any text
+                            self._declare_winner(attempt, state)
+                        if state["winner"] is attempt:
+                            self._record_success(attempt.endpoint)
+                            telemetry.count("llm_scheduler_calls_total", endpoint=attempt.endpoint.url, result="ok")
+                            telemetry.annotate(endpoint=attempt.endpoint.url, hedged=attempt.hedge)
+                            return task.result()
+                        continue
+                    telemetry.count("llm_scheduler_calls_total", endpoint=attempt.endpoint.url, result="error")
+                    if isinstance(error, OllamaError):
+                        self._record_failure(attempt.endpoint, error)
+                    if state["forwarded"] or not isinstance(error, OllamaError):
+                        raise error  # The caller already has part of the text, or not an endpoint problem
+                    if state["winner"] is attempt:
+                        state["winner"] = None  # Broke off before any text reached the caller
+                    errors.append(error)
+        finally:
+            for attempt in state["attempts"]:
+                attempt.task.cancel()
+        error = errors[-1] if errors else OllamaError("No attempt completed")
+        raise _EndpointFailed([attempt.endpoint for attempt in state["attempts"]], error)
+
+
+def _default_scheduler() -> OllamaScheduler:
+    # The shared ollama_client stays the first endpoint, so reconfiguring it still takes effect
+    clients = [ollama_client] + [OllamaClient(url, max_retries=0) for url in OLLAMA_EXTRA_BASE_URLS]
+    return OllamaScheduler(clients)
+
+
+# Shared scheduler over OLLAMA_BASE_URL and OLLAMA_EXTRA_BASE_URLS - the loop starts on first use
+llm_scheduler = _default_scheduler()
+atexit.register(llm_scheduler.close)
@@ -0,0 +1,382 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from internal.utils.constants import (
+    OLLAMA_BACKOFF_SECONDS,
+    OLLAMA_BASE_URL,
+    OLLAMA_CONNECT_TIMEOUT_SECONDS,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_MAX_RETRIES,
+    OLLAMA_MODEL,
+    OLLAMA_POOL_SIZE,
+    OLLAMA_READ_TIMEOUT_SECONDS,
+)
+from internal.utils.telemetry import telemetry
+
+# Statuses worth retrying: rate limited, or the server is (re)loading the model
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+# Port of an Ollama server URL given without a scheme, e.g. "gpu1"
+OLLAMA_DEFAULT_PORT = 11434
+
+
+def normalize_base_url(url: str) -> str:
+    """
+    A server URL from the host forms that OLLAMA_HOST also accepts: a missing
+    scheme becomes http:// (with the default port if none is given), and the
+    bind-all addresses 0.0.0.0 and :: become localhost.
+    "0.0.0.0" -> "http://localhost:11434", "gpu1:8080/" -> "http://gpu1:8080"
+    """
+    url = url.strip().rstrip("/")
+    if "://" not in url:
+        parts = urlsplit(f"http://{url}")
+        if parts.port is None:
+            parts = parts._replace(netloc=f"{parts.netloc}:{OLLAMA_DEFAULT_PORT}")
+    else:
+        parts = urlsplit(url)
+    if parts.hostname in ("0.0.0.0", "::"):
+        netloc = "localhost" if parts.port is None else f"localhost:{parts.port}"
+        parts = parts._replace(netloc=netloc)
+    return parts.geturl()
+
+
+class OllamaError(Exception):
+    """Raised when a generation fails after all retries."""
+
+
+@dataclass
+class OllamaGeneration:
+    """Result of one /api/generate call."""
+
+    text: str
+    stats: Dict[str, Any] = field(default_factory=dict)  # Final chunk: eval_count, durations, ...
+
+    @property
+    def context(self) -> Optional[List[int]]:
+        return self.stats.get("context")
+
+    @property
+    def prompt_tokens(self) -> Optional[int]:
+        """Tokens of the whole prompt; the returned context holds the prompt and the response."""
+        context, eval_count = self.context, self.stats.get("eval_count")
+        if context is None or eval_count is None:
+            return None
+        return max(0, len(context) - eval_count)
+
+    @property
+    def cached_prompt_tokens(self) -> Optional[int]:
+        """Prompt tokens the server reused from its KV cache (prompt_eval_count only counts evaluated ones)."""
+        prompt_tokens, evaluated = self.prompt_tokens, self.stats.get("prompt_eval_count")
+        if prompt_tokens is None or evaluated is None:
+            return None
+        return max(0, prompt_tokens - evaluated)
+
+    @property
+    def prompt_eval_seconds_saved(self) -> Optional[float]:
+        """Estimated prompt evaluation time the cache saved, at this call's evaluation speed."""
+        cached = self.cached_prompt_tokens
+        evaluated = self.stats.get("prompt_eval_count")
+        duration = self.stats.get("prompt_eval_duration")
+        if cached is None or not evaluated or not duration:
+            return None
+        return cached * duration / evaluated / 1e9
+
+
+class OllamaClient:
+    """
+    Reusable client for the Ollama /api/generate (and /api/embed) endpoints.
+
+    The sync interface uses a pooled keep-alive requests.Session and the async
+    interface a pooled httpx.AsyncClient, so repeated generations reuse TCP
+    connections and several can be in flight against one server. Every call has
+    connect/read timeouts, bounded retries with exponential backoff for
+    connection errors and retryable statuses, and sends keep_alive so the
+    model stays loaded between calls.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OLLAMA_BASE_URL,
+        model: str = OLLAMA_MODEL,
+        connect_timeout: float = OLLAMA_CONNECT_TIMEOUT_SECONDS,
+        read_timeout: float = OLLAMA_READ_TIMEOUT_SECONDS,
+        max_retries: int = OLLAMA_MAX_RETRIES,
+        backoff_seconds: float = OLLAMA_BACKOFF_SECONDS,
+        keep_alive: Optional[str] = OLLAMA_KEEP_ALIVE,
+        pool_size: int = OLLAMA_POOL_SIZE,
+    ) -> None:
+        """
+        Args:
+            base_url: Server URL, e.g. "http://localhost:11434" (see normalize_base_url).
+            model: Model name sent with every request.
+            connect_timeout: Seconds to wait for a connection.
+            read_timeout: Seconds to wait between streamed chunks.
+            max_retries: Retries after the first attempt (0 disables retrying).
+            backoff_seconds: Base delay, doubled after every failed attempt.
+            keep_alive: How long the server keeps the model loaded (e.g. "30m"), or None for the server default.
+            pool_size: Maximum pooled connections (and concurrent async requests).
+        """
+        self.base_url = normalize_base_url(base_url)
+        self.model = model
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.keep_alive = keep_alive
+        self.pool_size = pool_size
+        self._session: Optional[requests.Session] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def generate_url(self) -> str:
+        return f"{self.base_url}/api/generate"
+
+    def build_payload(
+        self, prompt: str, options: Optional[Dict[str, Any]] = None, **fields: Any
+    ) -> Dict[str, Any]:
+        """Builds the /api/generate request body; extra fields (format, context, ...) are passed through."""
+        payload: Dict[str, Any] = {"model": self.model, "prompt": prompt, "stream": True}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        if options:
+            payload["options"] = options
+        payload.update(fields)
+        return payload
+
+    def _backoff(self, attempt: int) -> float:
+        return self.backoff_seconds * (2**attempt)
+
+    @staticmethod
+    def _handle_line(line: Any, text_parts: List[str], stats: Dict[str, Any], on_text) -> None:
+        if not line:
+            return
+        try:
+            chunk = json.loads(line)
+        except json.JSONDecodeError:
+            telemetry.event("warning", "ollama_bad_json_line", f"Could not decode JSON line: {line}")
+            return
+        if "error" in chunk:
+            raise OllamaError(f"Ollama returned an error: {chunk['error']}")
+        if chunk.get("response"):
+            text_parts.append(chunk["response"])
+            if on_text is not None:
+                on_text(chunk["response"])
+        if chunk.get("done"):
+            stats.update((key, value) for key, value in chunk.items() if key != "response")
+
+    @classmethod
+    def _collect(cls, lines: Iterable[Any], on_text=None) -> OllamaGeneration:
+        text_parts: List[str] = []
+        stats: Dict[str, Any] = {}
+        for line in lines:
+            cls._handle_line(line, text_parts, stats, on_text)
+        return OllamaGeneration("".join(text_parts), stats)
+
+    # --- Sync interface ---
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    def generate(
+        self,
+        prompt: str,
+        options: Optional[Dict[str, Any]] = None,
+        on_text: Optional[Callable[[str], None]] = None,
+        **fields: Any,
+    ) -> OllamaGeneration:
+        """
+        Runs a streamed generation and returns the full response text and final stats.
+
+        on_text, if given, is called with every streamed piece of text as it arrives.
+        Retries only happen before any text was streamed.
+
+        Raises:
+            OllamaError: If the request still fails after max_retries retries.
+        """
+        payload = self.build_payload(prompt, options, **fields)
+        streamed = False
+
+        def forward_text(text: str) -> None:
+            nonlocal streamed
+            streamed = True
+            if on_text is not None:
+                on_text(text)
+
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._backoff(attempt - 1))
+            try:
+                with self.session.post(
+                    self.generate_url,
+                    json=payload,
+                    stream=True,
+                    timeout=(self.connect_timeout, self.read_timeout),
+                ) as response:
+                    if response.status_code in RETRYABLE_STATUS_CODES:
+                        last_error = OllamaError(f"Ollama returned HTTP {response.status_code}")
+                        continue
+                    response.raise_for_status()
+                    # chunk_size=None hands over each line as soon as it arrives
+                    return self._collect(response.iter_lines(chunk_size=None), forward_text)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if streamed:  # Retrying would replay text the caller already received
+                    raise OllamaError(f"Stream from {self.generate_url} broke off: {e}") from e
+                last_error = e
+            except requests.RequestException as e:
+                raise OllamaError(f"Request to {self.generate_url} failed: {e}") from e
+        raise OllamaError(
+            f"Request to {self.generate_url} failed after {self.max_retries + 1} attempts: {last_error}"
+        )
+
+    def embed(self, texts: List[str], model: str) -> List[List[float]]:
+        """
+        Returns one embedding per text from /api/embed, with the same retries as generate().
+
+        Args:
+            texts: The texts to embed.
+            model: The embedding model (e.g. "nomic-embed-text"), which need not be self.model.
+
+        Raises:
+            OllamaError: If the request still fails after max_retries retries.
+        """
+        url = f"{self.base_url}/api/embed"
+        payload: Dict[str, Any] = {"model": model, "input": list(texts)}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._backoff(attempt - 1))
+            try:
+                response = self.session.post(
+                    url, json=payload, timeout=(self.connect_timeout, self.read_timeout)
+                )
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    last_error = OllamaError(f"Ollama returned HTTP {response.status_code}")
+                    continue
+                response.raise_for_status()
+                body = response.json()
+                if "error" in body:
+                    raise OllamaError(f"Ollama returned an error: {body['error']}")
+                return body["embeddings"]
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = e
+            except (requests.RequestException, ValueError, KeyError) as e:
+                raise OllamaError(f"Request to {url} failed: {e}") from e
+        raise OllamaError(f"Request to {url} failed after {self.max_retries + 1} attempts: {last_error}")
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    # --- Async interface ---
+
+    async def _get_async_client(self) -> httpx.AsyncClient:
+        # An httpx.AsyncClient is tied to the event loop it first ran on
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client_loop is not loop:
+            previous, previous_loop = self._async_client, self._async_client_loop
+            self._async_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    connect=self.connect_timeout,
+                    read=self.read_timeout,
+                    write=self.connect_timeout,
+                    pool=None,  # Callers queue for a pooled connection
+                ),
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+            )
+            self._async_client_loop = loop
+            if previous is not None:
+                await self._close_async_client(previous, previous_loop)
+        return self._async_client
+
+    @staticmethod
+    async def _close_async_client(client: httpx.AsyncClient, client_loop: asyncio.AbstractEventLoop) -> None:
+        """Closes a client left behind by another event loop, on that loop if it is still open."""
+        if not client_loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), client_loop)
+            return
+        try:
+            await client.aclose()
+        except RuntimeError:
+            pass  # Its connections belong to the closed loop; the sockets are freed with them
+
+    async def agenerate(
+        self,
+        prompt: str,
+        options: Optional[Dict[str, Any]] = None,
+        on_text: Optional[Callable[[str], None]] = None,
+        **fields: Any,
+    ) -> OllamaGeneration:
+        """
+        Async version of generate(); many calls can share the pooled connections.
+
+        Raises:
+            OllamaError: If the request still fails after max_retries retries.
+        """
+        payload = self.build_payload(prompt, options, **fields)
+        client = await self._get_async_client()
+        streamed = False
+
+        def forward_text(text: str) -> None:
+            nonlocal streamed
+            streamed = True
+            if on_text is not None:
+                on_text(text)
+
+        last_error: Optional[Exception] = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._backoff(attempt - 1))
+            try:
+                async with client.stream("POST", self.generate_url, json=payload) as response:
+                    if response.status_code in RETRYABLE_STATUS_CODES:
+                        last_error = OllamaError(f"Ollama returned HTTP {response.status_code}")
+                        continue
+                    response.raise_for_status()
+                    text_parts: List[str] = []
+                    stats: Dict[str, Any] = {}
+                    async for line in response.aiter_lines():
+                        self._handle_line(line, text_parts, stats, forward_text)
+                return OllamaGeneration("".join(text_parts), stats)
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                if streamed:  # Retrying would replay text the caller already received
+                    raise OllamaError(f"Stream from {self.generate_url} broke off: {e}") from e
+                last_error = e
+            except httpx.HTTPError as e:
+                raise OllamaError(f"Request to {self.generate_url} failed: {e}") from e
+        raise OllamaError(
+            f"Request to {self.generate_url} failed after {self.max_retries + 1} attempts: {last_error}"
+        )
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_client_loop = None
+
+
+# Shared client instance - connections are opened on first use
+ollama_client = OllamaClient()
@@ -0,0 +1,176 @@
+import string
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from internal.utils.constants import (
+    ITEM_CONDITION_ID_TO_NAME_MAP,
+    OLLAMA_CONTEXT_TOKENS,
+    PROMPT_MAX_TITLE_CHARS,
+    PROMPT_RESERVED_OUTPUT_TOKENS,
+    PROMPT_SAFETY_MARGIN_TOKENS,
+)
+
+ITEM_TABLE_COLUMNS = ("item_id", "price_yen", "condition", "title")
+ITEM_TABLE_DELIMITER = "|"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate for Llama-style BPE vocabularies: about four ASCII
+    characters per token, and one token per non-ASCII (e.g. Japanese) character.
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return (len(text) - non_ascii + 3) // 4 + non_ascii
+
+
+def trim_title(title: str, max_chars: int = PROMPT_MAX_TITLE_CHARS) -> str:
+    """Collapses whitespace, drops the delimiter and shortens the title to max_chars."""
+    title = " ".join((title or "").replace(ITEM_TABLE_DELIMITER, "/").split())
+    if len(title) > max_chars:
+        title = title[: max_chars - 1].rstrip() + "…"
+    return title
+
+
+def format_item_row(item: Any, max_title_chars: int = PROMPT_MAX_TITLE_CHARS) -> str:
+    """One delimited table row: item_id|price_yen|condition|title."""
+    condition_name = ITEM_CONDITION_ID_TO_NAME_MAP.get(item.item_condition_id, "Unknown")
+    return ITEM_TABLE_DELIMITER.join(
+        (str(item.id_), str(item.price), condition_name, trim_title(item.name, max_title_chars))
+    )
+
+
+@dataclass
+class BuiltPrompt:
+    """A formatted prompt and what went into it."""
+
+    text: str
+    estimated_tokens: int
+    items_block: str = ""  # The serialised item table (empty without items)
+    item_count: int = 0  # Items that fit into the budget
+    items_dropped: int = 0  # Items left out to stay within the budget
+    static_prefix_tokens: int = 0  # Leading tokens identical for every call of the template
+
+
+def static_prefix(template: str) -> str:
+    """The template text before its first placeholder: the part the server can keep cached."""
+    for literal_text, field_name, _, _ in string.Formatter().parse(template):
+        return literal_text if field_name is not None else template
+    return ""
+
+
+class PromptBuilder:
+    """
+    Formats prompt templates within the model's context window.
+
+    The token budget is the context size minus the room reserved for the
+    response and a safety margin. Items are serialised as a compact table (the
+    column header once, then one delimited row per item, titles trimmed) and
+    added in the given order until the next row would exceed the budget, so
+    items should be passed best first. Used for both the parameter extraction
+    and the recommendation prompt.
+
+    Templates should put their variable fields last: only the text before the
+    first placeholder is identical across calls, and that prefix is what
+    Ollama can reuse from its KV cache instead of evaluating it again.
+    """
+
+    def __init__(
+        self,
+        context_tokens: int = OLLAMA_CONTEXT_TOKENS,
+        reserved_output_tokens: int = PROMPT_RESERVED_OUTPUT_TOKENS,
+        safety_margin_tokens: int = PROMPT_SAFETY_MARGIN_TOKENS,
+        max_title_chars: int = PROMPT_MAX_TITLE_CHARS,
+    ) -> None:
+        """
+        Args:
+            context_tokens: The model's context size (Ollama's num_ctx).
+            reserved_output_tokens: Tokens kept free for the generated response.
+            safety_margin_tokens: Slack for the approximate token estimate.
+            max_title_chars: Item titles longer than this are trimmed.
+        """
+        self.context_tokens = context_tokens
+        self.reserved_output_tokens = reserved_output_tokens
+        self.safety_margin_tokens = safety_margin_tokens
+        self.max_title_chars = max_title_chars
+        self._template_tokens: Dict[str, int] = {}
+        self._prefix_tokens: Dict[str, int] = {}
+
+    @property
+    def prompt_budget(self) -> int:
+        """Maximum estimated tokens for a formatted prompt."""
+        return self.context_tokens - self.reserved_output_tokens - self.safety_margin_tokens
+
+    def _estimate_template(self, template: str) -> int:
+        if template not in self._template_tokens:
+            self._template_tokens[template] = estimate_tokens(template)
+        return self._template_tokens[template]
+
+    def static_prefix_tokens(self, template: str) -> int:
+        """Estimated tokens of the template's static prefix (see static_prefix())."""
+        if template not in self._prefix_tokens:
+            self._prefix_tokens[template] = estimate_tokens(static_prefix(template))
+        return self._prefix_tokens[template]
+
+    def build_items_block(self, items: Sequence[Any], token_budget: int) -> Tuple[str, int, int]:
+        """
+        Serialises as many items as fit into token_budget.
+
+        Returns:
+            (items_block, item_count, estimated_tokens)
+        """
+        header = (
+            "Mercari search results, one item per line"
+            f" ({ITEM_TABLE_DELIMITER.join(ITEM_TABLE_COLUMNS)}):"
+        )
+        lines: List[str] = [header]
+        used = estimate_tokens(header) + 1
+        for item in items:
+            row = format_item_row(item, self.max_title_chars)
+            row_tokens = estimate_tokens(row) + 1  # + newline
+            if used + row_tokens > token_budget:
+                break
+            lines.append(row)
+            used += row_tokens
+        return "\n".join(lines), len(lines) - 1, used
+
+    def build(
+        self,
+        template: str,
+        items: Optional[Sequence[Any]] = None,
+        items_placeholder: str = "search_results_placeholder",
+        **variables: str,
+    ) -> BuiltPrompt:
+        """
+        Formats template with variables and, if items are given, the item table.
+
+        Args:
+            template: A prompt template such as PARAM_EXTRACTION_PROMPT or RECOMMENDATION_PROMPT.
+            items: (Optional) Items to serialise into items_placeholder, best first.
+            items_placeholder: Name of the template field that receives the item table.
+            **variables: The other template fields (e.g. user_request).
+
+        Returns:
+            A BuiltPrompt with the text and its estimated token count.
+        """
+        fixed_tokens = self._estimate_template(template) + sum(
+            estimate_tokens(str(value)) for value in variables.values()
+        )
+        items_block, item_count = "", 0
+        if items is not None:
+            items_block, item_count, _ = self.build_items_block(
+                items, self.prompt_budget - fixed_tokens
+            )
+            variables[items_placeholder] = items_block
+        text = template.format(**variables)
+        return BuiltPrompt(
+            text=text,
+            estimated_tokens=estimate_tokens(text),
+            items_block=items_block,
+            item_count=item_count,
+            items_dropped=len(items) - item_count if items is not None else 0,
+            static_prefix_tokens=self.static_prefix_tokens(template),
+        )
+
+
+# Shared builder for the configured model context
+prompt_builder = PromptBuilder()
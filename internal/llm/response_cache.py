@@ -0,0 +1,208 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from internal.utils.constants import (
+    LLM_CACHE_MAX_DISK_ENTRIES,
+    LLM_CACHE_MAX_MEMORY_ENTRIES,
+    LLM_CACHE_PATH,
+    LLM_CACHE_TTL_SECONDS,
+)
+from internal.utils.telemetry import telemetry
+from internal.utils.text_utils import normalize_text
+
+
+def prompt_template_hash(prompt_template: str) -> str:
+    """Short stable hash of a prompt template, so editing a prompt invalidates its entries."""
+    return hashlib.sha256(prompt_template.encode("utf-8")).hexdigest()[:16]
+
+
+def make_cache_key(
+    user_request_text: str,
+    prompt_template: str,
+    model: str,
+    sampling_params: Dict[str, Any],
+    prompt_variables: str = "",
+) -> str:
+    """
+    Builds the cache key for one LLM generation.
+
+    Args:
+        user_request_text: The user's request, normalised for width, case and whitespace.
+        prompt_template: The unformatted prompt (e.g. PARAM_EXTRACTION_PROMPT).
+        model: The model name.
+        sampling_params: Generation parameters (temperature, limits, ...).
+        prompt_variables: Any other text substituted into the prompt (e.g. search results).
+
+    Returns:
+        A hex digest identifying the generation.
+    """
+    key_material = json.dumps(
+        [
+            normalize_text(user_request_text),
+            prompt_template_hash(prompt_template),
+            model,
+            sampling_params,
+            prompt_variables,
+        ],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache for LLM responses: an in-memory LRU in front of a SQLite store.
+
+    Entries expire after ttl_seconds in both tiers. The memory tier holds at most
+    max_memory_entries and the disk tier at most max_disk_entries; the least
+    recently used entries are evicted first. The database is opened on first use
+    and may be shared by several processes.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str],
+        ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+        max_memory_entries: int = LLM_CACHE_MAX_MEMORY_ENTRIES,
+        max_disk_entries: int = LLM_CACHE_MAX_DISK_ENTRIES,
+    ) -> None:
+        """
+        Args:
+            db_path: Path of the SQLite file, or None for a memory-only cache.
+            ttl_seconds: Time to live of an entry.
+            max_memory_entries: Capacity of the in-memory LRU.
+            max_disk_entries: Capacity of the SQLite store.
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _db(self) -> Optional[sqlite3.Connection]:
+        if self._connection is None and self.db_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+                connection = sqlite3.connect(self.db_path, check_same_thread=False)
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_responses ("
+                    " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                    " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                connection.execute(
+                    "CREATE INDEX IF NOT EXISTS llm_responses_accessed_at"
+                    " ON llm_responses (accessed_at)"
+                )
+                connection.commit()
+                self._connection = connection
+            except sqlite3.Error as e:
+                telemetry.event(
+                    "warning",
+                    "llm_cache_db_unavailable",
+                    f"LLM cache database '{self.db_path}' unavailable, using memory only: {e}",
+                )
+                self.db_path = None
+        return self._connection
+
+    def _remember(self, key: str, value: str, expires_at: float) -> None:
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached response for key, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+            db = self._db()
+            if db is not None:
+                try:
+                    row = db.execute(
+                        "SELECT value, expires_at FROM llm_responses WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None and row[1] > now:
+                        db.execute(
+                            "UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key)
+                        )
+                        db.commit()
+                        self._remember(key, row[0], row[1])
+                        self.disk_hits += 1
+                        return row[0]
+                except sqlite3.Error as e:
+                    telemetry.event("warning", "llm_cache_read_failed", f"LLM cache read failed: {e}")
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: str) -> None:
+        """Stores value under key in both tiers, evicting the least recently used entries."""
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._remember(key, value, expires_at)
+            db = self._db()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO llm_responses VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now),
+                )
+                db.execute("DELETE FROM llm_responses WHERE expires_at <= ?", (now,))
+                (count,) = db.execute("SELECT COUNT(*) FROM llm_responses").fetchone()
+                if count > self.max_disk_entries:
+                    db.execute(
+                        "DELETE FROM llm_responses WHERE key IN ("
+                        " SELECT key FROM llm_responses ORDER BY accessed_at LIMIT ?)",
+                        (count - self.max_disk_entries,),
+                    )
+                    self.evictions += count - self.max_disk_entries
+                db.commit()
+            except sqlite3.Error as e:
+                telemetry.event("warning", "llm_cache_write_failed", f"LLM cache write failed: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            db = self._db()
+            if db is not None:
+                db.execute("DELETE FROM llm_responses")
+                db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters; hit_rate covers both tiers."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+
+# Shared cache instance - the database is only opened on first use
+llm_response_cache = LLMResponseCache(LLM_CACHE_PATH)
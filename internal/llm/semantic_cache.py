@@ -0,0 +1,513 @@
+import atexit
+import io
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+
+from internal.llm.ollama_client import OllamaError, ollama_client
+from internal.parameter_matching.facets_config import config
+from internal.parameter_matching.parameter_matcher import MAX_AMBIGUOUS_CATEGORY_MATCHES
+from internal.utils.constants import (
+    ENG_TO_JPN_CATEGORY_MAP,
+    HASHING_ENCODER_DIMENSIONS,
+    OLLAMA_EMBEDDING_MODEL,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_ENCODER,
+    SEMANTIC_CACHE_EXACT_SEARCH_MAX_ENTRIES,
+    SEMANTIC_CACHE_LSH_BITS,
+    SEMANTIC_CACHE_LSH_TABLES,
+    SEMANTIC_CACHE_MAX_ENTRIES,
+    SEMANTIC_CACHE_PATH,
+    SEMANTIC_CACHE_SAVE_EVERY,
+    SEMANTIC_CACHE_THRESHOLDS,
+    SEMANTIC_CACHE_TTL_SECONDS,
+)
+from internal.utils.telemetry import telemetry
+from internal.utils.text_utils import fold_text, normalize_text
+
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+# Latin words (with apostrophes), and runs of hiragana, katakana or kanji
+_WORD_RE = re.compile(r"[a-z]+(?:['’][a-z]+)*|[\u3041-\u309f]+|[\u30a0-\u30ff]+|[\u3400-\u9fff\u3005]+")
+# Facet values compared by facet_signature(), with their prefix in the signature
+_FACET_VALUE_PARAMETERS = {"item_conditions": "condition", "sizes": "size", "colors": "color"}
+_RECENT_VECTORS = 64  # Encoded requests remembered between lookup() and store()
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def number_signature(text: str) -> str:
+    """
+    The numbers in a request, e.g. "5000" for "switch under 5,000 yen".
+
+    Requests that differ only in a price or a model number embed almost
+    identically, so reuse also requires equal number signatures.
+    """
+    numbers = {number.replace(",", "") for number in _NUMBER_RE.findall(fold_text(text))}
+    return "|".join(sorted(numbers))
+
+
+def facet_signature(text: str) -> str:
+    """
+    The facets a request names, found with the facet matchers: brands (in
+    the sorted words), category names, and condition, size and color names
+    (words and word pairs). "mens jacket size L" -> "category:30|size:3"
+
+    A brand, size, color or condition moves an embedding only a little
+    ("size L" and "size S" are almost the same text), so reuse also requires
+    equal facet signatures. Other words may differ: paraphrases and
+    translations reuse each other when the embeddings agree.
+    """
+    words = [normalize_text(word).replace("'", "").replace("’", "") for word in _WORD_RE.findall(fold_text(text))]
+    phrases = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    # Words in sorted order, so that overlapping brand names ("nintendo switch", "switch lite") resolve
+    # the same way whatever the word order
+    brand_matches = config.brand_matcher.find_in_text(" ".join(sorted(set(words))))
+    facets = {f"brand:{match.brand_id}" for match in brand_matches}
+    tree = config.category_tree
+    for word in words:
+        rows = tree.resolve(ENG_TO_JPN_CATEGORY_MAP.get(word, word))
+        if len(rows) <= MAX_AMBIGUOUS_CATEGORY_MATCHES:
+            facets.update(f"category:{tree.ids[row]}" for row in rows)
+    for parameter, prefix in _FACET_VALUE_PARAMETERS.items():
+        ids, _ = config.facet_value_matcher.match(parameter, phrases)
+        facets.update(f"{prefix}:{facet_id}" for facet_id in ids)
+    return "|".join(sorted(facets))
+
+
+class HashingEncoder:
+    """
+    Local encoder without a model: character 2/3-grams of the normalised text,
+    hashed into a fixed number of signed dimensions.
+
+    Catches paraphrases that share most of their characters (word order,
+    width, kana, small additions). It cannot match across languages; use an
+    embedding model for that.
+    """
+
+    def __init__(
+        self, dimensions: int = HASHING_ENCODER_DIMENSIONS, ngram_sizes: Sequence[int] = (2, 3)
+    ) -> None:
+        self.dimensions = dimensions
+        self.ngram_sizes = tuple(ngram_sizes)
+        self.name = f"hashing-{dimensions}-{'-'.join(map(str, self.ngram_sizes))}"
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            text = f" {normalize_text(text)} "
+            for size in self.ngram_sizes:
+                for start in range(len(text) - size + 1):
+                    digest = zlib.crc32(text[start : start + size].encode("utf-8"))
+                    matrix[row, digest % self.dimensions] += 1.0 if digest & 0x80000000 else -1.0
+        return _normalize_rows(matrix)
+
+
+class OllamaEmbeddingEncoder:
+    """Embeds requests with a local Ollama embedding model (/api/embed)."""
+
+    def __init__(self, client: Any = None, model: str = OLLAMA_EMBEDDING_MODEL) -> None:
+        """
+        Args:
+            client: (Optional) OllamaClient to use instead of the shared ollama_client.
+            model: Embedding model; pull it first (`ollama pull nomic-embed-text`).
+        """
+        self.client = client or ollama_client
+        self.model = model
+        self.name = f"ollama-{model}"
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        embeddings = self.client.embed(list(texts), self.model)
+        return _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+
+
+def make_encoder(kind: str = SEMANTIC_CACHE_ENCODER) -> Any:
+    """Creates the encoder named in SEMANTIC_CACHE_ENCODER ("ollama" or "hashing")."""
+    if kind == "hashing":
+        return HashingEncoder()
+    if kind == "ollama":
+        return OllamaEmbeddingEncoder()
+    raise ValueError(f"Unknown semantic cache encoder: {kind!r}")
+
+
+@dataclass
+class SemanticCacheHit:
+    value: str  # The stored response (the extraction JSON)
+    similarity: float  # Cosine similarity to the stored request
+    text: str  # The stored request that matched
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache from request embeddings to extracted parameters.
+
+    Vectors (unit length) are rows of one NumPy matrix. Up to
+    exact_search_max_entries entries, a lookup scans the whole matrix with
+    one matrix-vector product; above that, random-hyperplane LSH (lsh_tables
+    tables of lsh_bits bits) selects the candidate rows first. A lookup hits
+    when the best candidate in the same namespace (model and prompt) is at
+    least `threshold` similar, has not expired, and mentions the same numbers
+    and facets (see number_signature() and facet_signature()).
+
+    At most max_entries are kept; a new entry replaces an expired one or else
+    the least recently used. The cache is loaded from `path` on first use and
+    written back every save_every new entries and at exit; a file written by
+    a different encoder is ignored. If the encoder fails (e.g. the embedding
+    model is not pulled), that request skips the cache with a warning and
+    counts in encoder_errors.
+    """
+
+    def __init__(
+        self,
+        encoder: Any,
+        path: Optional[str] = None,
+        threshold: float = SEMANTIC_CACHE_THRESHOLDS["hashing"],
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS,
+        lsh_tables: int = SEMANTIC_CACHE_LSH_TABLES,
+        lsh_bits: int = SEMANTIC_CACHE_LSH_BITS,
+        exact_search_max_entries: int = SEMANTIC_CACHE_EXACT_SEARCH_MAX_ENTRIES,
+        save_every: int = SEMANTIC_CACHE_SAVE_EVERY,
+        enabled: bool = True,
+        seed: int = 0,
+    ) -> None:
+        """
+        Args:
+            encoder: Object with a `name` and encode(texts) -> unit vectors (rows).
+            path: (Optional) .npz file the cache is persisted to.
+            threshold: Minimum cosine similarity for a hit.
+            max_entries: Capacity of the cache.
+            ttl_seconds: Time to live of an entry.
+            lsh_tables: Number of LSH hash tables.
+            lsh_bits: Hyperplanes (bits) per table.
+            exact_search_max_entries: Up to this many entries, scan all rows instead of using LSH.
+            save_every: New entries between writes to path.
+            enabled: If False, lookups miss and nothing is stored.
+            seed: Seed of the LSH hyperplanes.
+        """
+        self.encoder = encoder
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lsh_tables = lsh_tables
+        self.lsh_bits = lsh_bits
+        self.exact_search_max_entries = exact_search_max_entries
+        self.save_every = save_every
+        self.enabled = enabled
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._unsaved = 0
+        self._recent: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._reset()
+        self.hits = 0
+        self.misses = 0
+        self.guarded = 0  # Similar enough, but the numbers or facets differed
+        self.evictions = 0
+        self.encoder_errors = 0
+
+    def _reset(self) -> None:
+        self._vectors: Optional[np.ndarray] = None  # capacity x dimensions
+        self._expires_at = np.zeros(0)
+        self._accessed_at = np.zeros(0)
+        self._texts: List[str] = []
+        self._values: List[str] = []
+        self._namespaces: List[str] = []
+        self._numbers: List[str] = []
+        self._facets: List[str] = []
+        self._planes: Optional[np.ndarray] = None  # tables x bits x dimensions
+        self._buckets: List[Dict[int, Set[int]]] = []
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    # --- Encoding ---
+
+    def encode(self, text: str) -> Optional[np.ndarray]:
+        """The request's unit vector (remembered briefly, so lookup() then store() encode once)."""
+        with self._lock:
+            vector = self._recent.get(text)
+        if vector is not None:
+            return vector
+        try:
+            vector = self.encoder.encode([text])[0]
+        except (OllamaError, OSError, ValueError) as e:
+            # Only this request goes without the cache; the encoder may be back for the next one
+            with self._lock:
+                self.encoder_errors += 1
+            telemetry.count("semantic_cache_encoder_errors_total", encoder=self.encoder.name)
+            telemetry.event(
+                "warning",
+                "semantic_cache_encoder_error",
+                f"Semantic cache skipped, encoder {self.encoder.name} failed: {e}",
+                encoder_errors=self.encoder_errors,
+            )
+            return None
+        with self._lock:
+            self._recent[text] = vector
+            while len(self._recent) > _RECENT_VECTORS:
+                self._recent.popitem(last=False)
+        return vector
+
+    # --- Index ---
+
+    def _ensure_index(self, dimensions: int) -> None:
+        if self._vectors is not None:
+            return
+        self._vectors = np.zeros((min(self.max_entries, 64), dimensions), dtype=np.float32)
+        self._expires_at = np.zeros(len(self._vectors))
+        self._accessed_at = np.zeros(len(self._vectors))
+        rng = np.random.default_rng(self.seed)
+        self._planes = rng.standard_normal((self.lsh_tables, self.lsh_bits, dimensions)).astype(np.float32)
+        self._buckets = [{} for _ in range(self.lsh_tables)]
+
+    def _codes(self, vectors: np.ndarray) -> np.ndarray:
+        """LSH bucket code of every vector in every table (rows x tables)."""
+        bits = np.einsum("tbd,nd->ntb", self._planes, vectors) > 0
+        return bits @ (1 << np.arange(self.lsh_bits))
+
+    def _index_slot(self, slot: int, add: bool) -> None:
+        for table, code in enumerate(self._codes(self._vectors[slot : slot + 1])[0]):
+            bucket = self._buckets[table].setdefault(int(code), set())
+            if add:
+                bucket.add(slot)
+            else:
+                bucket.discard(slot)
+
+    def _grow(self) -> None:
+        capacity = min(self.max_entries, 2 * len(self._vectors))
+        extra = capacity - len(self._vectors)
+        self._vectors = np.vstack([self._vectors, np.zeros((extra, self._vectors.shape[1]), np.float32)])
+        self._expires_at = np.concatenate([self._expires_at, np.zeros(extra)])
+        self._accessed_at = np.concatenate([self._accessed_at, np.zeros(extra)])
+
+    def _candidates(self, vector: np.ndarray) -> np.ndarray:
+        size = len(self._texts)
+        if size <= self.exact_search_max_entries:
+            return np.arange(size)
+        slots: Set[int] = set()
+        for table, code in enumerate(self._codes(vector[None, :])[0]):
+            slots.update(self._buckets[table].get(int(code), ()))
+        return np.fromiter(slots, dtype=np.int64, count=len(slots))
+
+    # --- Lookup and store ---
+
+    def lookup(
+        self, text: str, namespace: str = "", vector: Optional[np.ndarray] = None
+    ) -> Optional[SemanticCacheHit]:
+        """
+        Returns the stored response of the most similar earlier request, or None.
+
+        Args:
+            text: The request.
+            namespace: Only entries stored under the same namespace can match.
+            vector: (Optional) The request's vector, if already encoded.
+        """
+        if not self.enabled:
+            return None
+        self._load()
+        if vector is None:
+            vector = self.encode(text)
+            if vector is None:
+                return None
+        now = time.time()
+        with self._lock:
+            hit = None
+            if self._vectors is not None and len(self._texts):
+                candidates = self._candidates(vector)
+                if len(candidates):
+                    similarities = self._vectors[candidates] @ vector
+                    usable = (self._expires_at[candidates] > now) & np.fromiter(
+                        (self._namespaces[slot] == namespace for slot in candidates), bool, len(candidates)
+                    )
+                    similarities = np.where(usable, similarities, -1.0)
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.threshold:
+                        slot = int(candidates[best])
+                        same_numbers = self._numbers[slot] == number_signature(text)
+                        if same_numbers and self._facets[slot] == facet_signature(text):
+                            self._accessed_at[slot] = now
+                            hit = SemanticCacheHit(
+                                self._values[slot], float(similarities[best]), self._texts[slot]
+                            )
+                        else:
+                            self.guarded += 1
+            result = "hit" if hit is not None else "miss"
+            if hit is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        telemetry.count("semantic_cache_lookups_total", result=result)
+        return hit
+
+    def store(self, text: str, value: str, namespace: str = "", vector: Optional[np.ndarray] = None) -> None:
+        """Stores the response for a request, replacing an expired or the least recently used entry when full."""
+        if not self.enabled:
+            return
+        self._load()
+        if vector is None:
+            vector = self.encode(text)
+            if vector is None:
+                return
+        now = time.time()
+        with self._lock:
+            self._ensure_index(len(vector))
+            size = len(self._texts)
+            if size < self.max_entries:
+                if size == len(self._vectors):
+                    self._grow()
+                slot = size
+                self._texts.append(text)
+                self._values.append(value)
+                self._namespaces.append(namespace)
+                self._numbers.append(number_signature(text))
+                self._facets.append(facet_signature(text))
+            else:
+                expired = int(np.argmin(self._expires_at))
+                slot = expired if self._expires_at[expired] <= now else int(np.argmin(self._accessed_at))
+                self._index_slot(slot, add=False)
+                self.evictions += 1
+                self._texts[slot] = text
+                self._values[slot] = value
+                self._namespaces[slot] = namespace
+                self._numbers[slot] = number_signature(text)
+                self._facets[slot] = facet_signature(text)
+            self._vectors[slot] = vector
+            self._expires_at[slot] = now + self.ttl_seconds
+            self._accessed_at[slot] = now
+            self._index_slot(slot, add=True)
+            self._unsaved += 1
+            save_now = self.path is not None and self._unsaved >= self.save_every
+        if save_now:
+            self.save()
+
+    # --- Persistence ---
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not self.path or not os.path.exists(self.path):
+                return
+            try:
+                with np.load(self.path) as data:
+                    meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+                    vectors = data["vectors"]
+                    expires_at = data["expires_at"]
+                    accessed_at = data["accessed_at"]
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                telemetry.event(
+                    "warning", "semantic_cache_load_failed", f"Could not load semantic cache '{self.path}': {e}"
+                )
+                return
+            if meta.get("encoder") != self.encoder.name:
+                return  # Vectors from another encoder are not comparable
+            keep = np.flatnonzero(expires_at > time.time())[-self.max_entries :]
+            if not len(keep):
+                return
+            self._ensure_index(vectors.shape[1])
+            while len(self._vectors) < len(keep):
+                self._grow()
+            self._vectors[: len(keep)] = vectors[keep]
+            self._expires_at[: len(keep)] = expires_at[keep]
+            self._accessed_at[: len(keep)] = accessed_at[keep]
+            for column in ("texts", "values", "namespaces", "numbers"):
+                setattr(self, f"_{column}", [meta[column][index] for index in keep])
+            if "facets" in meta:
+                self._facets = [meta["facets"][index] for index in keep]
+            else:  # Written before facet signatures were stored
+                self._facets = [facet_signature(text) for text in self._texts]
+            for slot in range(len(keep)):
+                self._index_slot(slot, add=True)
+
+    def save(self) -> None:
+        """Writes the cache to path (atomically, via a temporary file)."""
+        if not self.path or not self._loaded:
+            return
+        with self._lock:
+            size = len(self._texts)
+            if self._vectors is None or not self._unsaved:
+                return
+            meta = {
+                "encoder": self.encoder.name,
+                "texts": self._texts,
+                "values": self._values,
+                "namespaces": self._namespaces,
+                "numbers": self._numbers,
+                "facets": self._facets,
+            }
+            buffer = io.BytesIO()
+            np.savez(
+                buffer,
+                vectors=self._vectors[:size],
+                expires_at=self._expires_at[:size],
+                accessed_at=self._accessed_at[:size],
+                meta=np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+            )
+            self._unsaved = 0
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            temporary_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporary_path, "wb") as f:
+                f.write(buffer.getvalue())
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            telemetry.event(
+                "warning", "semantic_cache_save_failed", f"Could not save semantic cache '{self.path}': {e}"
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+            self._recent.clear()
+            self._loaded = True
+            self._unsaved = 1  # So that save() overwrites the file
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "guarded": self.guarded,
+            "evictions": self.evictions,
+            "encoder_errors": self.encoder_errors,
+            "entries": len(self._texts),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Shared cache for extracted parameters - loaded on first use, saved at exit
+semantic_cache = SemanticCache(
+    make_encoder(SEMANTIC_CACHE_ENCODER),
+    path=SEMANTIC_CACHE_PATH,
+    threshold=SEMANTIC_CACHE_THRESHOLDS[SEMANTIC_CACHE_ENCODER],
+    enabled=SEMANTIC_CACHE_ENABLED,
+)
+atexit.register(semantic_cache.save)
+
+if __name__ == "__main__":
+    cache = SemanticCache(HashingEncoder(), threshold=SEMANTIC_CACHE_THRESHOLDS["hashing"])
+    cache.store("nintendo switch lite console only", '{"query": "nintendo switch lite"}')
+    cache.store("vintage seiko watch under 5000 yen", '{"query": "seiko watch", "price_max": 5000}')
+    for request in [
+        "switch lite console only nintendo",
+        "vintage seiko watch under 3000 yen",
+        "wireless earphones",
+    ]:
+        print(f"{request!r}: {cache.lookup(request)}")
+    print(cache.stats())
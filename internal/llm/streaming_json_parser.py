@@ -0,0 +1,91 @@
+import json
+from typing import Any, Dict, List, Tuple
+
+
+class StreamingJSONObjectParser:
+    """
+    Incremental parser for a JSON object arriving as a token stream.
+
+    feed() accepts arbitrary chunks and returns the top-level members that were
+    completed by that chunk, so callers can act on "query" or "price_max" while
+    the rest of the object is still being generated. Text before the opening
+    brace (prose, code fences) is skipped. Nested values are returned only when
+    the whole value is complete.
+    """
+
+    def __init__(self) -> None:
+        self.fields: Dict[str, Any] = {}
+        self.errors: List[str] = []  # Members that could not be parsed
+        self.done = False
+        self._buffer: List[str] = []
+        self._member: List[str] = []
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        return "".join(self._buffer)
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Consumes the next chunk of generated text.
+
+        Args:
+            chunk: Any slice of the output, e.g. one streamed token.
+
+        Returns:
+            (key, value) pairs for the top-level members completed by this chunk, in order.
+        """
+        self._buffer.append(chunk)
+        completed: List[Tuple[str, Any]] = []
+        if self.done:
+            return completed
+        for ch in chunk:
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                self._member.append(ch)
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete_member(completed)
+                    self.done = True
+                    break
+            elif ch == "," and self._depth == 1:
+                self._complete_member(completed)
+                continue
+            self._member.append(ch)
+        return completed
+
+    def _complete_member(self, completed: List[Tuple[str, Any]]) -> None:
+        member_text = "".join(self._member).strip()
+        self._member = []
+        if not member_text:
+            return
+        try:
+            member = json.loads("{" + member_text + "}")
+        except json.JSONDecodeError:
+            self.errors.append(member_text)
+            return
+        for key, value in member.items():
+            self.fields[key] = value
+            completed.append((key, value))
@@ -0,0 +1,226 @@
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar
+
+T = TypeVar("T")
+
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+_OPTIONAL_INTEGER = {"anyOf": [{"type": "integer"}, {"type": "null"}]}
+
+# JSON schemas sent as Ollama's `format`, so the model can only produce matching JSON
+EXTRACTION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "query": {"type": "string"},
+        "price_min": _OPTIONAL_INTEGER,
+        "price_max": _OPTIONAL_INTEGER,
+        "categories": _STRING_LIST,
+        "brands": _STRING_LIST,
+        "item_conditions": _STRING_LIST,
+        "shipping_payer": _STRING_LIST,
+        "sizes": _STRING_LIST,
+        "colors": _STRING_LIST,
+        "sort_by": {"type": "string"},
+        "sort_order": {"type": "string"},
+    },
+    "required": [
+        "query", "price_min", "price_max", "categories", "brands",
+        "item_conditions", "shipping_payer", "sizes", "colors", "sort_by", "sort_order",
+    ],
+}
+
+RECOMMENDATION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "recommendations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "item_name": {"type": "string"},
+                    "item_price": {"type": "integer"},
+                    "item_condition": {"type": "string"},
+                    "item_id": {"type": "string"},
+                    "reason": {"type": "string"},
+                },
+                "required": ["item_name", "item_price", "item_condition", "item_id", "reason"],
+            },
+            "maxItems": 3,
+        }
+    },
+    "required": ["recommendations"],
+}
+
+
+class OutputValidationError(ValueError):
+    """Raised when LLM output is not valid JSON or does not match the expected structure."""
+
+
+def _string(data: Dict[str, Any], key: str, default: Optional[str] = None) -> str:
+    value = data.get(key, default)
+    if value is None:
+        if default is None:
+            raise OutputValidationError(f"Missing field {key!r}")
+        return default
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if not isinstance(value, str):
+        raise OutputValidationError(f"Field {key!r} must be a string, got {type(value).__name__}")
+    return value
+
+
+def _integer(data: Dict[str, Any], key: str, optional: bool = False) -> Optional[int]:
+    """Accepts ints, integral floats and numeric strings ("5,000", "5000円")."""
+    value = data.get(key)
+    if value is None or value == "":
+        if optional:
+            return None
+        raise OutputValidationError(f"Missing field {key!r}")
+    if isinstance(value, bool):
+        raise OutputValidationError(f"Field {key!r} must be an integer, got a boolean")
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        digits = value.replace(",", "").replace("¥", "").replace("円", "").replace("yen", "").strip()
+        if digits.isdigit():
+            return int(digits)
+    raise OutputValidationError(f"Field {key!r} must be an integer, got {value!r}")
+
+
+def _string_list(data: Dict[str, Any], key: str) -> List[str]:
+    value = data.get(key)
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, list):
+        raise OutputValidationError(f"Field {key!r} must be a list, got {type(value).__name__}")
+    return [str(entry) for entry in value if entry is not None and entry != ""]
+
+
+@dataclass
+class ExtractedParameters:
+    """Validated output of the parameter extraction prompt (names, before mapping to IDs)."""
+
+    query: str = ""
+    price_min: Optional[int] = None
+    price_max: Optional[int] = None
+    categories: List[str] = field(default_factory=list)
+    brands: List[str] = field(default_factory=list)
+    item_conditions: List[str] = field(default_factory=list)
+    shipping_payer: List[str] = field(default_factory=list)
+    sizes: List[str] = field(default_factory=list)
+    colors: List[str] = field(default_factory=list)
+    sort_by: str = ""
+    sort_order: str = ""
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "ExtractedParameters":
+        if not isinstance(data, dict):
+            raise OutputValidationError(f"Expected a JSON object, got {type(data).__name__}")
+        return cls(
+            query=_string(data, "query", ""),
+            price_min=_integer(data, "price_min", optional=True),
+            price_max=_integer(data, "price_max", optional=True),
+            categories=_string_list(data, "categories"),
+            brands=_string_list(data, "brands"),
+            item_conditions=_string_list(data, "item_conditions"),
+            shipping_payer=_string_list(data, "shipping_payer"),
+            sizes=_string_list(data, "sizes"),
+            colors=_string_list(data, "colors"),
+            sort_by=_string(data, "sort_by", ""),
+            sort_order=_string(data, "sort_order", ""),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class Recommendation:
+    item_id: str
+    item_name: str
+    item_price: int
+    item_condition: str
+    reason: str
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "Recommendation":
+        if not isinstance(data, dict):
+            raise OutputValidationError(f"Expected a recommendation object, got {type(data).__name__}")
+        return cls(
+            item_id=_string(data, "item_id"),
+            item_name=_string(data, "item_name", ""),
+            item_price=_integer(data, "item_price"),
+            item_condition=_string(data, "item_condition", ""),
+            reason=_string(data, "reason", ""),
+        )
+
+
+@dataclass
+class Recommendations:
+    """Validated output of the recommendation prompt."""
+
+    recommendations: List[Recommendation] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "Recommendations":
+        if not isinstance(data, dict) or not isinstance(data.get("recommendations"), list):
+            raise OutputValidationError("Expected an object with a 'recommendations' list")
+        return cls([Recommendation.from_dict(entry) for entry in data["recommendations"]])
+
+    def keep_known_items(self, item_ids) -> int:
+        """Drops recommendations of items that were not in the prompt; returns how many were dropped."""
+        known = set(item_ids)
+        kept = [recommendation for recommendation in self.recommendations if recommendation.item_id in known]
+        dropped = len(self.recommendations) - len(kept)
+        self.recommendations = kept
+        return dropped
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _outermost_object(text: str) -> Optional[str]:
+    """The text from the first "{" to the last "}" (drops prose and code fences around the JSON)."""
+    start, end = text.find("{"), text.rfind("}")
+    return text[start : end + 1] if 0 <= start < end else None
+
+
+def parse_output(text: str, result_type: Type[T]) -> Tuple[T, bool]:
+    """
+    Parses LLM output into result_type (ExtractedParameters or Recommendations).
+
+    The fast path is a single json.loads of the whole text, which is what
+    schema-constrained generation produces. Otherwise the outermost {...} is
+    tried once (the model wrapped the JSON in prose or a code fence).
+
+    Returns:
+        (result, repaired): repaired is True if the fast path failed.
+
+    Raises:
+        OutputValidationError: If no valid object could be parsed.
+    """
+    try:
+        return result_type.from_dict(json.loads(text)), False
+    except json.JSONDecodeError as e:
+        candidate = _outermost_object(text)
+        if candidate is None or candidate == text.strip():
+            raise OutputValidationError(f"Not valid JSON: {e}") from e
+    try:
+        return result_type.from_dict(json.loads(candidate)), True
+    except json.JSONDecodeError as e:
+        raise OutputValidationError(f"Not valid JSON: {e}") from e
+
+
+if __name__ == "__main__":
+    for text in [
+        '{"query": "switch lite", "price_max": "20,000", "brands": ["Nintendo"]}',
+        'Sure! Here are the parameters:\n```json\n{"query": "vintage watch", "price_max": 5000}\n```',
+        '{"query": "switch lite", "price_max": "cheap"}',
+        "I could not understand the request.",
+    ]:
+        try:
+            print(parse_output(text, ExtractedParameters))
+        except OutputValidationError as e:
+            print(f"OutputValidationError: {e}")
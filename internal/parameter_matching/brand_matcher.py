@@ -0,0 +1,235 @@
+import re
+from array import array
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from internal.parameter_matching.facets_snapshot import FacetTable
+from internal.utils.text_utils import HIRAGANA_TO_KATAKANA, fold_text, normalize_text
+
+_NAME_SEPARATORS_RE = re.compile(r"[\s・]+")
+_CHAR_SHIFT = 21  # Unicode code points fit in 21 bits
+
+
+def _char_class(ch: str) -> Optional[str]:
+    """Script class used for match boundaries: Latin/digits, hiragana, katakana or kanji."""
+    if ch.isascii():
+        return "latin" if ch.isalnum() else None
+    if "ぁ" <= ch <= "ゟ":
+        return "hiragana"
+    if "ァ" <= ch <= "ヿ":
+        return "katakana"
+    if "一" <= ch <= "鿿" or "㐀" <= ch <= "䶿":
+        return "kanji"
+    return None
+
+
+class BrandMatch(NamedTuple):
+    brand_id: int
+    name: str
+    start: int  # Offsets into the normalised text
+    end: int
+
+
+class BrandMatcher:
+    """
+    Finds brand mentions with an Aho-Corasick automaton over every brand name
+    and sub_name in brands.json (katakana and Latin spellings).
+
+    Patterns and input are normalised with normalize_text, so width, case and
+    hiragana/katakana differences do not matter. A match must not continue a
+    word of the same script on either side, so "ナイキ" matches in "ナイキの靴"
+    but "イチ" does not match inside "イチゴ".
+
+    The automaton is stored as one flat dict of (state, character) -> state
+    transitions plus int arrays for failure and output links, which keeps
+    memory proportional to the number of trie nodes.
+    """
+
+    def __init__(self, brands: FacetTable, min_pattern_length: int = 2) -> None:
+        """
+        Builds the automaton from the "brands" facet table.
+
+        Args:
+            brands: Facet table with "id", "name" and "sub_name" columns.
+            min_pattern_length: Normalised names shorter than this are not indexed.
+        """
+        self.brand_ids = brands.ints("id")
+        self.brand_names = brands.strings("name")
+        self.brand_sub_names = brands.strings("sub_name")
+        self.min_pattern_length = min_pattern_length
+
+        self._patterns: List[str] = []
+        self._pattern_rows: List[int] = []
+        self._exact: Dict[str, List[int]] = {}
+        self._row_by_id: Dict[int, int] = {}
+        sub_names = self.brand_sub_names
+        for row in range(len(brands)):
+            self._row_by_id.setdefault(self.brand_ids[row], row)
+            for pattern in self._name_variants(self.brand_names[row], sub_names[row]):
+                self._patterns.append(pattern)
+                self._pattern_rows.append(row)
+                self._exact.setdefault(pattern, []).append(row)
+        self._build_automaton()
+
+    def _name_variants(self, *names: Optional[str]) -> Iterator[str]:
+        seen = set()
+        for name in names:
+            if not name:
+                continue
+            normalized = normalize_text(name)
+            variants = [normalized]
+            if not normalized.isascii():
+                # "アー ヴェ ヴェ" is usually typed without separators
+                variants.append(_NAME_SEPARATORS_RE.sub("", normalized))
+            for variant in variants:
+                if len(variant) >= self.min_pattern_length and variant not in seen:
+                    seen.add(variant)
+                    yield variant
+
+    def _build_automaton(self) -> None:
+        goto: Dict[int, int] = {}
+        depths = array("i", [0])
+        terminals: Dict[int, List[int]] = {}
+        for pattern_index, pattern in enumerate(self._patterns):
+            state = 0
+            for ch in pattern:
+                key = (state << _CHAR_SHIFT) | ord(ch)
+                next_state = goto.get(key)
+                if next_state is None:
+                    next_state = len(depths)
+                    depths.append(depths[state] + 1)
+                    goto[key] = next_state
+                state = next_state
+            terminals.setdefault(state, []).append(pattern_index)
+
+        state_count = len(depths)
+        fail = array("i", [0]) * state_count
+        output_link = array("i", [0]) * state_count
+        # Breadth-first: a state's failure link only depends on shallower states
+        for key, state in sorted(goto.items(), key=lambda item: depths[item[1]]):
+            parent, code = key >> _CHAR_SHIFT, key & ((1 << _CHAR_SHIFT) - 1)
+            if parent == 0:
+                continue
+            fallback = fail[parent]
+            while fallback and ((fallback << _CHAR_SHIFT) | code) not in goto:
+                fallback = fail[fallback]
+            target = goto.get((fallback << _CHAR_SHIFT) | code, 0)
+            fail[state] = target
+            output_link[state] = target if target in terminals else output_link[target]
+
+        self._goto = goto
+        self._fail = fail
+        self._output_link = output_link
+        self._terminals = terminals
+
+    @property
+    def state_count(self) -> int:
+        return len(self._fail)
+
+    def _iter_raw_matches(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """Yields (start, end, pattern_index) for every pattern occurrence in text."""
+        goto, fail, output_link, terminals = (
+            self._goto,
+            self._fail,
+            self._output_link,
+            self._terminals,
+        )
+        patterns = self._patterns
+        state = 0
+        for position, ch in enumerate(text):
+            code = ord(ch)
+            while True:
+                next_state = goto.get((state << _CHAR_SHIFT) | code)
+                if next_state is not None:
+                    state = next_state
+                    break
+                if state == 0:
+                    break
+                state = fail[state]
+            output = state if state in terminals else output_link[state]
+            while output:
+                for pattern_index in terminals[output]:
+                    yield position + 1 - len(patterns[pattern_index]), position + 1, pattern_index
+                output = output_link[output]
+
+    @staticmethod
+    def _is_word_boundary(text: str, start: int, end: int) -> bool:
+        if start > 0 and _char_class(text[start - 1]) == _char_class(text[start]) is not None:
+            return False
+        if end < len(text) and _char_class(text[end]) == _char_class(text[end - 1]) is not None:
+            return False
+        return True
+
+    def find_in_text(self, text: str) -> List[BrandMatch]:
+        """
+        Finds every brand mentioned in text in a single pass over it.
+
+        Overlapping mentions are resolved leftmost-longest, e.g. "ナイキゴルフ" wins
+        over "ナイキ".
+
+        Args:
+            text: Free text such as a user request.
+
+        Returns:
+            A list of BrandMatch, ordered by position. A mention shared by several
+            brands (same spelling) yields one BrandMatch per brand.
+        """
+        folded = fold_text(text)
+        # Kana conversion is one character to one, so offsets are shared with folded
+        normalized = folded.translate(HIRAGANA_TO_KATAKANA)
+        candidates = [
+            (start, -(end - start), end, pattern_index)
+            for start, end, pattern_index in self._iter_raw_matches(normalized)
+            if self._is_word_boundary(folded, start, end)
+        ]
+        candidates.sort()
+
+        matches: List[BrandMatch] = []
+        covered_until = 0
+        chosen: Optional[Tuple[int, int]] = None
+        for start, _, end, pattern_index in candidates:
+            if (start, end) != chosen:
+                if start < covered_until:
+                    continue
+                chosen = (start, end)
+                covered_until = end
+            row = self._pattern_rows[pattern_index]
+            matches.append(BrandMatch(self.brand_ids[row], self.brand_names[row], start, end))
+        return matches
+
+    def match_brand_names_to_ids(self, brand_names: Iterable[str]) -> List[int]:
+        """
+        Matches brand names (e.g. the LLM's "brands" list) to Mercari brand IDs.
+
+        A name equal to a known brand spelling matches directly; otherwise every
+        brand mentioned inside the name is used. All names are scanned in one pass.
+
+        Args:
+            brand_names: Brand names in any width, case or kana.
+
+        Returns:
+            Unique brand IDs in order of first mention (empty if nothing matched).
+        """
+        brand_ids: List[int] = []
+        unmatched = []
+        for name in brand_names:
+            exact_rows = self._exact.get(normalize_text(name))
+            if exact_rows:
+                brand_ids.extend(self.brand_ids[row] for row in exact_rows)
+            else:
+                unmatched.append(name)
+        if unmatched:
+            # Newlines are neither Latin nor kana, so names cannot merge into one match
+            brand_ids.extend(match.brand_id for match in self.find_in_text("\n".join(unmatched)))
+        return list(dict.fromkeys(brand_ids))
+
+    def names_for_ids(self, brand_ids: Iterable[int]) -> List[str]:
+        """Returns the names and sub_names (e.g. "Nintendo", "ニンテンドー") of the given brand IDs."""
+        names: List[str] = []
+        for brand_id in brand_ids:
+            row = self._row_by_id.get(int(brand_id))
+            if row is None:
+                continue
+            names.extend(
+                name for name in (self.brand_names[row], self.brand_sub_names[row]) if name
+            )
+        return list(dict.fromkeys(names))
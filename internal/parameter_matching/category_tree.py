@@ -0,0 +1,186 @@
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+from internal.parameter_matching.facets_snapshot import FacetTable
+
+PATH_SEPARATOR = "/"
+
+
+class CategoryTree:
+    """
+    Array-backed view of the Mercari category hierarchy.
+
+    Rows are stored in pre-order (as compiled into the facet snapshot), so the
+    subtree of a row is the contiguous row range [row, subtree_end[row]).
+    Parent, depth and root are plain int arrays, which makes subtree and
+    ancestor tests O(1) and path construction O(depth).
+    """
+
+    def __init__(self, categories: FacetTable) -> None:
+        """
+        Builds the tree from the "categories" facet table.
+
+        Args:
+            categories: Facet table with "id", "parent" and "name" columns in pre-order.
+        """
+        self._table = categories
+        self.ids = categories.ints("id")
+        self.parents = categories.ints("parent")
+        self.names = categories.strings("name")
+
+        row_count = len(categories)
+        self.depths = array("i", [0]) * row_count
+        self.roots = array("i", range(row_count))
+        self.subtree_ends = array("i", range(1, row_count + 1))
+        self.row_by_id: Dict[int, int] = {}
+        for row in range(row_count):
+            self.row_by_id[self.ids[row]] = row
+            parent = self.parents[row]
+            if parent >= 0:
+                self.depths[row] = self.depths[parent] + 1
+                self.roots[row] = self.roots[parent]
+        for row in range(row_count - 1, -1, -1):
+            parent = self.parents[row]
+            if parent >= 0 and self.subtree_ends[row] > self.subtree_ends[parent]:
+                self.subtree_ends[parent] = self.subtree_ends[row]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def row_for_id(self, category_id: int) -> Optional[int]:
+        return self.row_by_id.get(int(category_id))
+
+    def is_ancestor(self, ancestor_row: int, row: int) -> bool:
+        """Returns True if ancestor_row is row itself or one of its ancestors. O(1)."""
+        return ancestor_row <= row < self.subtree_ends[ancestor_row]
+
+    def ancestors(self, row: int) -> List[int]:
+        """Returns the ancestor rows of row, nearest first. O(depth)."""
+        result = []
+        parent = self.parents[row]
+        while parent >= 0:
+            result.append(parent)
+            parent = self.parents[parent]
+        return result
+
+    def path(self, row: int) -> List[str]:
+        """Returns the category names from the root down to row."""
+        return [self.names[r] for r in reversed([row] + self.ancestors(row))]
+
+    def path_name(self, row: int) -> str:
+        """Returns the path-qualified name of row, e.g. "レディース/トップス"."""
+        return PATH_SEPARATOR.join(self.path(row))
+
+    def subtree_rows(self, row: int) -> range:
+        """Returns the rows of row's subtree (row included). O(1)."""
+        return range(row, self.subtree_ends[row])
+
+    def child_rows(self, row: int) -> List[int]:
+        children = []
+        child = row + 1
+        while child < self.subtree_ends[row]:
+            children.append(child)
+            child = self.subtree_ends[child]
+        return children
+
+    def descendant_ids(self, category_id: int) -> List[int]:
+        """Returns the IDs of a category and all of its descendants."""
+        row = self.row_for_id(category_id)
+        if row is None:
+            return []
+        return [self.ids[r] for r in self.subtree_rows(row)]
+
+    def resolve(self, name: str) -> List[int]:
+        """
+        Resolves a category name to matching rows.
+
+        Plain names ("トップス") return every category with that name. Path-qualified
+        names ("レディース/トップス") only return categories whose ancestors spell out the
+        leading segments; skipped levels are allowed if nothing matches exactly. Category names may contain the separator themselves
+        (e.g. "Tシャツ/カットソー(半袖/袖なし)"), so every split point is tried.
+
+        Args:
+            name: A category name, optionally prefixed by ancestor names.
+
+        Returns:
+            The matching rows in pre-order (empty if none match).
+        """
+        name = name.strip().strip(PATH_SEPARATOR)
+        if not name:
+            return []
+        segments = [segment.strip() for segment in name.split(PATH_SEPARATOR)]
+        candidates = []
+        for split in range(len(segments)):
+            tail = PATH_SEPARATOR.join(segments[split:])
+            candidates.extend(
+                (row, segments[:split]) for row in self._table.lookup(tail)
+            )
+        # Prefer an unbroken ancestor chain, then allow skipped levels
+        for allow_gaps in (False, True):
+            matches = {
+                row
+                for row, prefix in candidates
+                if self._matches_prefix(self.parents[row], prefix, allow_gaps)
+            }
+            if matches:
+                return sorted(matches)
+        return []
+
+    def _matches_prefix(self, row: int, segments: List[str], allow_gaps: bool) -> bool:
+        """Checks that the ancestors ending at row spell out segments (which may be empty)."""
+        if not segments:
+            return True
+        while row >= 0:
+            row_segments = self.names[row].split(PATH_SEPARATOR)
+            if segments[-len(row_segments) :] == row_segments:
+                return self._matches_prefix(
+                    self.parents[row], segments[: -len(row_segments)], allow_gaps
+                )
+            if not allow_gaps:
+                return False
+            row = self.parents[row]
+        return False
+
+    def compact_ids(self, category_ids: Iterable[int]) -> List[int]:
+        """
+        Minimises a set of category IDs without changing what it matches.
+
+        IDs already covered by a selected ancestor are dropped, and a parent whose
+        children are all selected replaces them, so a search sends one parent ID
+        instead of dozens of leaf IDs. Unknown IDs are kept as they are.
+
+        Args:
+            category_ids: Category IDs to compact.
+
+        Returns:
+            The compacted IDs, ordered by first appearance in the tree.
+        """
+        unknown_ids = []
+        selected = set()
+        for category_id in category_ids:
+            row = self.row_for_id(category_id)
+            if row is None:
+                unknown_ids.append(category_id)
+            else:
+                selected.add(row)
+
+        # Deepest rows first so that fully selected parents cascade upwards
+        pending = sorted(selected, key=lambda r: -self.depths[r])
+        for row in pending:
+            parent = self.parents[row]
+            if parent < 0 or parent in selected or row not in selected:
+                continue
+            siblings = self.child_rows(parent)
+            if all(sibling in selected for sibling in siblings):
+                selected.difference_update(siblings)
+                selected.add(parent)
+                pending.append(parent)
+
+        compacted = []
+        covered_until = -1
+        for row in sorted(selected):
+            if row < covered_until:
+                continue  # Inside an already selected subtree
+            compacted.append(self.ids[row])
+            covered_until = self.subtree_ends[row]
+        return compacted + unknown_ids
@@ -0,0 +1,140 @@
+import re
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+from internal.parameter_matching.facets_snapshot import FacetTable
+from internal.utils.constants import (
+    COLOR_NAME_TO_FACET_NAME_MAP,
+    ITEM_CONDITION_NAME_TO_ID_MAP,
+    SHIPPING_PAYER_PHRASE_TO_CODE_MAP,
+    SIZE_NAME_TO_FACET_NAME_MAP,
+)
+from internal.utils.text_utils import fold_text
+
+# Extracted search parameter -> facet table its values are looked up in
+FACET_PARAMETERS = {
+    "item_conditions": "conditions",
+    "shipping_payer": "shippingPayers",
+    "sizes": "sizes",
+    "colors": "colors",
+}
+
+_NAME_PARTS_RE = re.compile(r"[()（）・/]+")
+_NAME_SUFFIXES = ("サイズ", "系")
+
+
+def lookup_key(value: object) -> str:
+    """Folds width and case and drops spaces, so "26 cm", "２６ｃｍ" and "26cm" share a key."""
+    return fold_text(str(value)).replace(" ", "")
+
+
+def _name_variants(name: str) -> List[str]:
+    """Shorter spellings of a facet name: "XL(LL)" -> "xl", "ll"; "Mサイズ" -> "m"; "ブラック系" -> "ブラック"."""
+    key = lookup_key(name)
+    variants = [part for part in _NAME_PARTS_RE.split(key) if part and part != key]
+    for suffix in _NAME_SUFFIXES:
+        if key.endswith(suffix) and len(key) > len(suffix):
+            variants.append(key[: -len(suffix)])
+    return variants
+
+
+class FacetValueMatcher:
+    """
+    Maps extracted item condition, shipping payer, size and color names to Mercari IDs.
+
+    One lookup table per parameter is built up front from the facet tables
+    (names, shipping payer codes, the shorter spellings of _name_variants)
+    and the alias maps in constants.py, so matching a value is a single dict
+    lookup. Exact facet names win over aliases, and aliases over derived
+    spellings. Names shared by several facet rows (e.g. "26cm" for men's
+    and women's shoes) map to all of their IDs.
+    """
+
+    def __init__(self, tables: Mapping[str, FacetTable]) -> None:
+        """
+        Args:
+            tables: Facet tables by name ("conditions", "shippingPayers", "sizes", "colors").
+        """
+        self._tables: Dict[str, Dict[str, Tuple[int, ...]]] = {}
+        self._valid_ids: Dict[str, frozenset] = {}
+        for parameter, facet_name in FACET_PARAMETERS.items():
+            table = tables[facet_name]
+            ids = table.ints("id")
+            names = table.strings("name")
+            ids_by_name: Dict[str, List[int]] = {}
+            for row in range(len(table)):
+                ids_by_name.setdefault(lookup_key(names[row]), []).append(ids[row])
+
+            lookup: Dict[str, List[int]] = dict(ids_by_name)
+            for alias, row_ids in self._aliases(parameter, table, ids_by_name):
+                lookup.setdefault(lookup_key(alias), list(row_ids))
+            for name, row_ids in ids_by_name.items():
+                for variant in _name_variants(name):
+                    lookup.setdefault(variant, []).extend(row_ids)  # Variants of several names map to all
+
+            self._tables[parameter] = {key: tuple(sorted(set(row_ids))) for key, row_ids in lookup.items()}
+            self._valid_ids[parameter] = frozenset(ids)
+
+    @staticmethod
+    def _aliases(
+        parameter: str, table: FacetTable, ids_by_name: Dict[str, List[int]]
+    ) -> Iterable[Tuple[str, List[int]]]:
+        if parameter == "item_conditions":
+            return [(alias, [condition_id]) for alias, condition_id in ITEM_CONDITION_NAME_TO_ID_MAP.items()]
+        if parameter == "shipping_payer":
+            ids_by_code = {code: [payer_id] for code, payer_id in zip(table.strings("code"), table.ints("id"))}
+            aliases = list(ids_by_code.items())
+            aliases += [
+                (phrase, ids_by_code[code])
+                for phrase, code in SHIPPING_PAYER_PHRASE_TO_CODE_MAP.items()
+                if code in ids_by_code
+            ]
+            return aliases
+        alias_map = COLOR_NAME_TO_FACET_NAME_MAP if parameter == "colors" else SIZE_NAME_TO_FACET_NAME_MAP
+        return [
+            (alias, ids_by_name[lookup_key(name)])
+            for alias, name in alias_map.items()
+            if lookup_key(name) in ids_by_name
+        ]
+
+    def match(self, parameter: str, values: Iterable[object]) -> Tuple[List[int], List[str]]:
+        """
+        Maps the extracted values of one parameter to facet IDs.
+
+        Values are names in English or Japanese. Internal callers may also pass
+        IDs as ints; a digit string is always a name ("3" is not condition 3,
+        and "42" is a size name, not facet row 42), since the LLM writes names.
+
+        Args:
+            parameter: "item_conditions", "shipping_payer", "sizes" or "colors".
+            values: The extracted values.
+
+        Returns:
+            (ids, unmatched): the sorted, de-duplicated IDs and the values that matched nothing.
+        """
+        table, valid_ids = self._tables[parameter], self._valid_ids[parameter]
+        ids, unmatched = set(), []
+        for value in values or []:
+            if value is None or value == "":
+                continue
+            row_ids = table.get(lookup_key(value))
+            if row_ids:
+                ids.update(row_ids)
+            elif isinstance(value, int) and not isinstance(value, bool) and value in valid_ids:
+                ids.add(value)
+            else:
+                unmatched.append(str(value))
+        return sorted(ids), unmatched
+
+
+if __name__ == "__main__":
+    from internal.parameter_matching.facets_config import config
+
+    matcher = config.facet_value_matcher
+    for parameter, values in [
+        ("item_conditions", ["new", "美品", "Used - Good", "junk", "mint"]),
+        ("shipping_payer", ["seller", "送料無料", "free shipping", "着払い"]),
+        ("sizes", ["M", "XL", "ll", "26cm", "26.5 cm", "フリーサイズ", "Mサイズ", "3", "42"]),
+        ("colors", ["black", "ネイビー", "ホワイト", "赤", "rainbow"]),
+    ]:
+        ids, unmatched = matcher.match(parameter, values)
+        print(f"{parameter}: {values} -> {ids} (unmatched: {unmatched})")
@@ -1,56 +1,114 @@
-import json
 import os
 from typing import Dict, List, Optional
 
+from internal.parameter_matching.brand_matcher import BrandMatcher
+from internal.parameter_matching.category_tree import CategoryTree
+from internal.parameter_matching.facet_value_matcher import FACET_PARAMETERS, FacetValueMatcher
+from internal.parameter_matching.facets_snapshot import (
+    SNAPSHOT_FILE_NAME,
+    FacetSnapshot,
+    FacetTable,
+    facet_source_paths,
+    load_facets,
+)
+
 
 class FacetsConfig:
     """
-    Loads and provides access to category data from a JSON file.
+    Loads and provides access to facet data (categories, brands, sizes, ...).
+
+    Facets are read from the compiled snapshot next to the JSON files when it is
+    up to date and from the JSON files otherwise. Nothing is loaded until a
+    facet is first accessed.
     """
 
-    def __init__(self, categories_file_path: str) -> None:
+    def __init__(
+        self,
+        categories_file_path: str,
+        snapshot_path: Optional[str] = None,
+        use_snapshot: bool = True,
+    ) -> None:
         """
         Initializes FacetsConfig with the path to the categories JSON file.
 
         Args:
-            categories_file_path: Path to the categories JSON file.
+            categories_file_path: Path to the categories JSON file. The other facet
+                files are expected in the same directory.
+            snapshot_path: Path to the compiled facet snapshot. Defaults to
+                facets.snapshot in the categories file directory.
+            use_snapshot: If False, always load facets from the JSON files.
         """
         self.categories_file: str = categories_file_path
-        self.category_name_to_id_map: Dict[str, str] = self._load_category_data()
+        facets_dir = os.path.dirname(os.path.abspath(categories_file_path))
+        self.source_paths: Dict[str, str] = facet_source_paths(
+            facets_dir, {"categories": categories_file_path}
+        )
+        self.snapshot_path: Optional[str] = None
+        if use_snapshot:
+            self.snapshot_path = snapshot_path or os.path.join(
+                facets_dir, SNAPSHOT_FILE_NAME
+            )
+        self._facets: Optional[FacetSnapshot] = None
+        self._category_name_to_id_map: Optional[Dict[str, int]] = None
+        self._category_tree: Optional[CategoryTree] = None
+        self._brand_matcher: Optional[BrandMatcher] = None
+        self._facet_value_matcher: Optional[FacetValueMatcher] = None
+
+    @property
+    def facets(self) -> FacetSnapshot:
+        """The loaded facet snapshot (mapped file or compiled from JSON)."""
+        if self._facets is None:
+            self._facets = load_facets(self.source_paths, self.snapshot_path)
+        return self._facets
+
+    def get_facet_table(self, facet_name: str) -> FacetTable:
+        """
+        Returns the table for a facet such as "categories", "brands" or "sizes".
+        """
+        return self.facets.table(facet_name)
 
-    def _load_category_data(self) -> Dict[str, str]:
+    @property
+    def category_name_to_id_map(self) -> Dict[str, int]:
+        """
+        A dictionary mapping category names to category IDs.
+        Duplicate names keep the last category only; use category_tree to
+        resolve those without ambiguity.
         """
-        Loads category data from the specified JSON file and creates a name-to-id map.
+        if self._category_name_to_id_map is None:
+            categories = self.get_facet_table("categories")
+            self._category_name_to_id_map = dict(
+                zip(categories.strings("name"), categories.ints("id"))
+            )
+        return self._category_name_to_id_map
 
-        Returns:
-            A dictionary mapping category names to category IDs.
-        """
-        category_name_to_id_map: Dict[str, str] = {}
-        try:
-            with open(self.categories_file, "r", encoding="utf-8") as f:
-                categories_data = json.load(f)
-                if categories_data and "data" in categories_data:
-
-                    def process_category_list(category_list):
-                        for category_item in category_list:
-                            category_name_to_id_map[category_item["name"]] = (
-                                category_item["id"]
-                            )
-                            if "child" in category_item:
-                                process_category_list(category_item["child"])
-
-                    process_category_list(categories_data["data"])
-                else:
-                    print(
-                        f"Warning: '{self.categories_file}' does not have expected 'data' structure."
-                    )
-        except FileNotFoundError:
-            print(f"Error: '{self.categories_file}' file not found.")
-        except json.JSONDecodeError:
-            print(
-                f"Error: Could not decode '{self.categories_file}'. File might be corrupted."
+    @property
+    def category_tree(self) -> CategoryTree:
+        """
+        The category hierarchy, keeping every category including duplicate names.
+        """
+        if self._category_tree is None:
+            self._category_tree = CategoryTree(self.get_facet_table("categories"))
+        return self._category_tree
+
+    @property
+    def brand_matcher(self) -> BrandMatcher:
+        """
+        Brand name automaton over brands.json, built on first use.
+        """
+        if self._brand_matcher is None:
+            self._brand_matcher = BrandMatcher(self.get_facet_table("brands"))
+        return self._brand_matcher
+
+    @property
+    def facet_value_matcher(self) -> FacetValueMatcher:
+        """
+        Lookup tables for item conditions, shipping payers, sizes and colors, built on first use.
+        """
+        if self._facet_value_matcher is None:
+            self._facet_value_matcher = FacetValueMatcher(
+                {facet_name: self.get_facet_table(facet_name) for facet_name in FACET_PARAMETERS.values()}
             )
-        return category_name_to_id_map
+        return self._facet_value_matcher
 
     def get_valid_category_names(self) -> List[str]:
         """
@@ -58,7 +116,7 @@ class FacetsConfig:
         """
         return list(self.category_name_to_id_map.keys())
 
-    def get_category_id_by_name(self, category_name: str) -> Optional[str]:
+    def get_category_id_by_name(self, category_name: str) -> Optional[int]:
         """
         Returns the category ID for a given category name.
 
@@ -71,9 +129,9 @@ class FacetsConfig:
         return self.category_name_to_id_map.get(category_name)
 
 
-# Initialize FacetsConfig -  NOW with the file path argument!
+# Initialize FacetsConfig - facets are loaded lazily on first access
 default_categories_file_path = os.path.join(
-    os.path.dirname(__file__), "..", "facets", "categories.json"  # Corrected path!
+    os.path.dirname(__file__), "..", "..", "facets", "categories.json"
 )
 config = FacetsConfig(default_categories_file_path)
 
@@ -0,0 +1,462 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_FILE_NAME = "facets.snapshot"
+
+_MAGIC = b"MFACETS\x00"
+_HEADER = struct.Struct("<8sIB3x32sI")  # magic, version, little-endian flag, fingerprint, sections
+_SECTION = struct.Struct("<24sQQ")  # name, offset, length
+_COLUMN_INT = 0
+_COLUMN_STR = 1
+_EMPTY_SLOT = -1
+
+
+class FacetSpec(NamedTuple):
+    """Describes how one facets/*.json file is flattened into a snapshot table."""
+
+    file_name: str
+    records: Callable[[dict], List[dict]]
+    int_columns: Tuple[str, ...]
+    str_columns: Tuple[str, ...]
+    index_columns: Tuple[str, ...]
+
+
+def _flatten_categories(raw: dict) -> List[dict]:
+    """Flattens the category tree in pre-order, recording each node's parent row."""
+    rows: List[dict] = []
+
+    def visit(category_list, parent_row):
+        for category_item in category_list:
+            row = {"id": category_item["id"], "name": category_item["name"]}
+            row["parent"] = parent_row
+            rows.append(row)
+            visit(category_item.get("child", []), len(rows) - 1)
+
+    visit(raw.get("data", []), -1)
+    return rows
+
+
+def _flatten_brands(raw: dict) -> List[dict]:
+    return [brand for group in raw.get("data", []) for brand in group["brands"]]
+
+
+FACET_SPECS: Dict[str, FacetSpec] = {
+    "categories": FacetSpec(
+        "categories.json", _flatten_categories, ("id", "parent"), ("name",), ("name",)
+    ),
+    "brands": FacetSpec(
+        "brands.json", _flatten_brands, ("id",), ("name", "sub_name"), ("name", "sub_name")
+    ),
+    "colors": FacetSpec(
+        "colors.json", lambda raw: raw.get("colors", []), ("id",), ("name", "rgb"), ("name",)
+    ),
+    "conditions": FacetSpec(
+        "conditions.json", lambda raw: raw.get("conditions", []), ("id",), ("name",), ("name",)
+    ),
+    "sizes": FacetSpec(
+        "sizes.json", lambda raw: raw.get("sizes", []), ("id", "groupId"), ("name", "group"), ("name",)
+    ),
+    "shippingPayers": FacetSpec(
+        "shippingPayers.json", lambda raw: raw.get("payers", []), ("id",), ("name", "code"), ("name", "code")
+    ),
+    "shippingMethods": FacetSpec(
+        "shippingMethods.json", lambda raw: raw.get("methods", []), ("id", "payerId"), ("name", "type"), ("name",)
+    ),
+}
+
+
+def facet_source_paths(facets_dir: str, overrides: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """
+    Returns the JSON source file for every facet, applying per-facet path overrides.
+    """
+    paths = {name: os.path.join(facets_dir, spec.file_name) for name, spec in FACET_SPECS.items()}
+    if overrides:
+        paths.update(overrides)
+    return paths
+
+
+def source_fingerprint(source_paths: Dict[str, str]) -> bytes:
+    """
+    Fingerprints the JSON sources by name, size and mtime so staleness checks never parse them.
+    """
+    digest = hashlib.sha256()
+    for facet_name in sorted(source_paths):
+        path = source_paths[facet_name]
+        try:
+            stat = os.stat(path)
+            digest.update(f"{facet_name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        except OSError:
+            digest.update(f"{facet_name}:missing;".encode())
+    return digest.digest()
+
+
+def _hash_key(key: bytes) -> int:
+    return zlib.crc32(key)
+
+
+class _StringTableBuilder:
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.values: List[bytes] = []
+
+    def add(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.values)
+            self.ids[value] = string_id
+            self.values.append(value.encode("utf-8"))
+        return string_id
+
+
+def _build_table(spec: FacetSpec, rows: List[dict], strings: _StringTableBuilder) -> bytes:
+    columns = [(name, _COLUMN_INT) for name in spec.int_columns]
+    columns += [(name, _COLUMN_STR) for name in spec.str_columns]
+
+    column_data: Dict[str, array] = {}
+    for name, kind in columns:
+        if kind == _COLUMN_INT:
+            column_data[name] = array("i", (int(row.get(name, -1)) for row in rows))
+        else:
+            column_data[name] = array("i", (strings.add(row.get(name) or None) for row in rows))
+
+    entry_keys = array("i")
+    entry_rows = array("i")
+    for row_index in range(len(rows)):
+        for name in spec.index_columns:
+            string_id = column_data[name][row_index]
+            if string_id >= 0:
+                entry_keys.append(string_id)
+                entry_rows.append(row_index)
+
+    slot_count = 1
+    while slot_count < 2 * len(entry_keys):
+        slot_count *= 2
+    slots = array("i", [_EMPTY_SLOT]) * slot_count
+    mask = slot_count - 1
+    for entry_index, string_id in enumerate(entry_keys):
+        slot = _hash_key(strings.values[string_id]) & mask
+        while slots[slot] != _EMPTY_SLOT:
+            slot = (slot + 1) & mask
+        slots[slot] = entry_index
+
+    section = array("i", [len(rows), len(columns), len(entry_keys), slot_count])
+    for name, kind in columns:
+        section.extend((strings.add(name), kind))
+    for name, _ in columns:
+        section.extend(column_data[name])
+    section.extend(entry_keys)
+    section.extend(entry_rows)
+    section.extend(slots)
+    return section.tobytes()
+
+
+def _load_records(facet_name: str, spec: FacetSpec, path: str) -> List[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return spec.records(json.load(f))
+    except FileNotFoundError:
+        print(f"Warning: Facet file '{path}' not found, '{facet_name}' will be empty.")
+    except (json.JSONDecodeError, KeyError, TypeError):
+        print(f"Error: Could not decode '{path}'. File might be corrupted.")
+    return []
+
+
+def build_snapshot_bytes(source_paths: Dict[str, str]) -> bytes:
+    """
+    Compiles the facet JSON files into the binary snapshot format.
+
+    Layout: a fixed header, a section directory, then 8-byte aligned sections.
+    The "strings" section holds offsets into the UTF-8 "string_blob" section and
+    every facet gets its own section of int32 columns (string columns store
+    string ids) followed by an open-addressing hash index over its name columns.
+
+    Args:
+        source_paths: Mapping of facet name to its JSON source file.
+
+    Returns:
+        The snapshot contents.
+    """
+    strings = _StringTableBuilder()
+    sections: List[Tuple[str, bytes]] = []
+    for facet_name, spec in FACET_SPECS.items():
+        rows = _load_records(facet_name, spec, source_paths[facet_name])
+        sections.append((facet_name, _build_table(spec, rows, strings)))
+
+    offsets = array("i", [len(strings.values), 0])
+    for value in strings.values:
+        offsets.append(offsets[-1] + len(value))
+    sections.append(("strings", offsets.tobytes()))
+    sections.append(("string_blob", b"".join(strings.values)))
+
+    header = _HEADER.pack(
+        _MAGIC,
+        SNAPSHOT_FORMAT_VERSION,
+        sys.byteorder == "little",
+        source_fingerprint(source_paths),
+        len(sections),
+    )
+    offset = _HEADER.size + _SECTION.size * len(sections)
+    directory = []
+    body = []
+    for name, payload in sections:
+        padding = -offset % 8
+        body.append(b"\x00" * padding)
+        offset += padding
+        directory.append(_SECTION.pack(name.encode(), offset, len(payload)))
+        body.append(payload)
+        offset += len(payload)
+    return header + b"".join(directory) + b"".join(body)
+
+
+def write_snapshot(source_paths: Dict[str, str], snapshot_path: str) -> int:
+    """
+    Builds the snapshot and atomically replaces the file at snapshot_path.
+
+    Returns:
+        The size of the written snapshot in bytes.
+    """
+    data = build_snapshot_bytes(source_paths)
+    tmp_path = f"{snapshot_path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, snapshot_path)
+    return len(data)
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot cannot be used (missing, wrong version or corrupted)."""
+
+
+class StringTable:
+    """Zero-copy view over the snapshot string table."""
+
+    def __init__(self, offsets: memoryview, blob: memoryview) -> None:
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self) -> int:
+        return self._offsets[0]
+
+    def raw(self, string_id: int) -> memoryview:
+        return self._blob[self._offsets[string_id + 1] : self._offsets[string_id + 2]]
+
+    def __getitem__(self, string_id: int) -> Optional[str]:
+        if string_id < 0:
+            return None
+        return str(self.raw(string_id), "utf-8")
+
+
+class StringColumn:
+    """Sequence of strings backed by string ids; values are decoded on access."""
+
+    def __init__(self, string_ids: memoryview, strings: StringTable) -> None:
+        self._string_ids = string_ids
+        self._strings = strings
+
+    def __len__(self) -> int:
+        return len(self._string_ids)
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        return self._strings[self._string_ids[row]]
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        strings = self._strings
+        return (strings[string_id] for string_id in self._string_ids)
+
+
+class FacetTable:
+    """
+    A single facet (categories, brands, ...) read from the snapshot.
+
+    Integer columns are exposed as int32 memoryviews straight over the mapped
+    file and string columns as StringColumn sequences, so nothing is copied
+    until a value is actually read.
+    """
+
+    def __init__(self, name: str, section: memoryview, strings: StringTable) -> None:
+        self.name = name
+        self._strings = strings
+        self.row_count, column_count, entry_count, slot_count = section[0:4]
+        cursor = 4
+        column_defs = []
+        for _ in range(column_count):
+            column_defs.append((strings[section[cursor]], section[cursor + 1]))
+            cursor += 2
+        self._columns: Dict[str, Tuple[int, memoryview]] = {}
+        for column_name, kind in column_defs:
+            self._columns[column_name] = (kind, section[cursor : cursor + self.row_count])
+            cursor += self.row_count
+        self._entry_keys = section[cursor : cursor + entry_count]
+        cursor += entry_count
+        self._entry_rows = section[cursor : cursor + entry_count]
+        cursor += entry_count
+        self._slots = section[cursor : cursor + slot_count]
+        self._mask = slot_count - 1
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self._columns)
+
+    def ints(self, column_name: str) -> memoryview:
+        kind, values = self._columns[column_name]
+        if kind != _COLUMN_INT:
+            raise KeyError(f"'{column_name}' is not an integer column of '{self.name}'")
+        return values
+
+    def strings(self, column_name: str) -> StringColumn:
+        kind, values = self._columns[column_name]
+        if kind != _COLUMN_STR:
+            raise KeyError(f"'{column_name}' is not a string column of '{self.name}'")
+        return StringColumn(values, self._strings)
+
+    def lookup(self, key: str) -> List[int]:
+        """
+        Returns the rows whose indexed name columns equal key exactly, in row order.
+        """
+        if not self._entry_keys:
+            return []
+        key_bytes = key.encode("utf-8")
+        slots, entry_keys, raw = self._slots, self._entry_keys, self._strings.raw
+        rows = []
+        slot = _hash_key(key_bytes) & self._mask
+        while True:
+            entry_index = slots[slot]
+            if entry_index == _EMPTY_SLOT:
+                break
+            if raw(entry_keys[entry_index]) == key_bytes:
+                rows.append(self._entry_rows[entry_index])
+            slot = (slot + 1) & self._mask
+        return sorted(set(rows))
+
+    def row(self, row_index: int) -> Dict[str, object]:
+        record: Dict[str, object] = {}
+        for column_name, (kind, values) in self._columns.items():
+            value = values[row_index]
+            record[column_name] = value if kind == _COLUMN_INT else self._strings[value]
+        return record
+
+
+class FacetSnapshot:
+    """
+    Read-only access to a compiled facet snapshot.
+
+    Opened from a file the snapshot is memory-mapped, so opening costs a header
+    parse and forked workers share the same physical pages. Tables are parsed
+    on first access.
+    """
+
+    def __init__(self, buffer, source: str) -> None:
+        self._buffer = buffer
+        self.source = source
+        view = memoryview(buffer)
+        if len(view) < _HEADER.size:
+            raise SnapshotError(f"'{source}' is truncated.")
+        magic, version, little_endian, fingerprint, section_count = _HEADER.unpack_from(view)
+        if magic != _MAGIC:
+            raise SnapshotError(f"'{source}' is not a facet snapshot.")
+        if version != SNAPSHOT_FORMAT_VERSION:
+            raise SnapshotError(f"'{source}' has format version {version}, expected {SNAPSHOT_FORMAT_VERSION}.")
+        if bool(little_endian) != (sys.byteorder == "little"):
+            raise SnapshotError(f"'{source}' was built on a machine with a different byte order.")
+        self.fingerprint: bytes = fingerprint
+        self._sections: Dict[str, memoryview] = {}
+        for i in range(section_count):
+            name, offset, length = _SECTION.unpack_from(view, _HEADER.size + i * _SECTION.size)
+            self._sections[name.rstrip(b"\x00").decode()] = view[offset : offset + length]
+        self._strings: Optional[StringTable] = None
+        self._tables: Dict[str, FacetTable] = {}
+
+    @classmethod
+    def open(cls, snapshot_path: str) -> "FacetSnapshot":
+        try:
+            with open(snapshot_path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise SnapshotError(f"Could not map '{snapshot_path}': {e}") from e
+        return cls(mapped, snapshot_path)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, source: str = "<memory>") -> "FacetSnapshot":
+        return cls(data, source)
+
+    def is_fresh(self, source_paths: Dict[str, str]) -> bool:
+        return self.fingerprint == source_fingerprint(source_paths)
+
+    @property
+    def strings(self) -> StringTable:
+        if self._strings is None:
+            offsets = self._sections["strings"].cast("i")
+            self._strings = StringTable(offsets, self._sections["string_blob"])
+        return self._strings
+
+    def table_names(self) -> List[str]:
+        return [name for name in self._sections if name in FACET_SPECS]
+
+    def table(self, facet_name: str) -> FacetTable:
+        table = self._tables.get(facet_name)
+        if table is None:
+            if facet_name not in FACET_SPECS or facet_name not in self._sections:
+                raise KeyError(f"Unknown facet '{facet_name}'")
+            table = FacetTable(facet_name, self._sections[facet_name].cast("i"), self.strings)
+            self._tables[facet_name] = table
+        return table
+
+
+def load_facets(source_paths: Dict[str, str], snapshot_path: Optional[str]) -> FacetSnapshot:
+    """
+    Opens the snapshot at snapshot_path, falling back to compiling the JSON
+    sources in memory when the snapshot is missing, unreadable or stale.
+
+    Args:
+        source_paths: Mapping of facet name to its JSON source file.
+        snapshot_path: Path of the compiled snapshot, or None to always use JSON.
+
+    Returns:
+        A FacetSnapshot over either the mapped file or the freshly compiled bytes.
+    """
+    if snapshot_path and os.path.exists(snapshot_path):
+        try:
+            snapshot = FacetSnapshot.open(snapshot_path)
+            if snapshot.is_fresh(source_paths):
+                return snapshot
+            print(
+                f"Warning: Facet snapshot '{snapshot_path}' is stale, loading JSON facets instead. "
+                "Rebuild it with `python -m internal.parameter_matching.facets_snapshot`."
+            )
+        except SnapshotError as e:
+            print(f"Warning: {e} Loading JSON facets instead.")
+    return FacetSnapshot.from_bytes(build_snapshot_bytes(source_paths), "<json>")
+
+
+default_facets_dir = os.path.join(os.path.dirname(__file__), "..", "..", "facets")
+default_snapshot_path = os.path.join(default_facets_dir, SNAPSHOT_FILE_NAME)
+
+if __name__ == "__main__":
+    # Build step: compile facets/*.json into facets/facets.snapshot
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compile facets/*.json into a binary snapshot.")
+    parser.add_argument("--facets-dir", default=default_facets_dir)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    output_path = args.output or os.path.join(args.facets_dir, SNAPSHOT_FILE_NAME)
+    size = write_snapshot(facet_source_paths(args.facets_dir), output_path)
+    print(f"Wrote {size:,} bytes to {os.path.normpath(output_path)}")
+
+    snapshot = FacetSnapshot.open(output_path)
+    for name in snapshot.table_names():
+        print(f"  {name}: {len(snapshot.table(name))} rows")
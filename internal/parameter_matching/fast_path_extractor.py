@@ -0,0 +1,338 @@
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from internal.parameter_matching.facets_config import config
+from internal.parameter_matching.parameter_matcher import MAX_AMBIGUOUS_CATEGORY_MATCHES
+from internal.utils.constants import (
+    COLOR_NAME_TO_FACET_NAME_MAP,
+    ENG_TO_JPN_CATEGORY_MAP,
+    FAST_PATH_FILLER_WORDS,
+    FAST_PATH_HEDGE_WORDS,
+    FAST_PATH_MAX_QUERY_WORDS,
+    FAST_PATH_MIN_BRAND_CHARS,
+    FAST_PATH_MIN_BRAND_LATIN_CHARS,
+    FAST_PATH_MIN_COVERAGE,
+    FAST_PATH_ORDINARY_WORDS,
+    ITEM_CONDITION_NAME_TO_ID_MAP,
+    SHIPPING_PAYER_PHRASE_TO_CODE_MAP,
+    SIZE_NAME_TO_FACET_NAME_MAP,
+)
+from internal.utils.text_utils import fold_text, normalize_text
+
+# An amount such as "5000", "¥5,000", "1.5万円" or "800 jpy"; groups: number, multiplier, currency
+_AMOUNT = r"(?:¥\s?)?(\d[\d,]*(?:\.\d+)?)\s?(万|千|k)?\s?(yen|jpy|円)?"
+_MULTIPLIERS = {"万": 10_000, "千": 1_000, "k": 1_000}
+
+# (pattern, bound) pairs tried in order; bound says which price fields the amounts fill
+_PRICE_PATTERNS = [
+    (re.compile(rf"(?:between\s+|from\s+)?{_AMOUNT}\s*(?:and|to|-|~|〜|から)\s*{_AMOUNT}\s*(?:まで|以内|以下)?"), "range"),
+    (re.compile(rf"(?:under|less than|below|up to|within|max(?:imum)?|no more than|cheaper than|<=?)\s*{_AMOUNT}"), "max"),
+    (re.compile(rf"{_AMOUNT}\s*(?:以下|未満|まで|以内|or less)"), "max"),
+    (re.compile(rf"(?:over|more than|above|at least|min(?:imum)?|>=?)\s*{_AMOUNT}"), "min"),
+    (re.compile(rf"{_AMOUNT}\s*(?:以上|から|and up|or more|\+)"), "min"),
+    (re.compile(rf"(?:exactly|price of)\s*{_AMOUNT}"), "exact"),
+]
+# A priced amount without a qualifier ("switch 20000円") is ambiguous
+_BARE_PRICE_RE = re.compile(rf"(?<![\w.]){_AMOUNT}(?![\w.])")
+
+_PARTICLES = "のをがでとはにも"
+_SEPARATORS = r"\s,、。!?！？()（）\[\]「」"
+_TOKEN_RE = re.compile(rf"[^{_SEPARATORS}]+")
+_SEPARATOR_RE = re.compile(rf"[{_SEPARATORS}]")
+# Splits category and facet names into words: "Tシャツ/カットソー(半袖/袖なし)" -> "tシャツ", "カットソー", ...
+_NAME_WORD_SPLIT_RE = re.compile(r"[\W_]+")
+
+
+def _phrase_pattern(phrases) -> "re.Pattern":
+    """Alternation of phrases, longest first; ASCII phrases must be whole words."""
+    alternatives = []
+    for phrase in sorted(phrases, key=len, reverse=True):
+        escaped = re.escape(phrase)
+        alternatives.append(rf"(?<![a-z0-9]){escaped}(?![a-z0-9])" if phrase.isascii() else escaped)
+    return re.compile("|".join(alternatives))
+
+
+_CONDITION_RE = _phrase_pattern(ITEM_CONDITION_NAME_TO_ID_MAP)
+_SHIPPING_RE = _phrase_pattern(SHIPPING_PAYER_PHRASE_TO_CODE_MAP)
+
+
+def _amount_value(number: str, multiplier: Optional[str]) -> int:
+    return int(float(number.replace(",", "")) * _MULTIPLIERS.get(multiplier, 1))
+
+
+@dataclass
+class FastPathResult:
+    """Outcome of the rule-based extraction of one request."""
+
+    params: Dict[str, Any]  # Same shape as the LLM's (with category/brand IDs)
+    coverage: float  # Share of the request explained by the rules (0-1)
+    confident: bool  # True if the LLM can be skipped
+    unexplained: List[str] = field(default_factory=list)  # Words the rules could not use
+
+
+class FastPathExtractor:
+    """
+    Deterministic parameter extractor for simple requests such as
+    "seiko watch under 5000 yen" or "nintendo switch new".
+
+    Recognises prices (yen/JPY/円/¥, commas, 万/千), ranges and bounds in English
+    and Japanese, condition words, shipping payer phrases, unambiguous brands
+    (via the brand automaton, see _find_brands) and exact category names. What is left becomes the query. The
+    result is confident when at least min_coverage of the request was
+    explained, nothing vague (see FAST_PATH_HEDGE_WORDS) was found and the
+    query is short; otherwise the caller should use the LLM.
+    """
+
+    def __init__(
+        self,
+        config=config,
+        min_coverage: float = FAST_PATH_MIN_COVERAGE,
+        max_query_words: int = FAST_PATH_MAX_QUERY_WORDS,
+    ) -> None:
+        """
+        Args:
+            config: FacetsConfig providing the brand matcher and category tree.
+            min_coverage: Minimum share of explained words for a confident result.
+            max_query_words: Query words beyond this count as unexplained.
+        """
+        self.config = config
+        self.min_coverage = min_coverage
+        self.max_query_words = max_query_words
+        self._lock = threading.Lock()
+        self._ordinary: Optional[FrozenSet[str]] = None
+        self.attempts = 0
+        self.served = 0
+
+    def _extract_prices(self, text: str, spans: List[Tuple[int, int]]) -> Tuple[Optional[int], Optional[int]]:
+        for pattern, bound in _PRICE_PATTERNS:
+            match = pattern.search(text)
+            if match is None:
+                continue
+            groups = match.groups()
+            amounts = [
+                (groups[i], groups[i + 1], groups[i + 2]) for i in range(0, len(groups), 3)
+            ]
+            # Plain numbers need a currency somewhere ("500 to 800 yen"), or a word bound ("under 5000")
+            if bound == "range" and not any(multiplier or currency for _, multiplier, currency in amounts):
+                continue
+            spans.append(match.span())
+            values = [_amount_value(number, multiplier) for number, multiplier, _ in amounts]
+            if bound == "range":
+                return min(values), max(values)
+            if bound == "max":
+                return None, values[0]
+            if bound == "min":
+                return values[0], None
+            return values[0], values[0]
+        return None, None
+
+    def _ordinary_words(self) -> FrozenSet[str]:
+        """
+        FAST_PATH_ORDINARY_WORDS plus the words of category, color, size and
+        condition names, normalised and without spaces.
+        """
+        if self._ordinary is None:
+            names = [*FAST_PATH_ORDINARY_WORDS, *ITEM_CONDITION_NAME_TO_ID_MAP, *SHIPPING_PAYER_PHRASE_TO_CODE_MAP]
+            names += [*ENG_TO_JPN_CATEGORY_MAP, *ENG_TO_JPN_CATEGORY_MAP.values()]
+            names += [*COLOR_NAME_TO_FACET_NAME_MAP, *COLOR_NAME_TO_FACET_NAME_MAP.values()]
+            names += [*SIZE_NAME_TO_FACET_NAME_MAP, *SIZE_NAME_TO_FACET_NAME_MAP.values()]
+            words = {_compact(name) for name in names}
+            for name in [*names, *self.config.category_tree.names]:
+                words.update(_NAME_WORD_SPLIT_RE.split(normalize_text(name)))
+            words.update(word[: -len("系")] for word in list(words) if word.endswith("系"))  # "ブラック系"
+            words.discard("")
+            self._ordinary = frozenset(words)
+        return self._ordinary
+
+    def _is_whole_token(self, text: str, start: int, end: int) -> bool:
+        """True if text[start:end] is a token of its own (a Japanese one may be followed by a particle)."""
+        if start > 0 and not _SEPARATOR_RE.match(text[start - 1]):
+            return False
+        if end == len(text) or _SEPARATOR_RE.match(text[end]):
+            return True
+        return not text[start:end].isascii() and text[end] in _PARTICLES
+
+    def _find_brands(
+        self, text: str, spans: List[Tuple[int, int]], unclear_spans: List[Tuple[int, int]]
+    ) -> List[int]:
+        """
+        Brand IDs of the unambiguous brand mentions in text; their spans go to
+        spans and the spans of the other mentions to unclear_spans.
+
+        Only whole tokens count as mentions (the シャツ in "tシャツ" is part of
+        a word). A mention is used if it is at least
+        FAST_PATH_MIN_BRAND_LATIN_CHARS (Latin) or FAST_PATH_MIN_BRAND_CHARS
+        long, names a single brand, and neither it nor the brand's names are
+        ordinary words (see _ordinary_words()): "mac book air" or "gift for
+        mother" name no brand, and only the LLM can tell when they do.
+        """
+        matcher = self.config.brand_matcher
+        ordinary = self._ordinary_words()
+        brands_by_span: Dict[Tuple[int, int], List[int]] = {}
+        for match in matcher.find_in_text(text):
+            brands_by_span.setdefault((match.start, match.end), []).append(match.brand_id)
+
+        brand_ids = []
+        for (start, end), span_brand_ids in brands_by_span.items():
+            if not self._is_whole_token(text, start, end):
+                continue
+            mention = _compact(text[start:end])
+            min_chars = FAST_PATH_MIN_BRAND_LATIN_CHARS if mention.isascii() else FAST_PATH_MIN_BRAND_CHARS
+            names = {_compact(name) for name in matcher.names_for_ids(span_brand_ids[:1])}
+            clear = (
+                len(set(span_brand_ids)) == 1
+                and len(mention) >= min_chars
+                and mention not in ordinary
+                and not names & ordinary
+            )
+            if clear:
+                brand_ids.append(span_brand_ids[0])
+                spans.append((start, end))
+            else:
+                unclear_spans.append((start, end))
+        return list(dict.fromkeys(brand_ids))
+
+    def _category_rows(self, word: str) -> List[int]:
+        category_name = ENG_TO_JPN_CATEGORY_MAP.get(word, word)
+        rows = self.config.category_tree.resolve(category_name)
+        return rows if len(rows) <= MAX_AMBIGUOUS_CATEGORY_MATCHES else []
+
+    def extract(self, user_request_text: str) -> FastPathResult:
+        """
+        Extracts search parameters from a request without the LLM.
+
+        Args:
+            user_request_text: The user's request.
+
+        Returns:
+            A FastPathResult; use its params only if confident is True.
+        """
+        text = fold_text(user_request_text or "")
+        spans: List[Tuple[int, int]] = []  # Character ranges consumed by the rules
+        explained = 0
+
+        price_min, price_max = self._extract_prices(text, spans)
+        explained += len(spans)
+
+        # Brands first, so "new balance" is a brand and not a condition
+        brand_spans: List[Tuple[int, int]] = []
+        unclear_brand_spans: List[Tuple[int, int]] = []  # Possible brands the rules cannot decide on
+        brand_ids = self._find_brands(text, brand_spans, unclear_brand_spans)  # Counted below as query words
+
+        def overlaps(start, end, ranges):
+            return any(start < range_end and range_start < end for range_start, range_end in ranges)
+
+        item_conditions = []
+        for match in _CONDITION_RE.finditer(text):
+            if not overlaps(*match.span(), spans + brand_spans):
+                item_conditions.append(match.group())
+                spans.append(match.span())
+                explained += 1
+
+        shipping_payer = []
+        for match in _SHIPPING_RE.finditer(text):
+            if not overlaps(*match.span(), spans + brand_spans):
+                shipping_payer.append(SHIPPING_PAYER_PHRASE_TO_CODE_MAP[match.group()])
+                spans.append(match.span())
+                explained += 1
+
+        # Brand names stay in the query (as the LLM does); the other matches are removed
+        remaining = list(text)
+        for start, end in spans:
+            for i in range(start, end):
+                remaining[i] = " "
+        remaining_text = "".join(remaining)
+        # Particles left next to a removed phrase, e.g. "ナイキの新品" -> "ナイキの "
+        remaining_text = re.sub(rf"(?<=\S)[{_PARTICLES}](?=\s|$)", " ", remaining_text)
+        remaining_text = re.sub(rf"(?:(?<=\s)|^)[{_PARTICLES}](?=\S)", " ", remaining_text)  # Keeps offsets
+
+        unexplained: List[str] = []
+        hedged = False
+        query_words: List[str] = []
+        category_rows: List[int] = []
+        for token in _TOKEN_RE.finditer(remaining_text):
+            word = token.group()
+            if overlaps(*token.span(), unclear_brand_spans):
+                unexplained.append(word)  # Maybe a brand, maybe an ordinary word
+            elif word in FAST_PATH_FILLER_WORDS:
+                explained += 1
+            elif word in FAST_PATH_HEDGE_WORDS or any(hedge in word for hedge in FAST_PATH_HEDGE_WORDS if not hedge.isascii()):
+                hedged = True
+                unexplained.append(word)
+            elif _BARE_PRICE_RE.fullmatch(word) and _BARE_PRICE_RE.fullmatch(word).group(3):
+                unexplained.append(word)  # A price without "under"/"以下"/...
+            else:
+                query_words.append(word)
+
+        # Exact category names become category filters (but never the whole query)
+        kept_words = []
+        for word in query_words:
+            rows = self._category_rows(word)
+            if rows and len(query_words) > 1:
+                category_rows.extend(rows)
+                explained += 1
+            else:
+                kept_words.append(word)
+        if len(kept_words) > self.max_query_words:
+            unexplained.extend(kept_words[self.max_query_words :])
+        explained += min(len(kept_words), self.max_query_words)
+
+        total = explained + len(unexplained)
+        coverage = explained / total if total else 0.0
+        category_ids = self.config.category_tree.compact_ids(
+            [self.config.category_tree.ids[row] for row in category_rows]
+        )
+        params = {
+            "query": " ".join(kept_words),
+            "price_min": price_min,
+            "price_max": price_max,
+            "categories": category_ids or [],
+            "brands": brand_ids or [],
+            "item_conditions": item_conditions,
+            "shipping_payer": list(dict.fromkeys(shipping_payer)),
+            "sizes": [],  # Sizes and colors stay in the query
+            "colors": [],
+            "sort_by": "",
+            "sort_order": "",
+        }
+        confident = bool(kept_words) and not hedged and coverage >= self.min_coverage
+        with self._lock:
+            self.attempts += 1
+            if confident:
+                self.served += 1
+        return FastPathResult(params, coverage, confident, unexplained)
+
+    def stats(self) -> Dict[str, Any]:
+        """How many requests were tried and how many were served without the LLM."""
+        return {
+            "attempts": self.attempts,
+            "served": self.served,
+            "fast_path_share": self.served / self.attempts if self.attempts else 0.0,
+        }
+
+
+def _compact(name: str) -> str:
+    """Normalised name without spaces and separators: "Louis Vuitton" -> "louisvuitton"."""
+    return re.sub(r"[\s・]+", "", normalize_text(name))
+
+
+# Shared extractor instance - facet indexes are loaded on first use
+fast_path_extractor = FastPathExtractor()
+
+if __name__ == "__main__":
+    examples = [
+        "seiko watch under 5000 yen",
+        "one piece manga, in 500 jpy to 800 jpy",
+        "nintendo switch new",
+        "ナイキのスニーカー 1万円以下 送料込み",
+        "iPhone 13 ケース 2,000円から3,000円 未使用",
+        "I'm looking for a nice gift for my mother, not too expensive",
+        "mac book air 2020 under 50000 yen",
+    ]
+    for example in examples:
+        result = fast_path_extractor.extract(example)
+        print(f"{example!r}: confident={result.confident} coverage={result.coverage:.2f}")
+        print(f"    {result.params}")
+    print(fast_path_extractor.stats())
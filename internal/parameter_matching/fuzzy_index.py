@@ -0,0 +1,128 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+
+from internal.utils.text_utils import normalize_text
+
+_SEPARATORS_RE = re.compile(r"[\s・/、,&()（）]+")
+
+
+class FuzzyMatch(NamedTuple):
+    key: int  # Caller supplied key, e.g. a category row
+    score: float  # Cosine similarity in [0, 1]
+    text: str  # The indexed text that produced the score
+
+
+def char_ngrams(text: str, sizes: Tuple[int, ...] = (2, 3)) -> Counter:
+    """
+    Returns the character n-gram counts of the normalised text, padded with a
+    space on both sides so word starts and ends count as features.
+    """
+    normalized = " " + _SEPARATORS_RE.sub(" ", normalize_text(text)).strip() + " "
+    grams: Counter = Counter()
+    for size in sizes:
+        for start in range(len(normalized) - size + 1):
+            grams[normalized[start : start + size]] += 1
+    return grams
+
+
+class NGramIndex:
+    """
+    Character n-gram TF-IDF index returning the top-k closest texts with scores.
+
+    Every document is an L2-normalised sparse vector, stored as a column of an
+    n-grams x documents matrix in CSR form (NumPy arrays of row pointers,
+    document indices and weights; each row is the posting list of one
+    n-gram). A query is a single sparse vector-matrix product that only reads
+    the rows of the query's n-grams.
+    """
+
+    def __init__(self, documents: Iterable[Tuple[str, int]], ngram_sizes: Tuple[int, ...] = (2, 3)) -> None:
+        """
+        Builds the index.
+
+        Args:
+            documents: (text, key) pairs. Several texts may share a key (e.g. a
+                category name and its English aliases).
+            ngram_sizes: Character n-gram sizes to index.
+        """
+        self.ngram_sizes = ngram_sizes
+        self.texts: List[str] = []
+        keys = []
+        document_grams: List[Counter] = []
+        document_frequency: Counter = Counter()
+        for text, key in documents:
+            grams = char_ngrams(text, ngram_sizes)
+            if not grams:
+                continue
+            self.texts.append(text)
+            keys.append(key)
+            document_grams.append(grams)
+            document_frequency.update(grams.keys())
+
+        document_count = len(document_grams)
+        self.keys = np.array(keys, dtype=np.int64)
+        self._rows: Dict[str, int] = {gram: row for row, gram in enumerate(document_frequency)}
+        frequencies = np.fromiter(document_frequency.values(), dtype=np.float64, count=len(document_frequency))
+        self._idf = np.log((1 + document_count) / (1 + frequencies)) + 1.0
+
+        # Coordinates (n-gram row, document, tf-idf weight), then sorted into CSR by row
+        lengths = np.array([len(grams) for grams in document_grams], dtype=np.int64)
+        entries = int(lengths.sum())
+        rows = np.fromiter((self._rows[gram] for grams in document_grams for gram in grams), np.int64, entries)
+        counts = np.fromiter((count for grams in document_grams for count in grams.values()), np.float64, entries)
+        documents_of_entries = np.repeat(np.arange(document_count), lengths)
+        weights = counts * self._idf[rows]
+        norms = np.sqrt(np.bincount(documents_of_entries, weights=weights * weights, minlength=document_count))
+        weights /= norms[documents_of_entries]
+        order = np.argsort(rows, kind="stable")
+        self._indptr = np.zeros(len(self._rows) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(self._rows)), out=self._indptr[1:])
+        self._indices = documents_of_entries[order]
+        self._data = weights[order]
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def search(self, query: str, top_k: int = 5, min_score: float = 0.0) -> List[FuzzyMatch]:
+        """
+        Returns up to top_k matches for query, best first, one per key.
+
+        Args:
+            query: Free text to match.
+            top_k: Maximum number of distinct keys to return.
+            min_score: Matches scoring below this cosine similarity are dropped.
+
+        Returns:
+            A list of FuzzyMatch ordered by descending score.
+        """
+        grams = char_ngrams(query, self.ngram_sizes)
+        known = [(self._rows[gram], count) for gram, count in grams.items() if gram in self._rows]
+        if not known:
+            return []
+        rows = np.array([row for row, _ in known], dtype=np.int64)
+        weights = np.array([count for _, count in known], dtype=np.float64) * self._idf[rows]
+        # Unknown n-grams get the highest idf and still count towards the query norm
+        unseen_idf = math.log(1 + len(self)) + 1.0
+        unseen = sum((count * unseen_idf) ** 2 for gram, count in grams.items() if gram not in self._rows)
+        weights /= math.sqrt(float(weights @ weights) + unseen)
+
+        # Sparse query x CSR matrix: gather the query's rows, sum their weights per document
+        starts, ends = self._indptr[rows], self._indptr[rows + 1]
+        lengths = ends - starts
+        entries = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        scores = np.bincount(
+            self._indices[entries], weights=self._data[entries] * np.repeat(weights, lengths), minlength=len(self)
+        )
+        candidates = np.flatnonzero((scores > 0) & (scores >= min_score))
+        # Best first, then the first document of each key
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        _, first = np.unique(self.keys[candidates], return_index=True)
+        ranked = candidates[np.sort(first)][:top_k]
+        return [
+            FuzzyMatch(int(self.keys[document_id]), min(float(scores[document_id]), 1.0), self.texts[document_id])
+            for document_id in ranked
+        ]
@@ -1,10 +1,119 @@
 from internal.parameter_matching.facets_config import config
-from internal.utils.constants import ENG_TO_JPN_CATEGORY_MAP
+from internal.parameter_matching.fuzzy_index import NGramIndex
+from internal.utils.constants import (
+    CATEGORY_FUZZY_MATCH_THRESHOLD,
+    CATEGORY_FUZZY_RELATIVE_MARGIN,
+    CATEGORY_FUZZY_TOP_K,
+    ENG_TO_JPN_CATEGORY_MAP,
+)
+from internal.utils.telemetry import telemetry
+
+
+# Bare names matching more categories than this (e.g. "その他") are ignored unless
+# another extracted category narrows them down
+MAX_AMBIGUOUS_CATEGORY_MATCHES = 3
 
 
 class ParameterMatcher:
-    def __init__(self, config=config):
+    def __init__(self, config=config, fuzzy_threshold=CATEGORY_FUZZY_MATCH_THRESHOLD):
         self.config = config
+        self.fuzzy_threshold = fuzzy_threshold
+        self._category_fuzzy_index = None
+
+    @property
+    def category_fuzzy_index(self):
+        """
+        N-gram index over every path-qualified category name and the English
+        aliases in ENG_TO_JPN_CATEGORY_MAP, keyed by category row. Built on first use.
+        """
+        if self._category_fuzzy_index is None:
+            category_tree = self.config.category_tree
+            # Exact names are resolved through the tree first, so only the
+            # path-qualified names are indexed; they also disambiguate duplicates
+            documents = [
+                (category_tree.path_name(row), row) for row in range(len(category_tree))
+            ]
+            for english_name, japanese_name in ENG_TO_JPN_CATEGORY_MAP.items():
+                rows = category_tree.resolve(japanese_name)
+                if len(rows) <= MAX_AMBIGUOUS_CATEGORY_MATCHES:
+                    documents.extend((english_name, row) for row in rows)
+            self._category_fuzzy_index = NGramIndex(documents)
+        return self._category_fuzzy_index
+
+    def fuzzy_match_categories(self, category_name, top_k=CATEGORY_FUZZY_TOP_K):
+        """
+        Returns the top_k closest categories to category_name as FuzzyMatch
+        (key=category row, score in [0, 1]), best first, regardless of threshold.
+        """
+        return self.category_fuzzy_index.search(category_name, top_k)
+
+    def resolve_category_rows(self, extracted_category_names):
+        """
+        Resolves extracted category names (English, Japanese or path-qualified like
+        "レディース/トップス") to rows of the category tree.
+
+        Names without an exact match fall back to the n-gram index and take the best
+        scoring categories if they reach fuzzy_threshold.
+
+        Ambiguous bare names are narrowed to the subtrees of the other extracted
+        categories when possible (e.g. ["レディース", "トップス"] selects only
+        "レディース/トップス"), and dropped if they remain too ambiguous.
+
+        Args:
+            extracted_category_names: A list of category names (strings) extracted by the LLM.
+
+        Returns:
+            A list of (extracted_name, rows, match_count) tuples, one per extracted name.
+            rows is empty for unmatched names and for names left ambiguous, in which
+            case match_count holds the number of categories they matched.
+        """
+        category_tree = self.config.category_tree
+        candidates = []
+        for extracted_name in extracted_category_names:
+            category_name = ENG_TO_JPN_CATEGORY_MAP.get(
+                extracted_name.lower(), extracted_name
+            )  # Translate English to Japanese
+            rows = category_tree.resolve(category_name)
+            if not rows:
+                rows = self._fuzzy_rows(extracted_name)
+            candidates.append((extracted_name, rows))
+
+        anchor_rows = [rows[0] for _, rows in candidates if len(rows) == 1]
+        resolved = []
+        for extracted_name, rows in candidates:
+            if len(rows) > 1:
+                # Prefer direct children of an anchor, then any descendant
+                narrowed = [
+                    row for row in rows if category_tree.parents[row] in anchor_rows
+                ] or [
+                    row
+                    for row in rows
+                    if any(
+                        category_tree.is_ancestor(anchor, row) and anchor != row
+                        for anchor in anchor_rows
+                    )
+                ]
+                rows = narrowed or rows
+            match_count = len(rows)
+            if match_count > MAX_AMBIGUOUS_CATEGORY_MATCHES:
+                rows = []
+            resolved.append((extracted_name, rows, match_count))
+        return resolved
+
+    def _fuzzy_rows(self, category_name):
+        """
+        Rows scoring within CATEGORY_FUZZY_RELATIVE_MARGIN of the best fuzzy score,
+        if that score reaches the threshold. More rows than
+        MAX_AMBIGUOUS_CATEGORY_MATCHES make the name ambiguous unless another
+        extracted category narrows them down (see resolve_category_rows).
+        """
+        fuzzy_matches = self.category_fuzzy_index.search(
+            category_name, CATEGORY_FUZZY_TOP_K, min_score=self.fuzzy_threshold
+        )
+        if not fuzzy_matches:
+            return []
+        cutoff = fuzzy_matches[0].score * (1 - CATEGORY_FUZZY_RELATIVE_MARGIN)
+        return sorted(match.key for match in fuzzy_matches if match.score >= cutoff)
 
     def match_category_names_to_ids(self, extracted_category_names):
         """
@@ -12,6 +121,12 @@ class ParameterMatcher:
         Attempts to translate English category names to Japanese before matching.
         Returns IDs for successfully matched categories, ignores unmatched ones. (Relaxed Matching)
 
+        A category that only gave context to another extracted name is not sent:
+        ["レディース", "トップス"] selects "レディース/トップス" alone, not all of
+        "レディース". The result is then compacted against the category tree:
+        children of a matched parent are dropped and complete sibling sets are
+        replaced by their parent.
+
         Args:
             extracted_category_names: A list of category names (strings) extracted by the LLM.
 
@@ -19,29 +134,72 @@ class ParameterMatcher:
             A list of Mercari category IDs (integers) corresponding to the valid matched category names.
             Returns a list of IDs for categories that *were* successfully matched (can be empty if no matches).
         """
-        matched_category_ids = []
-        category_name_to_id_map = self.config.category_name_to_id_map
+        category_tree = self.config.category_tree
+        matched_rows = []
 
-        for extracted_name in extracted_category_names:
-            japanese_name = ""
-            category_name = (
-                extracted_name  # Default to extracted name if no match found
-            )
-            lower_category_name = category_name.lower()
-            if lower_category_name in ENG_TO_JPN_CATEGORY_MAP:
-                japanese_name = ENG_TO_JPN_CATEGORY_MAP[
-                    lower_category_name
-                ]  # Translate English to Japanese
-
-            if japanese_name in category_name_to_id_map:
-                matched_category_ids.append(category_name_to_id_map[japanese_name])
+        resolved = self.resolve_category_rows(extracted_category_names)
+        for extracted_name, rows, match_count in resolved:
+            if rows:
+                telemetry.count("category_names_total", result="matched")
+                matched_rows.append(rows)
+            elif match_count:
+                telemetry.count("category_names_total", result="ambiguous")
+                telemetry.event(
+                    "warning",
+                    "category_ambiguous",
+                    f"Extracted category name '{extracted_name}' matches {match_count} categories "
+                    "and will be ignored. Use a path-qualified name such as 'レディース/トップス'.",
+                    category=extracted_name,
+                    matches=match_count,
+                )
             else:
-                print(
-                    f"Warning: Extracted category name '{extracted_name}' (or its English version) does not perfectly match valid Mercari categories and will be ignored."
+                telemetry.count("category_names_total", result="unmatched")
+                telemetry.event(
+                    "warning",
+                    "category_unmatched",
+                    f"Extracted category name '{extracted_name}' (or its English version) does not perfectly match valid Mercari categories and will be ignored.",
+                    category=extracted_name,
                 )
                 # Now, just ignore and continue to the next category, instead of returning empty list
 
-        return matched_category_ids  # Return IDs of successfully matched categories, even if some were not matched
+        # Drop anchors that another name resolved under, before compaction would
+        # let them swallow the narrower match
+        matched_category_ids = []
+        for index, rows in enumerate(matched_rows):
+            if len(rows) == 1 and any(
+                category_tree.is_ancestor(rows[0], row) and row != rows[0]
+                for other, other_rows in enumerate(matched_rows)
+                if other != index
+                for row in other_rows
+            ):
+                continue
+            matched_category_ids.extend(category_tree.ids[row] for row in rows)
+
+        return category_tree.compact_ids(
+            matched_category_ids
+        )  # Return IDs of successfully matched categories, even if some were not matched
+
+    def match_brand_names_to_ids(self, extracted_brand_names, user_request_text=None):
+        """
+        Matches extracted brand names (katakana or Latin, any width/case) to Mercari brand IDs.
+
+        If the LLM extracted brand names but none of them is a known brand, the
+        original user request is scanned for brand mentions instead.
+
+        Args:
+            extracted_brand_names: A list of brand names (strings) extracted by the LLM.
+            user_request_text: (Optional) The original user request.
+
+        Returns:
+            A list of Mercari brand IDs (integers), empty if no brand matched.
+        """
+        brand_matcher = self.config.brand_matcher
+        matched_brand_ids = brand_matcher.match_brand_names_to_ids(extracted_brand_names)
+        if not matched_brand_ids and extracted_brand_names and user_request_text:
+            matched_brand_ids = [
+                match.brand_id for match in brand_matcher.find_in_text(user_request_text)
+            ]
+        return list(dict.fromkeys(matched_brand_ids))
 
 
 # Initialize ParameterMatcher
@@ -60,6 +218,12 @@ if __name__ == "__main__":
         "NonExistentCategory",
         "electronics & gadgets",
         "Fashion",
+        "レディース/トップス",
+        "トップス",
+        "レディース トップス",
+        "ワンピ",
+        "womens tops",
+        "manga comics",
     ]
 
     matched_ids = matcher.match_category_names_to_ids(test_category_names)
@@ -68,3 +232,13 @@ if __name__ == "__main__":
     print(
         "Matched Category IDs (relaxed matching):", matched_ids
     )  # Indicate relaxed matching in output
+
+    test_brand_names = ["Nintendo", "ｓｏｎｙ", "ルイヴィトン", "NonExistentBrand"]
+    print("Extracted Brand Names:", test_brand_names)
+    print("Matched Brand IDs:", matcher.match_brand_names_to_ids(test_brand_names))
+
+    category_tree = matcher.config.category_tree
+    for fuzzy_name in ["レディース スニーカー", "electronic", "comic manga"]:
+        print(f"Closest categories to '{fuzzy_name}':")
+        for fuzzy_match in matcher.fuzzy_match_categories(fuzzy_name, top_k=3):
+            print(f"  {fuzzy_match.score:.2f} {category_tree.path_name(fuzzy_match.key)}")
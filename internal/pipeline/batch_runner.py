@@ -0,0 +1,186 @@
+import asyncio
+import contextvars
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional, TextIO, Tuple
+
+from internal.llm.llm_scheduler import llm_priority
+from internal.utils.constants import (
+    BATCH_LLM_CONCURRENCY,
+    BATCH_SEARCH_CONCURRENCY,
+    LLM_PRIORITY_BATCH,
+)
+from internal.utils.telemetry import telemetry
+
+
+@dataclass
+class BatchStages:
+    """The per-request pipeline stages (the CLI's handle_* functions)."""
+
+    extract: Callable[[str], Optional[Dict[str, Any]]]
+    search: Callable[[Dict[str, Any]], Any]
+    recommend: Callable[[str, Any, Dict[str, Any]], Optional[Dict[str, Any]]]
+
+
+def iter_batch_requests(input_file: TextIO) -> Iterator[Tuple[str, str]]:
+    """
+    Lazily reads (request_id, request_text) pairs from a JSONL file.
+
+    Each line is either a JSON object with the text in "request", "text" or
+    "query" (and an optional "request_id" or "id"), a JSON string, or plain
+    text. Lines without an ID are numbered from 1. Blank lines are skipped.
+    """
+    for line_number, line in enumerate(input_file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            record = line
+        if isinstance(record, dict):
+            request_id = record.get("request_id", record.get("id", line_number))
+            text = record.get("request") or record.get("text") or record.get("query") or ""
+        else:
+            request_id, text = line_number, str(record)
+        yield str(request_id), text
+
+
+class BatchRunner:
+    """
+    Runs many shopper requests through extraction -> search -> recommendation.
+
+    Requests are streamed from the input and pipelined: while one request waits
+    on the LLM, others can be searching Mercari. The LLM stages (extraction and
+    recommendation) and the Mercari stage have separate concurrency limits, and
+    at most max_in_flight requests are held in memory at once, so memory stays
+    flat regardless of the input size. Results are written as JSONL in
+    completion order, with the request ID and per-stage timings.
+    """
+
+    def __init__(
+        self,
+        stages: BatchStages,
+        llm_concurrency: int = BATCH_LLM_CONCURRENCY,
+        search_concurrency: int = BATCH_SEARCH_CONCURRENCY,
+        max_in_flight: Optional[int] = None,
+    ) -> None:
+        """
+        Args:
+            stages: The pipeline stage functions (blocking; run on worker threads).
+            llm_concurrency: Maximum concurrent LLM calls (extraction + recommendation).
+            search_concurrency: Maximum concurrent Mercari searches.
+            max_in_flight: Maximum requests in progress; defaults to twice the sum of both limits.
+        """
+        self.stages = stages
+        self.llm_concurrency = llm_concurrency
+        self.search_concurrency = search_concurrency
+        self.max_in_flight = max_in_flight or 2 * (llm_concurrency + search_concurrency)
+        self.completed = 0
+        self.failed = 0
+
+    async def _run_stage(self, executor, semaphore, timings, stage_name, function, *args):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                # Copy the context so the stage's spans join the request's trace
+                context = contextvars.copy_context()
+                return await asyncio.get_running_loop().run_in_executor(
+                    executor, context.run, function, *args
+                )
+            finally:
+                timings[stage_name] = round((time.perf_counter() - start) * 1000, 1)
+
+    async def _process(self, executor, llm_semaphore, search_semaphore, request_id, text):
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        result: Dict[str, Any] = {"request_id": request_id, "request": text}
+        try:
+            params = await self._run_stage(
+                executor, llm_semaphore, timings, "extraction", self.stages.extract, text
+            )
+            result["params"] = params
+            if not params:
+                result["status"] = "extraction_failed"
+                return result
+
+            search_result = await self._run_stage(
+                executor, search_semaphore, timings, "search", self.stages.search, params
+            )
+            if not search_result:
+                result["status"] = "search_failed"
+                return result
+            result["item_count"] = len(search_result.items)
+            result["pages_fetched"] = getattr(search_result, "pages_fetched", None)
+            result["filter_placements"] = getattr(search_result, "filter_placements", {})
+
+            recommendations = await self._run_stage(
+                executor,
+                llm_semaphore,
+                timings,
+                "recommendation",
+                self.stages.recommend,
+                text,
+                search_result,
+                params,
+            )
+            result["recommendations"] = (recommendations or {}).get("recommendations", [])
+            result["status"] = "ok"
+            return result
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = str(e)
+            return result
+        finally:
+            timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+            result["timings_ms"] = timings
+
+    async def run(self, input_file: TextIO, output_file: TextIO, progress_file: Optional[TextIO] = sys.stderr) -> None:
+        """
+        Processes every request in input_file and writes one JSON line per request to output_file.
+        """
+        llm_semaphore = asyncio.Semaphore(self.llm_concurrency)
+        search_semaphore = asyncio.Semaphore(self.search_concurrency)
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        pending = set()
+        executor = ThreadPoolExecutor(
+            max_workers=self.llm_concurrency + self.search_concurrency,
+            thread_name_prefix="batch-stage",
+        )
+
+        async def process_and_write(request_id, text):
+            try:
+                # Batch LLM calls queue behind interactive ones on a shared scheduler
+                with llm_priority(LLM_PRIORITY_BATCH), telemetry.span(
+                    "request", request_id=request_id
+                ) as span:
+                    result = await self._process(
+                        executor, llm_semaphore, search_semaphore, request_id, text
+                    )
+                    span.set(status=result["status"])
+                output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output_file.flush()
+                self.completed += 1
+                if result["status"] != "ok":
+                    self.failed += 1
+                if progress_file is not None:
+                    print(
+                        f"[{self.completed}] {request_id}: {result['status']} ({result['timings_ms']['total']:.0f} ms)",
+                        file=progress_file,
+                    )
+            finally:
+                in_flight.release()
+
+        try:
+            for request_id, text in iter_batch_requests(input_file):
+                await in_flight.acquire()  # Backpressure: only read ahead max_in_flight lines
+                task = asyncio.ensure_future(process_and_write(request_id, text))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            executor.shutdown(wait=False)
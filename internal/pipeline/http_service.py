@@ -0,0 +1,549 @@
+import asyncio
+import contextvars
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Optional
+
+from internal.pipeline.batch_runner import BatchStages
+from internal.utils.constants import (
+    ITEM_CONDITION_ID_TO_NAME_MAP,
+    SERVICE_HOST,
+    SERVICE_IDLE_TIMEOUT_SECONDS,
+    SERVICE_LLM_CONCURRENCY,
+    SERVICE_MAX_BODY_BYTES,
+    SERVICE_MAX_IN_FLIGHT,
+    SERVICE_MAX_REQUEST_TIMEOUT_SECONDS,
+    SERVICE_PORT,
+    SERVICE_REQUEST_TIMEOUT_SECONDS,
+    SERVICE_SEARCH_CONCURRENCY,
+)
+from internal.utils.telemetry import telemetry
+
+STATUS_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    501: "Not Implemented",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+
+class HTTPError(Exception):
+    """An error that is answered with the given HTTP status and a JSON body."""
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class DeadlineExceeded(HTTPError):
+    """The request's deadline passed while waiting for or running a stage."""
+
+    def __init__(self, stage: str) -> None:
+        super().__init__(504, f"Deadline exceeded during {stage}")
+        self.stage = stage
+
+
+@dataclass
+class HTTPRequest:
+    method: str
+    path: str
+    query: str = ""
+    headers: Dict[str, str] = field(default_factory=dict)  # Lower-case names
+    body: bytes = b""
+    version: str = "HTTP/1.1"
+    response_started: bool = False  # Set once the response head has been written
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    def json(self) -> Dict[str, Any]:
+        """The body as a JSON object (an empty body is an empty object)."""
+        if not self.body:
+            return {}
+        try:
+            payload = json.loads(self.body)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise HTTPError(400, f"Invalid JSON body: {e}")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "The JSON body must be an object")
+        return payload
+
+
+async def read_request(reader: asyncio.StreamReader, max_body_bytes: int) -> Optional[HTTPRequest]:
+    """
+    Reads one HTTP/1.x request.
+
+    Returns:
+        The request, or None if the client closed the connection between requests.
+
+    Raises:
+        HTTPError: If the request is malformed or too large.
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise HTTPError(400, "Incomplete request")
+    except asyncio.LimitOverrunError:
+        raise HTTPError(431, "Request headers too large")
+
+    request_line, *header_lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = request_line.split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    for line in header_lines:
+        if not line:
+            continue
+        name, separator, value = line.partition(":")
+        if not separator:
+            raise HTTPError(400, "Malformed header line")
+        headers[name.strip().lower()] = value.strip()
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HTTPError(501, "Chunked request bodies are not supported")
+    try:
+        content_length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if content_length < 0:
+        raise HTTPError(400, "Invalid Content-Length")
+    if content_length > max_body_bytes:
+        raise HTTPError(413, f"Request body exceeds {max_body_bytes} bytes")
+    try:
+        body = await reader.readexactly(content_length) if content_length else b""
+    except asyncio.IncompleteReadError:
+        raise HTTPError(400, "Incomplete request body")
+
+    path, _, query = target.partition("?")
+    return HTTPRequest(method.upper(), path, query, headers, body, version)
+
+
+def response_head(status: int, headers: Dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {STATUS_REASONS.get(status, '')}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def item_to_dict(item: Any) -> Dict[str, Any]:
+    """The fields of a search result item that clients need."""
+    return {
+        "item_id": item.id_,
+        "name": item.name,
+        "price": item.price,
+        "condition": ITEM_CONDITION_ID_TO_NAME_MAP.get(item.item_condition_id, "Unknown"),
+        "url": f"https://jp.mercari.com/item/{item.id_}",
+    }
+
+
+class ShopperService:
+    """
+    Serves the shopper pipeline over HTTP on one asyncio event loop.
+
+    Endpoints (JSON bodies; "request" is the shopper's text):
+        POST /extract    {"request"} -> {"params"}
+        POST /search     {"request"} or {"params"} -> {"params", "items", ...}
+        POST /recommend  {"request", "params" (optional)} -> {"params", "recommendations", ...}
+        POST /shop       Like /recommend, but streams one NDJSON line per finished stage.
+        GET  /healthz    Load information.
+        GET  /metrics    Prometheus metrics (when telemetry is enabled).
+
+    The stages are the CLI's blocking handle_* functions (the same BatchStages
+    the batch runner uses), run on a thread pool. Connections and waiting
+    requests cost only a coroutine each, so hundreds of shoppers can wait on
+    Ollama and Mercari at once. Work is bounded in three places:
+      * LLM and Mercari calls have separate concurrency limits; requests queue
+        for a slot.
+      * At most max_in_flight requests are admitted. Requests beyond that are
+        rejected immediately with 503 and Retry-After.
+      * Every request has a deadline: request_timeout seconds, or the
+        X-Request-Timeout header / "timeout" field, capped at
+        max_request_timeout. When it passes, the client gets 504 (or an
+        "error" line on /shop). A stage that already started keeps its slot
+        until it finishes, so the concurrency limits hold.
+    """
+
+    def __init__(
+        self,
+        stages: BatchStages,
+        llm_concurrency: int = SERVICE_LLM_CONCURRENCY,
+        search_concurrency: int = SERVICE_SEARCH_CONCURRENCY,
+        max_in_flight: int = SERVICE_MAX_IN_FLIGHT,
+        request_timeout: float = SERVICE_REQUEST_TIMEOUT_SECONDS,
+        max_request_timeout: float = SERVICE_MAX_REQUEST_TIMEOUT_SECONDS,
+        max_body_bytes: int = SERVICE_MAX_BODY_BYTES,
+        idle_timeout: float = SERVICE_IDLE_TIMEOUT_SECONDS,
+    ) -> None:
+        """
+        Args:
+            stages: The pipeline stage functions (blocking; run on worker threads).
+            llm_concurrency: Maximum concurrent LLM calls (extraction + recommendation).
+            search_concurrency: Maximum concurrent Mercari searches.
+            max_in_flight: Maximum requests admitted at once.
+            request_timeout: Default per-request deadline in seconds.
+            max_request_timeout: Upper bound for a client-supplied deadline.
+            max_body_bytes: Larger request bodies are rejected with 413.
+            idle_timeout: Seconds an idle keep-alive connection is kept open.
+        """
+        self.stages = stages
+        self.llm_concurrency = llm_concurrency
+        self.search_concurrency = search_concurrency
+        self.max_in_flight = max_in_flight
+        self.request_timeout = request_timeout
+        self.max_request_timeout = max_request_timeout
+        self.max_body_bytes = max_body_bytes
+        self.idle_timeout = idle_timeout
+        self.in_flight = 0
+        self.rejected = 0
+        self._llm_slots: Optional[asyncio.Semaphore] = None
+        self._search_slots: Optional[asyncio.Semaphore] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.routes = {
+            ("POST", "/extract"): self._extract,
+            ("POST", "/search"): self._search,
+            ("POST", "/recommend"): self._recommend,
+            ("POST", "/shop"): self._shop,
+            ("GET", "/healthz"): self._health,
+            ("GET", "/metrics"): self._metrics,
+        }
+
+    # --- Server lifecycle ---
+
+    async def start(self, host: str = SERVICE_HOST, port: int = SERVICE_PORT) -> asyncio.base_events.Server:
+        """Starts listening; must be called on the loop that will run the service."""
+        self._llm_slots = asyncio.Semaphore(self.llm_concurrency)
+        self._search_slots = asyncio.Semaphore(self.search_concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.llm_concurrency + self.search_concurrency,
+            thread_name_prefix="service-stage",
+        )
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def serve(self, host: str = SERVICE_HOST, port: int = SERVICE_PORT) -> None:
+        """Runs the service until cancelled."""
+        server = await self.start(host, port)
+        address = server.sockets[0].getsockname()
+        print(f"Serving on http://{address[0]}:{address[1]}", file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._executor.shutdown(wait=False)
+
+    # --- Connection handling ---
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(
+                        read_request(reader, self.max_body_bytes), self.idle_timeout
+                    )
+                except asyncio.TimeoutError:
+                    return
+                except HTTPError as e:
+                    # The rest of the stream cannot be trusted; answer and close
+                    await self._write_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    return
+                if request is None:
+                    return
+                await self._dispatch(request, writer)
+                if not request.keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Client went away
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request: HTTPRequest, writer: asyncio.StreamWriter) -> None:
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                status, message = 405, f"{request.method} is not allowed on {request.path}"
+            else:
+                status, message = 404, f"No endpoint {request.path}"
+            telemetry.count("http_requests_total", endpoint="unknown", status=status)
+            await self._write_json(writer, status, {"error": message}, request.keep_alive)
+            return
+
+        if request.method == "GET":  # Cheap endpoints bypass admission control
+            await handler(request, writer, None)
+            return
+
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            telemetry.count("http_requests_total", endpoint=request.path, status=503)
+            await self._write_json(
+                writer,
+                503,
+                {"error": "Too many requests in progress"},
+                request.keep_alive,
+                {"Retry-After": "1"},
+            )
+            return
+
+        self.in_flight += 1
+        status = 500
+        try:
+            with telemetry.span("http_request", endpoint=request.path) as span:
+                try:
+                    deadline = self._deadline(request)
+                    status = await handler(request, writer, deadline)
+                except HTTPError as e:
+                    status = e.status
+                    await self._write_error(request, writer, e.status, e.message)
+                except (ConnectionError, asyncio.CancelledError):
+                    raise
+                except Exception as e:
+                    telemetry.event("error", "service_unexpected_error", f"Unexpected error in {request.path}: {e}")
+                    await self._write_error(request, writer, 500, "Internal server error")
+                span.set(status=status)
+        finally:
+            self.in_flight -= 1
+            telemetry.count("http_requests_total", endpoint=request.path, status=status)
+
+    def _deadline(self, request: HTTPRequest) -> float:
+        timeout = request.headers.get("x-request-timeout")
+        if timeout is None:
+            timeout = request.json().get("timeout", self.request_timeout)
+        try:
+            timeout = float(timeout)
+        except (TypeError, ValueError):
+            raise HTTPError(400, "The timeout must be a number of seconds")
+        if timeout <= 0:
+            raise HTTPError(400, "The timeout must be positive")
+        return asyncio.get_running_loop().time() + min(timeout, self.max_request_timeout)
+
+    # --- Responses ---
+
+    async def _write_json(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        payload: Any,
+        keep_alive: bool = True,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            response_head(
+                status,
+                {
+                    "Content-Type": "application/json; charset=utf-8",
+                    "Content-Length": str(len(body)),
+                    "Connection": "keep-alive" if keep_alive else "close",
+                    **(headers or {}),
+                },
+            )
+            + body
+        )
+        await writer.drain()
+
+    async def _write_error(self, request: HTTPRequest, writer: asyncio.StreamWriter, status: int, message: str) -> None:
+        """Answers with a JSON error, or closes the connection if a response is already under way."""
+        if request.response_started:  # A second response would corrupt the stream
+            writer.close()
+            return
+        await self._write_json(writer, status, {"error": message}, request.keep_alive)
+
+    async def _write_chunk(self, writer: asyncio.StreamWriter, payload: Dict[str, Any]) -> None:
+        data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+        await writer.drain()  # A slow reader holds up its own request only
+
+    # --- Pipeline ---
+
+    async def _run_stage(self, slots: asyncio.Semaphore, deadline: float, stage: str, function, *args) -> Any:
+        """Runs a blocking stage on the thread pool once a slot is free, within the deadline."""
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(slots.acquire(), deadline - loop.time())
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(stage)
+        # Copy the context so the stage's spans join the request's trace
+        context = contextvars.copy_context()
+        future = loop.run_in_executor(self._executor, context.run, function, *args)
+        # The slot is held until the thread finishes, even if the client has given up
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), deadline - loop.time())
+        except asyncio.TimeoutError:
+            telemetry.count("service_deadline_exceeded_total", stage=stage)
+            raise DeadlineExceeded(stage)
+
+    async def _pipeline_events(
+        self,
+        text: str,
+        params: Optional[Dict[str, Any]],
+        deadline: float,
+        recommend: bool = True,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Runs the stages and yields one event per finished stage."""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        def elapsed_ms() -> float:
+            return round((loop.time() - start) * 1000, 1)
+
+        if params is None:
+            params = await self._run_stage(
+                self._llm_slots, deadline, "extraction", self.stages.extract, text
+            )
+            if not params:
+                raise HTTPError(502, "Parameter extraction failed")
+            yield {"stage": "extraction", "params": params, "elapsed_ms": elapsed_ms()}
+
+        search_result = await self._run_stage(
+            self._search_slots, deadline, "search", self.stages.search, params
+        )
+        if not search_result:
+            raise HTTPError(502, "Mercari search failed")
+        yield {
+            "stage": "search",
+            "item_count": len(search_result.items),
+            "pages_fetched": search_result.pages_fetched,
+            "stop_reason": search_result.stop_reason,
+            "items": [item_to_dict(item) for item in search_result.items],
+            "elapsed_ms": elapsed_ms(),
+        }
+        if not recommend:
+            return
+
+        recommendations = await self._run_stage(
+            self._llm_slots,
+            deadline,
+            "recommendation",
+            self.stages.recommend,
+            text or params.get("query", ""),
+            search_result,
+            params,
+        )
+        yield {
+            "stage": "recommendation",
+            "recommendations": (recommendations or {}).get("recommendations", []),
+            "elapsed_ms": elapsed_ms(),
+        }
+
+    @staticmethod
+    def _request_fields(request: HTTPRequest, params_allowed: bool = True):
+        payload = request.json()
+        text = payload.get("request") or ""
+        params = payload.get("params") if params_allowed else None
+        if not isinstance(text, str):
+            raise HTTPError(400, '"request" must be a string')
+        if params is not None and not isinstance(params, dict):
+            raise HTTPError(400, '"params" must be an object')
+        if not text.strip() and params is None:
+            raise HTTPError(400, 'Either "request" or "params" is required' if params_allowed else '"request" is required')
+        return text, params
+
+    async def _collect(self, text, params, deadline, recommend):
+        result: Dict[str, Any] = {"params": params} if params is not None else {}
+        async for event in self._pipeline_events(text, params, deadline, recommend):
+            event.pop("stage")
+            result.update(event)
+        return result
+
+    # --- Endpoints ---
+
+    async def _extract(self, request, writer, deadline) -> int:
+        text, _ = self._request_fields(request, params_allowed=False)
+        params = await self._run_stage(
+            self._llm_slots, deadline, "extraction", self.stages.extract, text
+        )
+        if not params:
+            raise HTTPError(502, "Parameter extraction failed")
+        await self._write_json(writer, 200, {"params": params}, request.keep_alive)
+        return 200
+
+    async def _search(self, request, writer, deadline) -> int:
+        text, params = self._request_fields(request)
+        result = await self._collect(text, params, deadline, recommend=False)
+        await self._write_json(writer, 200, result, request.keep_alive)
+        return 200
+
+    async def _recommend(self, request, writer, deadline) -> int:
+        text, params = self._request_fields(request)
+        result = await self._collect(text, params, deadline, recommend=True)
+        result.pop("items", None)  # Only the recommended items are returned
+        await self._write_json(writer, 200, result, request.keep_alive)
+        return 200
+
+    async def _shop(self, request, writer, deadline) -> int:
+        text, params = self._request_fields(request)
+        writer.write(
+            response_head(
+                200,
+                {
+                    "Content-Type": "application/x-ndjson; charset=utf-8",
+                    "Transfer-Encoding": "chunked",
+                    "Connection": "keep-alive" if request.keep_alive else "close",
+                },
+            )
+        )
+        request.response_started = True
+        status = 200
+        # Headers are already sent, so failures are reported in-band
+        try:
+            async for event in self._pipeline_events(text, params, deadline):
+                await self._write_chunk(writer, event)
+        except HTTPError as e:
+            status = e.status
+            await self._write_chunk(writer, {"stage": "error", "status": e.status, "error": e.message})
+        except (ConnectionError, asyncio.CancelledError):
+            raise
+        except Exception as e:
+            status = 500
+            telemetry.event("error", "service_unexpected_error", f"Unexpected error in {request.path}: {e}")
+            await self._write_chunk(writer, {"stage": "error", "status": 500, "error": "Internal server error"})
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return status
+
+    async def _health(self, request, writer, deadline) -> int:
+        await self._write_json(
+            writer,
+            200,
+            {
+                "status": "ok",
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "rejected": self.rejected,
+            },
+            request.keep_alive,
+        )
+        return 200
+
+    async def _metrics(self, request, writer, deadline) -> int:
+        if not telemetry.enabled:
+            await self._write_json(writer, 404, {"error": "Telemetry is disabled"}, request.keep_alive)
+            return 404
+        body = telemetry.render_prometheus().encode("utf-8")
+        writer.write(
+            response_head(
+                200,
+                {
+                    "Content-Type": "text/plain; version=0.0.4; charset=utf-8",
+                    "Content-Length": str(len(body)),
+                },
+            )
+            + body
+        )
+        await writer.drain()
+        return 200
@@ -0,0 +1,115 @@
+import hashlib
+import math
+from typing import Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from internal.utils.constants import WATCH_SEEN_CAPACITY, WATCH_SEEN_FALSE_POSITIVE_RATE
+
+
+def bloom_size(capacity: int, false_positive_rate: float) -> Tuple[int, int]:
+    """Returns (bytes, hash count) of a Bloom filter for capacity items at false_positive_rate."""
+    bits = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+    hash_count = max(1, round(bits / capacity * math.log(2)))
+    return (bits + 7) // 8, hash_count
+
+
+def _hash_pairs(item_ids: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Two 64-bit hashes per ID (blake2b), for double hashing."""
+    digests = b"".join(hashlib.blake2b(item_id.encode("utf-8"), digest_size=16).digest() for item_id in item_ids)
+    pairs = np.frombuffer(digests, dtype="<u8").reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1] | np.uint64(1)
+
+
+class SeenItems:
+    """
+    Item IDs already seen by one saved search, in two generations of Bloom filters.
+
+    New IDs go into the current generation; once it holds `capacity` IDs it
+    becomes the previous one and a fresh filter takes its place, so memory
+    stays fixed (2 filters of bloom_size() bytes) and at least the last
+    `capacity` IDs are always remembered. Listings older than that have long
+    left the first result pages. A false positive hides a new item, at a
+    rate of about 2 * false_positive_rate; an item is never reported twice
+    while it is remembered.
+    """
+
+    __slots__ = ("capacity", "hash_count", "size_bytes", "count", "_current", "_previous")
+
+    def __init__(
+        self,
+        capacity: int = WATCH_SEEN_CAPACITY,
+        false_positive_rate: float = WATCH_SEEN_FALSE_POSITIVE_RATE,
+        state: Optional[np.ndarray] = None,
+        count: int = 0,
+    ) -> None:
+        """
+        Args:
+            capacity: IDs per generation.
+            false_positive_rate: Target false positive rate of one full generation.
+            state: (Optional) Bits from state(), shape (2, size_bytes), to restore.
+            count: IDs in the current generation of the restored state.
+        """
+        self.capacity = capacity
+        self.size_bytes, self.hash_count = bloom_size(capacity, false_positive_rate)
+        if state is not None and state.shape == (2, self.size_bytes):
+            self._current, self._previous = state[0].copy(), state[1].copy()
+            self.count = count
+        else:
+            self._current = np.zeros(self.size_bytes, dtype=np.uint8)
+            self._previous = np.zeros(self.size_bytes, dtype=np.uint8)
+            self.count = 0
+
+    def _positions(self, item_ids: Sequence[str]) -> np.ndarray:
+        """Bit positions, shape (len(item_ids), hash_count)."""
+        first, second = _hash_pairs(item_ids)
+        steps = np.arange(self.hash_count, dtype=np.uint64)
+        return (first[:, None] + steps[None, :] * second[:, None]) % np.uint64(self.size_bytes * 8)
+
+    @staticmethod
+    def _test(bits: np.ndarray, positions: np.ndarray) -> np.ndarray:
+        return ((bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1).all(axis=1)
+
+    def unseen(self, item_ids: Sequence[str]) -> np.ndarray:
+        """Boolean array, True for the IDs not seen before."""
+        if not len(item_ids):
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(item_ids)
+        return ~(self._test(self._current, positions) | self._test(self._previous, positions))
+
+    def add(self, item_ids: Iterable[str]) -> None:
+        """Marks IDs as seen (callers pass only unseen IDs, see unseen())."""
+        item_ids = list(item_ids)
+        start = 0
+        while start < len(item_ids):
+            if self.count >= self.capacity:
+                self._previous, self._current = self._current, np.zeros(self.size_bytes, dtype=np.uint8)
+                self.count = 0
+            chunk = item_ids[start : start + self.capacity - self.count]
+            positions = self._positions(chunk).ravel()
+            masks = np.left_shift(np.uint8(1), (positions & np.uint64(7)).astype(np.uint8))
+            np.bitwise_or.at(self._current, positions >> np.uint64(3), masks)
+            self.count += len(chunk)
+            start += len(chunk)
+
+    def __contains__(self, item_id: str) -> bool:
+        return not self.unseen([item_id])[0]
+
+    def state(self) -> np.ndarray:
+        """The bits of both generations, shape (2, size_bytes), for persistence."""
+        return np.stack([self._current, self._previous])
+
+
+if __name__ == "__main__":
+    seen = SeenItems()
+    print(f"{seen.size_bytes * 2} bytes per saved search, {seen.hash_count} hashes")
+    first_page = [f"m{index:011d}" for index in range(120)]
+    print("First poll, unseen:", int(seen.unseen(first_page).sum()))
+    seen.add(first_page)
+    second_page = [f"m{index:011d}" for index in range(10, 130)]
+    mask = seen.unseen(second_page)
+    print("Second poll, unseen:", [item_id for item_id, new in zip(second_page, mask) if new])
+    seen.add(item_id for item_id, new in zip(second_page, mask) if new)
+    seen.add(f"f{index:011d}" for index in range(2 * seen.capacity))  # Both generations full
+    others = [f"x{index:011d}" for index in range(100_000)]
+    print(f"False positive rate: {1 - seen.unseen(others).mean():.5f}")
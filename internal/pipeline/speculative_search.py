@@ -0,0 +1,111 @@
+import concurrent.futures
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+from internal.api_client.search_engine import (
+    MercariSearchEngine,
+    StreamedSearchResult,
+    search_engine,
+    search_signature,
+)
+from internal.utils.constants import (
+    MERCARI_SEARCH_TIMEOUT_SECONDS,
+    PRE_RANKING_CANDIDATE_COUNT,
+)
+
+# Parameters that must have streamed before the search starts. The extraction
+# prompt emits them first; later fields that change the search restart it.
+SEARCH_KEY_FIELDS = ("query", "price_min", "price_max")
+
+
+class SpeculativeSearch:
+    """
+    Starts the Mercari search while the LLM is still streaming the parameters.
+
+    Pass on_field as the on_field callback of extract_search_parameters_with_llm_ollama.
+    As soon as every field in key_fields has arrived, collect_items() is started
+    on the search engine with the fields so far (the rest count as unset). A
+    later field that changes the search signature (e.g. a category or a sort)
+    cancels that search and starts one for the new fields; empty filters leave
+    it running. result_for() then reuses the running search if the final
+    parameters produce the same search signature, and otherwise cancels it and
+    searches again, so the result is always the one for the final parameters.
+    """
+
+    def __init__(
+        self,
+        engine: MercariSearchEngine = search_engine,
+        max_items: int = PRE_RANKING_CANDIDATE_COUNT,
+        key_fields: Sequence[str] = SEARCH_KEY_FIELDS,
+    ) -> None:
+        """
+        Args:
+            engine: The search engine to run the searches on.
+            max_items: Passed to collect_items().
+            key_fields: Parameters that must have arrived before the search starts.
+        """
+        self.engine = engine
+        self.max_items = max_items
+        self.key_fields = tuple(key_fields)
+        self.fields: Dict[str, Any] = {}
+        self.outcome = "not_started"  # Then "started", and finally "hit" or "miss"
+        self.restarts = 0  # Searches cancelled because a later field changed the signature
+        self._future: Optional[concurrent.futures.Future] = None
+        self._signature: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def started(self) -> bool:
+        return self._future is not None
+
+    def on_field(self, key: str, value: Any) -> None:
+        """Records a streamed parameter; starts the search, or restarts it if its signature changed."""
+        with self._lock:
+            self.fields[key] = value
+            if any(name not in self.fields for name in self.key_fields):
+                return
+            params = dict(self.fields)
+            signature = search_signature(params)
+            if signature == self._signature:
+                return
+            if self._future is not None:
+                self._future.cancel()
+                self.restarts += 1
+            self._signature = signature
+            self._future = self.engine.submit(self.engine.collect_items(params, self.max_items))
+            self.outcome = "started"
+
+    def cancel(self) -> None:
+        """Cancels the speculative search if it is still running."""
+        with self._lock:
+            if self._future is not None:
+                self._future.cancel()
+
+    def result_for(
+        self,
+        search_params: Dict[str, Any],
+        timeout: Optional[float] = MERCARI_SEARCH_TIMEOUT_SECONDS,
+    ) -> StreamedSearchResult:
+        """
+        Returns the search result for the final parameters.
+
+        Args:
+            search_params: The complete extracted parameters.
+            timeout: Seconds to wait for the search.
+
+        Raises:
+            concurrent.futures.TimeoutError: If the search takes longer than timeout seconds.
+        """
+        with self._lock:
+            future, signature = self._future, self._signature
+        if future is not None and signature == search_signature(search_params):
+            self.outcome = "hit"
+            try:
+                return future.result(timeout)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                raise
+        if future is not None:
+            self.outcome = "miss"
+            future.cancel()
+        return self.engine.collect_items_sync(search_params, self.max_items, timeout)
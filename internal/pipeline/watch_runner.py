@@ -0,0 +1,456 @@
+import asyncio
+import contextvars
+import heapq
+import io
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, TextIO, Tuple
+
+import numpy as np
+
+from internal.api_client.item_store import ItemStore
+from internal.api_client.search_engine import (
+    MercariSearchEngine,
+    StreamedSearchResult,
+    build_item_filter,
+    search_engine,
+)
+from internal.llm.llm_scheduler import llm_priority
+from internal.pipeline.batch_runner import iter_batch_requests
+from internal.pipeline.seen_items import SeenItems
+from internal.utils.constants import (
+    LLM_PRIORITY_BATCH,
+    WATCH_INITIAL_INTERVAL_SECONDS,
+    WATCH_INTERVAL_BACKOFF,
+    WATCH_INTERVAL_SPEEDUP,
+    WATCH_JITTER,
+    WATCH_LLM_CONCURRENCY,
+    WATCH_MAX_INTERVAL_SECONDS,
+    WATCH_MAX_PAGES_PER_POLL,
+    WATCH_MIN_INTERVAL_SECONDS,
+    WATCH_SAVE_INTERVAL_SECONDS,
+    WATCH_SEARCH_CONCURRENCY,
+    WATCH_SEEN_CAPACITY,
+    WATCH_SEEN_FALSE_POSITIVE_RATE,
+    WATCH_STATE_PATH,
+)
+from internal.utils.telemetry import telemetry
+
+# Polls are sorted newest first, so new listings are on the first page
+_NEWEST_FIRST = {"sort_by": "created_time", "sort_order": "desc"}
+
+
+@dataclass
+class WatchStages:
+    """The stages watch mode runs (the CLI's handle_* functions)."""
+
+    extract: Callable[[str], Optional[Dict[str, Any]]]
+    recommend: Optional[Callable[[str, Any, Dict[str, Any]], Optional[Dict[str, Any]]]] = None
+
+
+@dataclass
+class WatchedSearch:
+    """One saved search: its request, extracted parameters, schedule and seen items."""
+
+    watch_id: str
+    request: str
+    params: Optional[Dict[str, Any]]  # None until extracted
+    interval: float
+    next_poll_at: float = 0.0  # Wall-clock time of the next poll
+    seen: SeenItems = field(default_factory=SeenItems, repr=False)
+    baselined: bool = False  # The first poll marks the current listings as seen without reporting them
+    polls: int = 0
+    new_items: int = 0
+    last_new_at: Optional[float] = None
+
+    def to_meta(self) -> Dict[str, Any]:
+        meta = asdict(self)
+        del meta["seen"]
+        meta["seen_count"] = self.seen.count
+        return meta
+
+
+class WatchStore:
+    """
+    Saved searches in one .npz file: their metadata as JSON and the bits of
+    every SeenItems filter as one (searches, 2, bytes) array.
+
+    If the file was written with another seen-filter size, the searches are
+    kept but start over with empty filters (and a new baseline poll).
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = WATCH_STATE_PATH,
+        seen_capacity: int = WATCH_SEEN_CAPACITY,
+        seen_false_positive_rate: float = WATCH_SEEN_FALSE_POSITIVE_RATE,
+    ) -> None:
+        """
+        Args:
+            path: State file (None keeps the state in memory only).
+            seen_capacity: Item IDs per Bloom filter generation (see SeenItems).
+            seen_false_positive_rate: Target false positive rate of one generation.
+        """
+        self.path = path
+        self.seen_capacity = seen_capacity
+        self.seen_false_positive_rate = seen_false_positive_rate
+
+    def new_seen(self, state: Optional[np.ndarray] = None, count: int = 0) -> SeenItems:
+        return SeenItems(self.seen_capacity, self.seen_false_positive_rate, state, count)
+
+    def load(self) -> Dict[str, WatchedSearch]:
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with np.load(self.path) as data:
+                meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+                bits = data["seen"]
+        except (OSError, ValueError, KeyError) as e:
+            telemetry.event("warning", "watch_state_load_failed", f"Could not load watch state '{self.path}': {e}")
+            return {}
+        same_filters = meta.get("seen_filter") == [self.seen_capacity, self.seen_false_positive_rate]
+        watches = {}
+        for index, record in enumerate(meta["watches"]):
+            seen_count = record.pop("seen_count", 0)
+            watch = WatchedSearch(**record)
+            if same_filters:
+                watch.seen = self.new_seen(bits[index], seen_count)
+            else:
+                watch.seen, watch.baselined = self.new_seen(), False
+            watches[watch.watch_id] = watch
+        return watches
+
+    def save(self, watches: List[WatchedSearch]) -> None:
+        """Writes the state to path (atomically, via a temporary file)."""
+        if not self.path:
+            return
+        meta = {
+            "seen_filter": [self.seen_capacity, self.seen_false_positive_rate],
+            "watches": [watch.to_meta() for watch in watches],
+        }
+        bits = (
+            np.stack([watch.seen.state() for watch in watches])
+            if watches
+            else np.zeros((0, 2, self.new_seen().size_bytes), dtype=np.uint8)
+        )
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            seen=bits,
+            meta=np.frombuffer(json.dumps(meta, ensure_ascii=False).encode("utf-8"), dtype=np.uint8),
+        )
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            temporary_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temporary_path, "wb") as f:
+                f.write(buffer.getvalue())
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            telemetry.event("warning", "watch_state_save_failed", f"Could not save watch state '{self.path}': {e}")
+
+
+class WatchRunner:
+    """
+    Watches many saved searches on one event loop and reports only new listings.
+
+    Parameters are extracted once per saved search (and kept in the state
+    file); after that a poll is one newest-first search without any LLM call.
+    Items already seen are recognised with the search's SeenItems filter,
+    and only the new ones go through ranking and recommendation.
+
+    Polls are kept in a heap ordered by due time and started by a single
+    scheduler loop, so thousands of searches cost a heap entry each rather
+    than a sleeping task. Each poll is scheduled within +-jitter of the
+    search's interval, and first polls are spread over one interval, so
+    searches do not poll in lockstep. The interval adapts: a poll with new
+    items multiplies it by `speedup`, a quiet poll by `backoff`, within
+    [min_interval, max_interval].
+    """
+
+    def __init__(
+        self,
+        stages: WatchStages,
+        engine: MercariSearchEngine = search_engine,
+        store: Optional[WatchStore] = None,
+        llm_concurrency: int = WATCH_LLM_CONCURRENCY,
+        search_concurrency: int = WATCH_SEARCH_CONCURRENCY,
+        initial_interval: float = WATCH_INITIAL_INTERVAL_SECONDS,
+        min_interval: float = WATCH_MIN_INTERVAL_SECONDS,
+        max_interval: float = WATCH_MAX_INTERVAL_SECONDS,
+        backoff: float = WATCH_INTERVAL_BACKOFF,
+        speedup: float = WATCH_INTERVAL_SPEEDUP,
+        jitter: float = WATCH_JITTER,
+        max_pages: int = WATCH_MAX_PAGES_PER_POLL,
+        save_interval: float = WATCH_SAVE_INTERVAL_SECONDS,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        """
+        Args:
+            stages: Extraction (once per search) and recommendation (per delta; None only reports).
+            engine: The search engine to poll.
+            store: Where the saved searches persist (default: WATCH_STATE_PATH).
+            llm_concurrency: Maximum concurrent LLM calls.
+            search_concurrency: Maximum concurrent polls.
+            initial_interval / min_interval / max_interval: Poll interval bounds in seconds.
+            backoff / speedup: Interval factors after a quiet poll / a poll with new items.
+            jitter: Relative spread of each poll time around the interval.
+            max_pages: Newest-first pages read per poll while every item on them is new.
+            save_interval: Seconds between writes of the state file.
+            rng: Random source of the jitter.
+        """
+        self.stages = stages
+        self.engine = engine
+        self.store = store if store is not None else WatchStore()
+        self.llm_concurrency = llm_concurrency
+        self.search_concurrency = search_concurrency
+        self.max_in_flight = 2 * (llm_concurrency + search_concurrency)
+        self.initial_interval = initial_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.speedup = speedup
+        self.jitter = jitter
+        self.max_pages = max_pages
+        self.save_interval = save_interval
+        self.rng = rng or random.Random()
+        self.watches: Dict[str, WatchedSearch] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._sequence = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self.polls = 0
+        self.errors = 0
+        self.new_items = 0
+        self.items_ranked = 0
+        self.poll_lags: deque = deque(maxlen=10_000)  # Seconds between due time and start, recent polls
+
+    # --- Saved searches ---
+
+    def load(self) -> None:
+        """Loads the saved searches of the store; overdue polls are spread over min_interval."""
+        now = time.time()
+        for watch in self.store.load().values():
+            if watch.next_poll_at < now:
+                watch.next_poll_at = now + self.rng.uniform(0, self.min_interval)
+            self.watches[watch.watch_id] = watch
+            self._schedule(watch)
+
+    def save(self) -> None:
+        self.store.save(list(self.watches.values()))
+
+    def add(self, watch_id: str, request: str, params: Optional[Dict[str, Any]] = None) -> WatchedSearch:
+        """
+        Adds a saved search, or returns the existing one if it has the same request.
+
+        Args:
+            watch_id: Identifier of the saved search.
+            request: The shopper's request.
+            params: (Optional) Parameters already extracted; otherwise they are extracted before the first poll.
+        """
+        existing = self.watches.get(watch_id)
+        if existing is not None and existing.request == request:
+            return existing
+        watch = WatchedSearch(
+            watch_id,
+            request,
+            params,
+            interval=self.initial_interval,
+            next_poll_at=time.time() + self.rng.uniform(0, self.initial_interval),
+            seen=self.store.new_seen(),
+        )
+        self.watches[watch_id] = watch
+        self._schedule(watch)
+        return watch
+
+    def add_requests(self, input_file: TextIO) -> int:
+        """Adds a saved search per line of a batch-style JSONL file; returns how many were read."""
+        count = 0
+        for watch_id, request in iter_batch_requests(input_file):
+            self.add(watch_id, request)
+            count += 1
+        return count
+
+    def remove(self, watch_id: str) -> None:
+        self.watches.pop(watch_id, None)  # Its heap entry is skipped when it comes due
+
+    def _schedule(self, watch: WatchedSearch) -> None:
+        self._sequence += 1
+        heapq.heappush(self._heap, (watch.next_poll_at, self._sequence, watch.watch_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _reschedule(self, watch: WatchedSearch, found_new: Optional[bool]) -> None:
+        """found_new is None for the baseline poll, which keeps the interval."""
+        if found_new is not None:
+            factor = self.speedup if found_new else self.backoff
+            watch.interval = min(self.max_interval, max(self.min_interval, watch.interval * factor))
+        spread = self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+        watch.next_poll_at = time.time() + watch.interval * spread
+        self._schedule(watch)
+
+    # --- Polling ---
+
+    async def _run_llm(self, executor, llm_slots, function, *args):
+        async with llm_slots:
+            with llm_priority(LLM_PRIORITY_BATCH):
+                context = contextvars.copy_context()
+                return await asyncio.get_running_loop().run_in_executor(executor, context.run, function, *args)
+
+    async def _poll(self, watch: WatchedSearch) -> Tuple[ItemStore, StreamedSearchResult]:
+        """Returns the items not seen before (newest first) and the page statistics."""
+        params = {**watch.params, **_NEWEST_FIRST}
+        new_items, stats = ItemStore(), StreamedSearchResult()
+        async for items in self.engine.iter_pages(
+            params,
+            item_filter=build_item_filter(params),
+            max_pages=self.max_pages,
+            time_budget=None,
+            stats=stats,
+            use_cache=False,
+            prefetch=False,  # Most polls stop at the first page
+        ):
+            unseen = watch.seen.unseen(items.ids)
+            fresh = items.select(np.flatnonzero(unseen))
+            watch.seen.add(fresh.ids)
+            new_items.extend(fresh)
+            if not unseen.all():
+                break  # Reached the listings of an earlier poll
+        return new_items, stats
+
+    async def _poll_and_report(self, executor, llm_slots, search_slots, watch, due_at, output_file, progress_file):
+        result: Dict[str, Any] = {"watch_id": watch.watch_id, "request": watch.request}
+        found_new: Optional[bool] = False
+        ready_at = due_at
+        try:
+            if watch.params is None:
+                params = await self._run_llm(executor, llm_slots, self.stages.extract, watch.request)
+                if not params:
+                    raise ValueError("Parameter extraction failed")  # Retried at the next poll
+                watch.params = params
+                ready_at = time.time()  # Lag counts from here, not from waiting for the LLM
+            async with search_slots:
+                self.poll_lags.append(max(0.0, time.time() - ready_at))
+                with telemetry.span("watch_poll", watch_id=watch.watch_id) as span:
+                    new_items, stats = await self._poll(watch)
+                    span.set(new_items=len(new_items), pages=stats.pages_fetched)
+            self.polls += 1
+            watch.polls += 1
+            if not watch.baselined:
+                watch.baselined, found_new = True, None
+                telemetry.count("watch_polls_total", result="baseline")
+                return
+            found_new = bool(new_items)
+            telemetry.count("watch_polls_total", result="new" if found_new else "quiet")
+            if not found_new:
+                return
+            self._reschedule(watch, found_new)  # Keep polling while the delta is processed
+            watch.new_items += len(new_items)
+            watch.last_new_at = time.time()
+            self.new_items += len(new_items)
+            telemetry.count("watch_new_items_total", len(new_items))
+            result["new_items"] = new_items.to_records()
+            if self.stages.recommend is not None:
+                self.items_ranked += len(new_items)
+                recommendations = await self._run_llm(
+                    executor,
+                    llm_slots,
+                    self.stages.recommend,
+                    watch.request,
+                    StreamedSearchResult(items=new_items, pages_fetched=stats.pages_fetched),
+                    watch.params,
+                )
+                result["recommendations"] = (recommendations or {}).get("recommendations", [])
+            result["status"] = "ok"
+        except Exception as e:
+            self.errors += 1
+            telemetry.count("watch_polls_total", result="error")
+            telemetry.event("warning", "watch_poll_failed", f"Polling '{watch.watch_id}' failed: {e}", watch_id=watch.watch_id)
+            result["status"], result["error"] = "error", str(e)
+        finally:
+            if self.watches.get(watch.watch_id) is watch and watch.next_poll_at <= due_at:
+                self._reschedule(watch, found_new)
+        result["polled_at"] = round(time.time(), 3)
+        output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        output_file.flush()
+        if progress_file is not None:
+            print(f"{watch.watch_id}: {result['status']} ({len(result.get('new_items', []))} new)", file=progress_file)
+
+    async def run(
+        self,
+        output_file: TextIO,
+        duration: Optional[float] = None,
+        progress_file: Optional[TextIO] = sys.stderr,
+    ) -> None:
+        """
+        Polls the saved searches until cancelled (or for duration seconds) and
+        writes one JSON line per poll that found new items (and per failed poll).
+        After duration, polls in flight are finished; when cancelled, they are
+        dropped. The state is saved every save_interval seconds and when the run ends.
+        """
+        self._wakeup = asyncio.Event()
+        llm_slots = asyncio.Semaphore(self.llm_concurrency)
+        search_slots = asyncio.Semaphore(self.search_concurrency)
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        pending = set()
+        executor = ThreadPoolExecutor(max_workers=self.llm_concurrency, thread_name_prefix="watch-stage")
+        deadline = time.time() + duration if duration is not None else math.inf
+        next_save = time.time() + self.save_interval
+
+        async def poll(watch, due_at):
+            try:
+                await self._poll_and_report(
+                    executor, llm_slots, search_slots, watch, due_at, output_file, progress_file
+                )
+            finally:
+                in_flight.release()
+
+        try:
+            while True:
+                now = time.time()
+                if now >= deadline:
+                    break
+                if now >= next_save:
+                    self.save()
+                    next_save = now + self.save_interval
+                if not self._heap or self._heap[0][0] > now:
+                    next_due = self._heap[0][0] if self._heap else math.inf
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), min(next_due, next_save, deadline) - now)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                due_at, _, watch_id = heapq.heappop(self._heap)
+                watch = self.watches.get(watch_id)
+                if watch is None or watch.next_poll_at != due_at:
+                    continue  # Removed, or rescheduled since
+                await in_flight.acquire()  # Backpressure: at most max_in_flight polls started
+                task = asyncio.ensure_future(poll(watch, due_at))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            await asyncio.gather(*pending)
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            executor.shutdown(wait=False)
+            self._wakeup = None
+            self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        intervals = [watch.interval for watch in self.watches.values()]
+        lags = list(self.poll_lags)
+        return {
+            "watches": len(self.watches),
+            "polls": self.polls,
+            "errors": self.errors,
+            "new_items": self.new_items,
+            "median_interval": float(np.median(intervals)) if intervals else 0.0,
+            "p99_poll_lag": float(np.percentile(lags, 99)) if lags else 0.0,
+        }
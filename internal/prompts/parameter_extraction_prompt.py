@@ -1,18 +1,9 @@
-PARAM_EXTRACTION_PROMPT = """You are a helpful, bi-lingual, NLP based shopping assistant specializing in Mercari Japan.
-    Your task is to process user requests for items on Mercari Japan in english or japanese or mixed.
+from internal.prompts.shared_prompt_prefix import SHARED_PROMPT_PREFIX
 
-**IMPORTANT INSTRUCTIONS (CRITICAL - JSON FORMAT IS MANDATORY):**
-* You **MUST** respond **ONLY** in JSON format.
-* Do **NOT** include any introductory or conversational text before or after the JSON.
-* Your ENTIRE response should be a **single, valid JSON object**.
-* **Parameter Extraction Precision:** Only extract parameters that are **explicitly mentioned** or **strongly implied** in the user request. **Do not make assumptions or extract parameters that are not clearly indicated.**
-* Ensure the JSON is well-formatted and parsable.
-
-**Task Breakdown:**
-User Request:
-{user_request}
+# Static instructions first and the user request last, so the prefix is cacheable
+PARAM_EXTRACTION_PROMPT = SHARED_PROMPT_PREFIX + """**PART 1: EXTRACT SEARCH PARAMETERS**
 
-**PART 1: EXTRACT SEARCH PARAMETERS**
+* **Parameter Extraction Precision:** Only extract parameters that are **explicitly mentioned** or **strongly implied** in the user request. **Do not make assumptions or extract parameters that are not clearly indicated.**
 
 Extract the following search parameters from the user request. If a parameter is not mentioned or implied, use `null` for numerical values and empty lists `[]` for lists.
 
@@ -28,7 +19,7 @@ Extract the following search parameters from the user request. If a parameter is
     *   If no price is mentioned, set both `price_min` and `price_max` to `null`.
     *   Ensure that extracted `price_min` and `price_max` are numerical values (integers or floats if necessary).
 
-For **categories, brands, item conditions, and shipping payer**, extract the *names* mentioned or implied by the user.  Do not try to validate if these names are valid Mercari categories, brands, etc. Just extract the names as text strings.  Validation will be done in a separate step.
+For **categories, brands, item conditions, shipping payer, sizes and colors**, extract the *names* mentioned or implied by the user.  Do not try to validate if these names are valid Mercari categories, brands, etc. Just extract the names as text strings.  Validation will be done in a separate step.
 
 **IMPORTANT INSTRUCTIONS (CRITICAL - JSON FORMAT IS MANDATORY):**
 * You **MUST** respond **ONLY** in JSON format.
@@ -36,7 +27,7 @@ For **categories, brands, item conditions, and shipping payer**, extract the *na
 * Your ENTIRE response should be a **single, valid JSON object**.
 * Ensure the JSON is well-formatted and parsable.
 
-Extracted Search Parameters (JSON format):
+JSON RESPONSE FORMAT:
 ```json
 {{
   "query": "<extracted_query>",
@@ -46,7 +37,15 @@ Extracted Search Parameters (JSON format):
   "brands": [<extracted_brand_names>],         #  Extract brand names as text strings (e.g., ["Apple", "Nintendo", "Sony"])
   "item_conditions": [<extracted_item_condition_names>], # Extract item condition names as text strings (e.g., ["new", "used - excellent"])
   "shipping_payer": [<extracted_shipping_payer_names>], # Extract shipping payer names as text strings (e.g., ["seller", "buyer"])
+  "sizes": [<extracted_size_names>],           #  Extract clothing/shoe sizes as text strings (e.g., ["M", "26.5cm"])
+  "colors": [<extracted_color_names>],         #  Extract colors as text strings (e.g., ["black", "navy"])
   "sort_by": "<extracted_sort_criteria>",
   "sort_order": "<extracted_sort_order>"
 }}
+```
+
+User Request:
+{user_request}
+
+Extracted Search Parameters (JSON format):
 """
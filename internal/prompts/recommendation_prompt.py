@@ -1,18 +1,9 @@
-RECOMMENDATION_PROMPT = """You are a helpful, bi-lingual, NLP based shopping assistant specializing in Mercari Japan.
-    Your task is to process user requests for items on Mercari Japan and provide item recommendations based on search results.
+from internal.prompts.shared_prompt_prefix import SHARED_PROMPT_PREFIX
 
-**IMPORTANT INSTRUCTIONS (CRITICAL - JSON FORMAT IS MANDATORY):**
-* You **MUST** respond **ONLY** in JSON format.
-* Do **NOT** include any introductory or conversational text before or after the JSON.
-* Your ENTIRE response should be a **single, valid JSON object**.
-* Ensure the JSON is well-formatted and parsable.
-
-**Task Breakdown:**
-You have already performed a Mercari search based on the user's request and obtained the following search results.
+# Static instructions first; the user request and the search results go last, so the prefix is cacheable
+RECOMMENDATION_PROMPT = SHARED_PROMPT_PREFIX + """**PART 2: GENERATE REASONED RECOMMENDATIONS (based on provided Mercari search results)**
 
-**PART 2: GENERATE REASONED RECOMMENDATIONS (based on provided Mercari search results)**
-
-{search_results_placeholder}
+You have already performed a Mercari search based on the user's request. The user's request and the search results are given at the end.
 
 Analyze these search results and generate a JSON list of the top 3 item recommendations that best match the original user's request and search intent (which you have already processed in Part 1 to perform the search).
 
@@ -74,4 +65,11 @@ If no relevant items are found, return an empty list of recommendations `[]`.
     ]
 }}
 ```
+
+User Request:
+{user_request}
+
+{search_results_placeholder}
+
+Recommendations (JSON format):
 """
@@ -0,0 +1,207 @@
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from internal.api_client.item_store import ItemStore
+from internal.utils.constants import (
+    PRE_RANKING_PRICE_SPREAD,
+    PRE_RANKING_WEIGHTS,
+)
+from internal.utils.text_utils import normalize_text
+
+# Latin/digit words, or runs of other letters (kana, kanji, ...)
+_TERM_RE = re.compile(r"[0-9a-z]+|[^\W\d_a-z]+")
+_WORST_CONDITION_ID = 6
+
+
+def query_terms(text: str) -> List[str]:
+    """
+    Splits a query into match terms for title overlap.
+
+    Latin words are kept whole (single letters are dropped). Japanese has no
+    spaces, so runs of kana/kanji longer than two characters are split into
+    character bigrams, e.g. "ワイヤレスイヤホン" -> "ワイ", "イヤ", "ヤレ", ...
+
+    Args:
+        text: The query, in any width, case or kana.
+
+    Returns:
+        Unique normalised terms in order of first occurrence.
+    """
+    terms: List[str] = []
+    for token in _TERM_RE.findall(normalize_text(text or "")):
+        if token.isascii():
+            if len(token) > 1:
+                terms.append(token)
+        elif len(token) <= 2:
+            terms.append(token)
+        else:
+            terms.extend(token[i : i + 2] for i in range(len(token) - 1))
+    return list(dict.fromkeys(terms))
+
+
+@dataclass
+class ItemColumns:
+    """Search results as columns, for vectorised scoring."""
+
+    prices: np.ndarray  # int64
+    condition_ids: np.ndarray  # int8, 0 if unknown
+    titles: np.ndarray  # Normalised titles (unicode array)
+
+    @classmethod
+    def from_items(cls, items: Sequence[Any]) -> "ItemColumns":
+        """
+        Builds the columns from search result items (name, price, item_condition_id).
+        The prices and conditions of an ItemStore are wrapped without copying.
+        """
+        if isinstance(items, ItemStore):
+            return cls(
+                prices=np.frombuffer(items.prices, dtype=np.int64) if len(items) else np.zeros(0, np.int64),
+                condition_ids=(
+                    np.frombuffer(items.condition_ids, dtype=np.int8) if len(items) else np.zeros(0, np.int8)
+                ),
+                titles=np.array([normalize_text(name) for name in items.names], dtype=str),
+            )
+        return cls(
+            prices=np.fromiter((item.price or 0 for item in items), dtype=np.int64, count=len(items)),
+            condition_ids=np.fromiter(
+                (item.item_condition_id or 0 for item in items), dtype=np.int8, count=len(items)
+            ),
+            titles=np.array([normalize_text(item.name or "") for item in items], dtype=str),
+        )
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+
+class ItemRanker:
+    """
+    Scores search results locally so only the most relevant items reach the
+    recommendation LLM.
+
+    Every feature is computed for all items at once on NumPy columns:
+        - title: share of query terms (weighted by length) found in the title
+        - brand: the title mentions one of the extracted brand names
+        - condition: 1 for "New, unused" down to 0 for "Used - Poor"
+        - price_typicality: closeness to the median price in log space, which
+          demotes accessories and junk listed far below the typical price
+        - cheapness: position in the result set's price range, cheapest = 1
+    The score is the weighted sum of the features (see PRE_RANKING_WEIGHTS).
+    """
+
+    def __init__(
+        self,
+        weights: Optional[Dict[str, float]] = None,
+        price_spread: float = PRE_RANKING_PRICE_SPREAD,
+    ) -> None:
+        """
+        Args:
+            weights: Feature weights; missing features use PRE_RANKING_WEIGHTS.
+            price_spread: Factor from the median price at which price_typicality reaches 0.
+        """
+        unknown = set(weights or {}) - set(PRE_RANKING_WEIGHTS)
+        if unknown:
+            raise ValueError(f"Unknown ranking features: {sorted(unknown)}")
+        self.weights = {**PRE_RANKING_WEIGHTS, **(weights or {})}
+        self.price_spread = price_spread
+
+    @staticmethod
+    def _term_share(titles: np.ndarray, terms: Iterable[str]) -> np.ndarray:
+        """Length-weighted share of terms that occur in each title (0 if there are no terms)."""
+        terms = list(terms)
+        if not terms or not len(titles):
+            return np.zeros(len(titles))
+        hits = np.stack([np.char.find(titles, term) >= 0 for term in terms])
+        term_weights = np.array([len(term) for term in terms], dtype=np.float64)
+        return term_weights @ hits / term_weights.sum()
+
+    def feature_scores(
+        self, columns: ItemColumns, query: str, brand_names: Iterable[str] = ()
+    ) -> Dict[str, np.ndarray]:
+        """Returns each feature's 0-1 score for every item."""
+        prices = columns.prices.astype(np.float64)
+        priced = prices > 0
+
+        features = {"title": self._term_share(columns.titles, query_terms(query))}
+
+        brand_terms = [normalize_text(name) for name in brand_names if name]
+        if brand_terms:
+            features["brand"] = np.logical_or.reduce(
+                [np.char.find(columns.titles, term) >= 0 for term in brand_terms]
+            ).astype(np.float64)
+        else:
+            features["brand"] = np.zeros(len(columns))
+
+        condition_ids = columns.condition_ids.astype(np.float64)
+        features["condition"] = np.where(
+            condition_ids > 0, (_WORST_CONDITION_ID - condition_ids) / (_WORST_CONDITION_ID - 1), 0.0
+        )
+
+        features["price_typicality"] = np.zeros(len(columns))
+        features["cheapness"] = np.zeros(len(columns))
+        if priced.any():
+            log_prices = np.log(np.where(priced, prices, 1.0))
+            median = np.median(log_prices[priced])
+            distance = np.abs(log_prices - median) / np.log(self.price_spread)
+            features["price_typicality"] = np.where(priced, 1.0 - np.clip(distance, 0.0, 1.0), 0.0)
+            low, high = prices[priced].min(), prices[priced].max()
+            if high > low:
+                features["cheapness"] = np.where(priced, (high - prices) / (high - low), 0.0)
+            else:
+                features["cheapness"] = priced.astype(np.float64)
+        return features
+
+    def scores(self, columns: ItemColumns, query: str, brand_names: Iterable[str] = ()) -> np.ndarray:
+        """Returns the weighted score of every item."""
+        total = np.zeros(len(columns))
+        for feature, values in self.feature_scores(columns, query, brand_names).items():
+            total += self.weights[feature] * values
+        return total
+
+    def top_k_indices(self, scores: np.ndarray, top_k: int) -> np.ndarray:
+        """Indices of the top_k scores, best first; ties keep the original order."""
+        if top_k <= 0 or not len(scores):
+            return np.array([], dtype=np.int64)
+        candidates = np.arange(len(scores))
+        if top_k < len(scores):
+            # argpartition picks among items tied at the cut-off in no fixed order, so take the
+            # better scores and then the first of the tied ones
+            cutoff = np.partition(scores, len(scores) - top_k)[len(scores) - top_k]
+            better = np.flatnonzero(scores > cutoff)
+            tied = np.flatnonzero(scores == cutoff)[: top_k - len(better)]
+            candidates = np.concatenate([better, tied])
+        return candidates[np.lexsort((candidates, -scores[candidates]))]
+
+    def rank(
+        self,
+        items: Sequence[Any],
+        query: str,
+        brand_names: Iterable[str] = (),
+        top_k: Optional[int] = None,
+    ) -> List[Any]:
+        """
+        Returns the top_k most relevant items, best first.
+
+        Args:
+            items: Search result items (name, price, item_condition_id).
+            query: The search query (or the user's request).
+            brand_names: (Optional) Extracted brand names, in any spelling.
+            top_k: Number of items to return (all items if None).
+
+        Returns:
+            The selected items in ranked order (an ItemStore if items is one).
+        """
+        if not items:
+            return []
+        columns = ItemColumns.from_items(items)
+        scores = self.scores(columns, query, brand_names)
+        order = self.top_k_indices(scores, len(items) if top_k is None else top_k)
+        if isinstance(items, ItemStore):
+            return items.select(order)
+        return [items[index] for index in order]
+
+
+# Ranker with the default weights from constants
+item_ranker = ItemRanker()
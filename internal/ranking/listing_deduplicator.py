@@ -0,0 +1,289 @@
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from internal.api_client.item_store import ItemStore
+from internal.utils.constants import (
+    LISTING_DEDUP_KEEP,
+    LISTING_DEDUP_LSH_BANDS,
+    LISTING_DEDUP_LSH_ROWS,
+    LISTING_DEDUP_MAX_PRICE_RATIO,
+    LISTING_DEDUP_SHINGLE_CHARS,
+    LISTING_DEDUP_SHORT_TITLE_CHARS,
+    LISTING_DEDUP_SIMILARITY,
+    LISTING_TITLE_DECORATION_WORDS,
+)
+from internal.utils.text_utils import normalize_text
+
+# Bracketed seller notes: 【美品】, [送料無料], ≪限定≫, ★即購入OK★ ...
+_DECORATION_RE = re.compile(r"【[^】]*】|\[[^\]]*\]|〔[^〕]*〕|《[^》]*》|≪[^≫]*≫|〈[^〉]*〉|<[^>]*>|★[^★]*★|☆[^☆]*☆")
+_DECORATION_WORDS_RE = re.compile(
+    "|".join(
+        re.escape(word)
+        for word in sorted({normalize_text(word) for word in LISTING_TITLE_DECORATION_WORDS}, key=len, reverse=True)
+    )
+)
+_NON_WORD_RE = re.compile(r"[\W_]+")
+_UNPRICED = np.iinfo(np.int64).max
+KEEP_ORDERS = ("cheapest", "best_condition")
+
+
+def title_words(title: str) -> List[str]:
+    """
+    The words of the product part of a listing title: width, case and kana
+    folded, bracketed notes and decoration words removed, split at spaces and
+    punctuation. Condition words outside brackets ("中古", "ジャンク") are kept.
+    "【美品】Nintendo Switch Lite 本体のみ ★送料無料★" -> ["nintendo", "switch", "lite", "本体ノミ"]
+    """
+    title = _DECORATION_RE.sub(" ", normalize_text(title or ""))
+    title = _DECORATION_WORDS_RE.sub(" ", title)
+    return [word for word in _NON_WORD_RE.split(title) if word]
+
+
+def normalize_title(title: str) -> str:
+    """
+    The title_words() of a listing title run together.
+    "【美品】Nintendo Switch Lite 本体のみ ★送料無料★" -> "nintendoswitchlite本体ノミ"
+    """
+    return "".join(title_words(title))
+
+
+@dataclass
+class ListingClusters:
+    """
+    Near-duplicate clusters of a list of items.
+
+    Attributes:
+        labels: Cluster of every item (the index of its first member).
+        representatives: Index of the kept item of every cluster, in the original item order.
+        sizes: Number of items in each representative's cluster.
+    """
+
+    labels: np.ndarray
+    representatives: np.ndarray
+    sizes: np.ndarray
+
+    def select(self, items: Sequence[Any]) -> Sequence[Any]:
+        """The representatives of items (an ItemStore if items is one)."""
+        if isinstance(items, ItemStore):
+            return items.select(self.representatives)
+        return [items[index] for index in self.representatives]
+
+    def size_by_id(self, items: Sequence[Any]) -> Dict[str, int]:
+        """Representative item ID -> its cluster size."""
+        return {items[index].id_: int(size) for index, size in zip(self.representatives, self.sizes)}
+
+    @property
+    def duplicates(self) -> int:
+        """Items that are not the representative of their cluster."""
+        return len(self.labels) - len(self.representatives)
+
+
+class ListingDeduplicator:
+    """
+    Clusters listings whose normalised titles are near-identical and keeps one per cluster.
+
+    Each title is cut into character shingles (after normalize_title), and a
+    MinHash signature of bands * rows values estimates the Jaccard
+    similarity of two shingle sets. Titles are taken in order: a title joins
+    the cluster of the most similar cluster leader it shares an LSH band
+    with, if their signatures agree on at least `similarity` of the values
+    and, when either title is shorter than `short_title_chars`, both have
+    the same words (see title_words()); otherwise it leads a new cluster.
+    Only listings with the same item condition and prices at most
+    `max_price_ratio` apart (unpriced listings match any price) are
+    compared, so a console, a junk one and its empty box stay apart however
+    alike their titles are. Comparing with leaders only keeps clusters from
+    chaining together titles that are each similar to the next but not to
+    each other. Hashing and MinHash run on NumPy arrays over all titles at
+    once, and bucketing is one dict lookup per title and band plus a
+    comparison with each leader found, so the cost grows linearly with the
+    number of items rather than with the number of pairs. Items with an
+    empty normalised title stay on their own.
+
+    The kept item of a cluster is the cheapest (then best condition) or the
+    best condition (then cheapest) one; see `keep`.
+    """
+
+    def __init__(
+        self,
+        similarity: float = LISTING_DEDUP_SIMILARITY,
+        short_title_chars: int = LISTING_DEDUP_SHORT_TITLE_CHARS,
+        max_price_ratio: float = LISTING_DEDUP_MAX_PRICE_RATIO,
+        shingle_chars: int = LISTING_DEDUP_SHINGLE_CHARS,
+        bands: int = LISTING_DEDUP_LSH_BANDS,
+        rows: int = LISTING_DEDUP_LSH_ROWS,
+        keep: str = LISTING_DEDUP_KEEP,
+        seed: int = 0,
+    ) -> None:
+        """
+        Args:
+            similarity: Minimum estimated Jaccard similarity to merge two titles.
+            short_title_chars: Normalised titles shorter than this only merge with the same words.
+            max_price_ratio: Highest price of two merged listings over the lowest.
+            shingle_chars: Characters per shingle.
+            bands: LSH bands.
+            rows: MinHash values per band.
+            keep: "cheapest" or "best_condition".
+            seed: Seed of the MinHash functions.
+        """
+        if keep not in KEEP_ORDERS:
+            raise ValueError(f"keep must be one of {KEEP_ORDERS}, got {keep!r}")
+        self.similarity = similarity
+        self.short_title_chars = short_title_chars
+        self.max_price_ratio = max_price_ratio
+        self.shingle_chars = shingle_chars
+        self.bands = bands
+        self.rows = rows
+        self.keep = keep
+        rng = np.random.default_rng(seed)
+        permutations = bands * rows
+        # Multiply-shift hashing: (a * x + b) mod 2**64, top 32 bits; a odd
+        self._multipliers = rng.integers(0, 2**63, permutations, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._offsets = rng.integers(0, 2**63, permutations, dtype=np.uint64)
+        self._char_multipliers = rng.integers(0, 2**63, shingle_chars, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._band_multipliers = rng.integers(0, 2**63, rows, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+    def _shingle_hashes(self, titles: List[str]):
+        """(hashes, offsets): the 64-bit hash of every shingle, titles one after another, and where each title starts."""
+        padded = [title.ljust(self.shingle_chars, "\0") for title in titles]  # Short titles form one shingle
+        lengths = np.array([len(title) for title in padded], dtype=np.int64)
+        counts = lengths - self.shingle_chars + 1
+        codes = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+        title_starts = np.cumsum(lengths) - lengths
+        offsets = np.cumsum(counts) - counts
+        positions = np.arange(counts.sum()) - np.repeat(offsets, counts) + np.repeat(title_starts, counts)
+        hashes = np.zeros(len(positions), dtype=np.uint64)
+        for index, multiplier in enumerate(self._char_multipliers):
+            hashes += codes[positions + index] * multiplier
+        return hashes, offsets
+
+    def signatures(self, titles: List[str]) -> np.ndarray:
+        """MinHash signatures of normalised, non-empty titles, shape (len(titles), bands * rows), uint32."""
+        hashes, offsets = self._shingle_hashes(titles)
+        signatures = np.empty((len(titles), len(self._multipliers)), dtype=np.uint32)
+        chunk = 8  # Hash functions per step, to bound the temporary (chunk x shingles) array
+        for start in range(0, len(self._multipliers), chunk):
+            multipliers = self._multipliers[start : start + chunk, None]
+            values = (hashes[None, :] * multipliers + self._offsets[start : start + chunk, None]) >> np.uint64(32)
+            signatures[:, start : start + chunk] = np.minimum.reduceat(values, offsets, axis=1).T
+        return signatures
+
+    def cluster(self, items: Sequence[Any]) -> ListingClusters:
+        """
+        Clusters items (name, price, item_condition_id) by title.
+
+        Returns:
+            The ListingClusters; every item is in exactly one cluster.
+        """
+        names = items.names if isinstance(items, ItemStore) else [item.name or "" for item in items]
+        words = [title_words(name) for name in names]
+        titles = ["".join(title) for title in words]
+        prices, conditions = _prices_and_conditions(items)
+        labels = np.arange(len(titles))
+        titled = [index for index, title in enumerate(titles) if title]
+        if titled:
+            signatures = self.signatures([titles[index] for index in titled])
+            min_agreement = int(np.ceil(self.similarity * signatures.shape[1]))
+            # The word set of each short title (None for the others)
+            short_words = [
+                frozenset(words[index]) if len(titles[index]) < self.short_title_chars else None for index in titled
+            ]
+            title_prices = prices[titled].tolist()
+            title_conditions = conditions[titled].tolist()
+            bands = signatures.reshape(len(titled), self.bands, self.rows).astype(np.uint64)
+            band_keys = (bands * self._band_multipliers).sum(axis=2).tolist()  # Wraps mod 2**64
+            # Condition -> per band, band key -> positions of the first titles of clusters
+            buckets_by_condition: Dict[int, List[Dict[int, List[int]]]] = {}
+            for position, keys in enumerate(band_keys):
+                price = title_prices[position]
+                buckets = buckets_by_condition.get(title_conditions[position])
+                if buckets is None:
+                    buckets = buckets_by_condition[title_conditions[position]] = [{} for _ in range(self.bands)]
+                leaders = set()
+                for band, key in enumerate(keys):
+                    bucket = buckets[band].get(key)
+                    if bucket:
+                        leaders.update(bucket)
+                candidates = [leader for leader in leaders if self._similar_prices(price, title_prices[leader])]
+                if candidates:
+                    agreement = np.count_nonzero(signatures[candidates] == signatures[position], axis=1)
+                    best = int(np.argmax(agreement))
+                    leader = candidates[best]
+                    same_words = short_words[position] == short_words[leader]  # Both long, or the same words
+                    if agreement[best] >= min_agreement and same_words:  # Joins the most similar cluster
+                        labels[titled[position]] = titled[leader]
+                        continue
+                for band, key in enumerate(keys):  # Starts a cluster
+                    buckets[band].setdefault(key, []).append(position)
+        return self._clusters(labels, prices, conditions)
+
+    def _similar_prices(self, price: int, other: int) -> bool:
+        if price <= 0 or other <= 0:
+            return True
+        return max(price, other) <= self.max_price_ratio * min(price, other)
+
+    def _clusters(self, labels: np.ndarray, prices: np.ndarray, conditions: np.ndarray) -> ListingClusters:
+        prices = np.where(prices > 0, prices, _UNPRICED)
+        conditions = np.where(conditions > 0, conditions, 127)  # Unknown condition sorts last
+        order_keys = (prices, conditions) if self.keep == "cheapest" else (conditions, prices)
+        # np.lexsort sorts by the last key first: cluster, then the keep order, then position
+        order = np.lexsort((np.arange(len(labels)), order_keys[1], order_keys[0], labels))
+        sorted_labels = labels[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = sorted_labels[1:] != sorted_labels[:-1]
+        representatives = np.sort(order[first])
+        sizes = np.bincount(labels, minlength=len(labels))[labels[representatives]]
+        return ListingClusters(labels, representatives, sizes)
+
+    def deduplicate(self, items: Sequence[Any]) -> Sequence[Any]:
+        """The representative items, in their original order (see cluster())."""
+        return self.cluster(items).select(items)
+
+
+def _prices_and_conditions(items: Sequence[Any]):
+    """(prices, item condition IDs) of items as int64 arrays, 0 where unknown."""
+    if isinstance(items, ItemStore):
+        if not len(items):
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        return (
+            np.frombuffer(items.prices, dtype=np.int64),
+            np.frombuffer(items.condition_ids, dtype=np.int8).astype(np.int64),
+        )
+    prices = np.fromiter((item.price or 0 for item in items), dtype=np.int64, count=len(items))
+    conditions = np.fromiter((item.item_condition_id or 0 for item in items), dtype=np.int64, count=len(items))
+    return prices, conditions
+
+
+# Deduplicator with the defaults from constants
+listing_deduplicator = ListingDeduplicator()
+
+if __name__ == "__main__":
+    example_items = ItemStore(
+        ids=[f"m{index:03d}" for index in range(12)],
+        names=[
+            "【美品】Nintendo Switch Lite 本体のみ グレー",
+            "Nintendo Switch Lite 本体のみ　グレー ★送料無料★",
+            "NINTENDO SWITCH LITE 本体のみ ぐれー 即購入OK",
+            "Nintendo Switch Lite 本体のみ グレー",
+            "Nintendo Switch Lite 保護フィルム 2枚セット",
+            "Switch Lite ケース 透明",
+            "Nintendo Switch 本体",
+            "Nintendo Switch 本体 ジャンク",
+            "Nintendo Switch 本体 箱のみ",
+            "ポケモンカード 151 BOX シュリンク付き",
+            "ポケモンカード 151 BOX シュリンクなし",
+            "Nintendo Switch Lite 本体のみ グレー",
+        ],
+        prices=[15800, 14500, 16000, 16500, 500, 800, 25000, 5000, 800, 9800, 7800, 6000],
+        condition_ids=[2, 2, 2, 2, 1, 1, 2, 6, 3, 1, 1, 2],
+    )
+    for title in example_items.names[:2]:
+        print(f"{title!r} -> {normalize_title(title)!r}")
+    for keep in KEEP_ORDERS:
+        clusters = ListingDeduplicator(keep=keep).cluster(example_items)
+        print(f"\nkeep={keep}: {clusters.duplicates} duplicates")
+        for item in clusters.select(example_items):
+            print(f"  {item.id_} ¥{item.price} cond {item.item_condition_id} x{clusters.size_by_id(example_items)[item.id_]}: {item.name}")
@@ -1,5 +1,178 @@
-# item count for recommendations
+import os
+
+# item count for recommendations (the best pre-ranked items are sent to the LLM)
 ITEM_COUNT_FOR_RECOMMENDATION = 20
+# Number of filtered search results collected and pre-ranked before the recommendation call
+PRE_RANKING_CANDIDATE_COUNT = 60
+
+# --- Local pre-ranking of search results ---
+# Weights of the per-item feature scores (each in 0-1); set a weight to 0 to ignore a feature
+PRE_RANKING_WEIGHTS = {
+    "title": 0.45,  # Share of query terms found in the title
+    "brand": 0.2,  # Title mentions one of the extracted brands
+    "condition": 0.15,  # New > like new > ... > poor
+    "price_typicality": 0.15,  # Close to the median price (outliers are often accessories or junk)
+    "cheapness": 0.05,  # Cheaper within the result set
+}
+# Prices this factor away from the median get a price_typicality score of 0
+PRE_RANKING_PRICE_SPREAD = 4.0
+
+# --- Near-duplicate listings ---
+# Listings with near-identical titles are clustered before pre-ranking and only one per cluster is ranked
+LISTING_DEDUP_ENABLED = os.environ.get("LISTING_DEDUP", "1") != "0"
+LISTING_DEDUP_SIMILARITY = 0.8  # Minimum estimated Jaccard similarity of the titles' character shingles
+# Titles shorter than this (normalised characters) are only merged with the same words: one added word
+# such as "箱のみ" or "ジャンク" is a small share of a long title's shingles but a different product
+LISTING_DEDUP_SHORT_TITLE_CHARS = 32
+# Listings are only merged with the same item condition and at most this price ratio (higher / lower)
+LISTING_DEDUP_MAX_PRICE_RATIO = 2.0
+LISTING_DEDUP_SHINGLE_CHARS = 3
+# MinHash signature = bands x rows values; titles sharing a band are compared.
+# 20 x 5 makes pairs at 0.8 similarity candidates with >99.9% probability.
+LISTING_DEDUP_LSH_BANDS = 20
+LISTING_DEDUP_LSH_ROWS = 5
+LISTING_DEDUP_KEEP = "cheapest"  # Representative of a cluster: "cheapest" or "best_condition"
+# Words sellers add to titles that do not describe the product (any width, case or kana).
+# Condition words (新品, 中古, ジャンク, 美品 ...) stay in the title: they tell listings apart.
+LISTING_TITLE_DECORATION_WORDS = (
+    "送料無料", "匿名配送", "即購入ok", "即購入可", "即日発送", "早い者勝ち", "値下げ", "最終値下げ",
+    "お値下げ", "大幅値下げ", "限定価格", "セール", "free shipping",
+)
+
+# --- Fuzzy category matching ---
+# Minimum cosine similarity (0-1) of character n-grams to accept a fuzzy category match
+CATEGORY_FUZZY_MATCH_THRESHOLD = 0.6
+# Number of closest categories considered per extracted name
+CATEGORY_FUZZY_TOP_K = 5
+# Fuzzy matches scoring within this fraction of the best one are kept as equally
+# likely (e.g. "腕時計" -> the analogue and digital watch categories)
+CATEGORY_FUZZY_RELATIVE_MARGIN = 0.05
+
+# --- Mercari search engine ---
+MERCARI_MAX_CONCURRENT_SEARCHES = 4
+MERCARI_SEARCH_TIMEOUT_SECONDS = 30.0
+# Paginated search: stop after this many pages or seconds, whichever comes first
+MERCARI_MAX_PAGES = 3
+MERCARI_PAGE_TIME_BUDGET_SECONDS = 15.0
+# Identical searches within this many seconds are served from memory (0 disables the cache)
+MERCARI_SEARCH_CACHE_TTL_SECONDS = 120.0
+MERCARI_SEARCH_CACHE_MAX_ENTRIES = 256
+# Filters sent to the search API (comma-separated MERCARI_PUSHDOWN_FILTERS); the others run
+# client-side when the result items carry the field (price, item_conditions, shipping_payer)
+MERCARI_PUSHDOWN_FILTERS = frozenset(
+    name.strip()
+    for name in os.environ.get(
+        "MERCARI_PUSHDOWN_FILTERS", "price,categories,brands,item_conditions,shipping_payer,sizes,colors"
+    ).split(",")
+    if name.strip()
+)
+
+# --- Ollama client ---
+# Not OLLAMA_HOST: the server reads that as its bind address (e.g. 0.0.0.0 without a scheme)
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_MODEL = os.environ.get("OLLAMA_MODEL", "llama3.2")
+OLLAMA_CONNECT_TIMEOUT_SECONDS = 5.0
+OLLAMA_READ_TIMEOUT_SECONDS = 120.0  # Longest wait between two streamed chunks
+OLLAMA_MAX_RETRIES = 2
+OLLAMA_BACKOFF_SECONDS = 0.5
+OLLAMA_KEEP_ALIVE = "30m"  # Keep the model loaded between calls
+OLLAMA_POOL_SIZE = 8
+# Context window requested from Ollama (options.num_ctx); prompts are budgeted to fit it
+OLLAMA_CONTEXT_TOKENS = int(os.environ.get("OLLAMA_NUM_CTX", "4096"))
+
+# --- LLM scheduler ---
+# Further Ollama server URLs (comma-separated OLLAMA_EXTRA_BASE_URLS) that share the load with OLLAMA_BASE_URL
+OLLAMA_EXTRA_BASE_URLS = [
+    url.strip() for url in os.environ.get("OLLAMA_EXTRA_BASE_URLS", "").split(",") if url.strip()
+]
+OLLAMA_ENDPOINT_MAX_CONCURRENCY = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))  # Calls per server
+LLM_PRIORITY_INTERACTIVE = 0  # Lower values are scheduled first
+LLM_PRIORITY_BATCH = 10
+LLM_HEDGE_PERCENTILE = 95.0  # Hedge when the first token is later than this percentile (None disables)
+LLM_HEDGE_MIN_SAMPLES = 20  # Observed first-token latencies needed before hedging
+LLM_LATENCY_WINDOW = 200  # Recent first-token latencies kept per scheduler and endpoint
+LLM_MAX_ATTEMPTS = 3  # Endpoints tried before a generation fails
+LLM_EJECT_AFTER_FAILURES = 3  # Consecutive failures that take an endpoint out of rotation
+LLM_HEALTH_CHECK_INTERVAL_SECONDS = 10.0
+LLM_HEALTH_CHECK_TIMEOUT_SECONDS = 2.0
+
+# --- Prompt building ---
+PROMPT_RESERVED_OUTPUT_TOKENS = 750  # Room left in the context for the response
+
+# --- Structured LLM output ---
+# "schema": constrain the output to a JSON schema (Ollama 0.5+), "json": any JSON, "none": prompt only
+OLLAMA_OUTPUT_FORMAT = os.environ.get("OLLAMA_OUTPUT_FORMAT", "schema")
+LLM_TEMPERATURE = 0.5
+LLM_OUTPUT_MAX_ATTEMPTS = 2  # Generations per call; a retry only follows output that cannot be parsed
+LLM_RETRY_TEMPERATURE = 0.0  # Retries are greedy, so they do not sample the same mistake again
+PROMPT_SAFETY_MARGIN_TOKENS = 64  # Token estimates are approximate
+PROMPT_MAX_TITLE_CHARS = 60  # Longer item titles are trimmed
+
+# --- Batch mode ---
+BATCH_LLM_CONCURRENCY = 2
+BATCH_SEARCH_CONCURRENCY = 4
+
+# --- HTTP service mode ---
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+SERVICE_LLM_CONCURRENCY = 4
+SERVICE_SEARCH_CONCURRENCY = 16
+SERVICE_MAX_IN_FLIGHT = 512  # Requests beyond this are rejected with 503
+SERVICE_REQUEST_TIMEOUT_SECONDS = 90.0  # Default per-request deadline
+SERVICE_MAX_REQUEST_TIMEOUT_SECONDS = 300.0  # Upper bound for a client-supplied deadline
+SERVICE_MAX_BODY_BYTES = 64 * 1024
+SERVICE_IDLE_TIMEOUT_SECONDS = 30.0  # Keep-alive connections idle longer than this are closed
+
+# --- Watch mode ---
+# Saved searches, their extracted parameters and seen item IDs (survives restarts)
+WATCH_STATE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "mercari_shopper", "watch_state.npz")
+WATCH_LLM_CONCURRENCY = 2
+WATCH_SEARCH_CONCURRENCY = 16
+# Poll intervals adapt between these bounds: a quiet poll multiplies the interval by
+# WATCH_INTERVAL_BACKOFF, a poll with new items by WATCH_INTERVAL_SPEEDUP
+WATCH_INITIAL_INTERVAL_SECONDS = 120.0
+WATCH_MIN_INTERVAL_SECONDS = 60.0
+WATCH_MAX_INTERVAL_SECONDS = 30 * 60.0
+WATCH_INTERVAL_BACKOFF = 1.5
+WATCH_INTERVAL_SPEEDUP = 0.5
+WATCH_JITTER = 0.2  # Each poll is scheduled within +-20% of the interval
+WATCH_MAX_PAGES_PER_POLL = 3  # Newest-first pages read until one holds a seen item
+WATCH_SEEN_CAPACITY = 1024  # Item IDs per Bloom filter generation (two are kept per search)
+WATCH_SEEN_FALSE_POSITIVE_RATE = 0.001
+WATCH_SAVE_INTERVAL_SECONDS = 60.0
+
+# --- LLM response cache ---
+LLM_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "mercari_shopper", "llm_cache.sqlite3"
+)
+LLM_CACHE_TTL_SECONDS = 24 * 60 * 60
+LLM_CACHE_MAX_MEMORY_ENTRIES = 512
+LLM_CACHE_MAX_DISK_ENTRIES = 50_000
+
+# --- Semantic parameter cache ---
+# Reuses the parameters extracted for a similar earlier request (see semantic_cache.py)
+SEMANTIC_CACHE_ENABLED = os.environ.get("SEMANTIC_CACHE", "1") != "0"
+SEMANTIC_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "mercari_shopper", "semantic_cache.npz"
+)
+SEMANTIC_CACHE_ENCODER = os.environ.get("SEMANTIC_CACHE_ENCODER", "ollama")  # "ollama" or "hashing"
+OLLAMA_EMBEDDING_MODEL = os.environ.get("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text")
+# Minimum cosine similarity for reuse, per encoder (tune with benchmarks.eval_semantic_cache)
+SEMANTIC_CACHE_THRESHOLDS = {"ollama": 0.92, "hashing": 0.85}
+SEMANTIC_CACHE_TTL_SECONDS = 24 * 60 * 60
+SEMANTIC_CACHE_MAX_ENTRIES = 20_000
+SEMANTIC_CACHE_LSH_TABLES = 16
+SEMANTIC_CACHE_LSH_BITS = 8
+SEMANTIC_CACHE_EXACT_SEARCH_MAX_ENTRIES = 4096  # Up to this size the whole matrix is scanned
+SEMANTIC_CACHE_SAVE_EVERY = 100  # New entries between writes to disk
+HASHING_ENCODER_DIMENSIONS = 1024
+
+# --- Telemetry ---
+TELEMETRY_METRIC_PREFIX = "mercari_shopper_"
+# Histogram bucket upper bounds in seconds (LLM calls take seconds, matching takes microseconds)
+TELEMETRY_DURATION_BUCKETS = (
+    0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
 
 # --- Item Condition ID to Name Mapping ---
 ITEM_CONDITION_ID_TO_NAME_MAP = {
@@ -11,6 +184,130 @@ ITEM_CONDITION_ID_TO_NAME_MAP = {
     6: "Used - Poor",  # "全体的に状態が悪い"
 }
 
+# --- Item Condition Name to ID Mapping (English and Japanese names/aliases, lowercase) ---
+ITEM_CONDITION_NAME_TO_ID_MAP = {
+    **{name.lower(): condition_id for condition_id, name in ITEM_CONDITION_ID_TO_NAME_MAP.items()},
+    "new": 1,
+    "unused": 1,
+    "brand new": 1,
+    "新品": 1,
+    "未使用": 1,
+    "新品、未使用": 1,
+    "未使用に近い": 2,
+    "目立った傷や汚れなし": 3,
+    "美品": 3,
+    "やや傷や汚れあり": 4,
+    "傷や汚れあり": 5,
+    "全体的に状態が悪い": 6,
+    "junk": 6,
+    "ジャンク": 6,
+}
+
+# --- Shipping payer phrases (lowercase) to shipping payer codes (see facets/shippingPayers.json) ---
+SHIPPING_PAYER_PHRASE_TO_CODE_MAP = {
+    "free shipping": "seller",
+    "shipping included": "seller",
+    "seller pays shipping": "seller",
+    "shipping paid by seller": "seller",
+    "送料込み": "seller",
+    "送料込": "seller",
+    "送料無料": "seller",
+    "出品者負担": "seller",
+    "buyer pays shipping": "buyer",
+    "shipping paid by buyer": "buyer",
+    "cash on delivery": "buyer",
+    "着払い": "buyer",
+    "購入者負担": "buyer",
+}
+
+# --- Color names (lowercase) to color facet names (see facets/colors.json) ---
+COLOR_NAME_TO_FACET_NAME_MAP = {
+    "white": "ホワイト系", "白": "ホワイト系", "しろ": "ホワイト系",
+    "black": "ブラック系", "黒": "ブラック系", "くろ": "ブラック系",
+    "gray": "グレイ系", "grey": "グレイ系", "グレー": "グレイ系", "灰色": "グレイ系", "silver": "グレイ系", "シルバー": "グレイ系",
+    "brown": "ブラウン系", "茶色": "ブラウン系", "茶": "ブラウン系",
+    "beige": "ベージュ系",
+    "green": "グリーン系", "緑": "グリーン系", "khaki": "グリーン系", "カーキ": "グリーン系",
+    "blue": "ブルー系", "青": "ブルー系", "navy": "ブルー系", "ネイビー": "ブルー系", "紺": "ブルー系",
+    "purple": "パープル系", "紫": "パープル系",
+    "yellow": "イエロー系", "黄色": "イエロー系", "gold": "イエロー系", "ゴールド": "イエロー系",
+    "pink": "ピンク系",
+    "red": "レッド系", "赤": "レッド系",
+    "orange": "オレンジ系",
+}
+
+# --- Size names (lowercase) to size facet names (see facets/sizes.json) ---
+# Facet names, their parts ("XL(LL)" -> "xl", "ll") and names without "サイズ" are matched too
+SIZE_NAME_TO_FACET_NAME_MAP = {
+    "small": "S",
+    "medium": "M",
+    "large": "L",
+    "x-large": "XL(LL)",
+    "extra large": "XL(LL)",
+    "free": "FREE SIZE",
+    "one size": "FREE SIZE",
+    "フリー": "FREE SIZE",
+    "フリーサイズ": "FREE SIZE",
+}
+
+# --- Rule-based fast-path extraction ---
+# Share of the request the rules must explain before the LLM is skipped
+FAST_PATH_MIN_COVERAGE = 0.9
+# Longer free-text queries are usually conversational and go to the LLM
+FAST_PATH_MAX_QUERY_WORDS = 4
+# Words that carry no search meaning and are dropped from the query
+FAST_PATH_FILLER_WORDS = {
+    "a", "an", "the", "in", "for", "with", "of", "by", "and", "on", "at",
+    "please", "find", "me", "i", "want", "need", "looking", "search", "show",
+    "jpy", "yen", "円",
+}
+# Words the rules cannot interpret (vague prices, negations, intent); their presence sends the request to the LLM
+FAST_PATH_HEDGE_WORDS = {
+    "cheap", "cheapest", "budget", "affordable", "expensive", "around", "about",
+    "roughly", "approximately", "not", "no", "without", "except", "but", "or",
+    "gift", "present", "recommend", "best", "good", "nice", "similar", "like",
+    "something", "anything", "sort", "sorted", "newest", "latest",
+    "安い", "激安", "くらい", "ぐらい", "程度", "前後", "以外", "なし", "おすすめ", "プレゼント",
+}
+# A brand mention is only turned into a filter if it is a whole token of at least this many
+# characters (Latin, not counting spaces) or kana/kanji characters; shorter ones go to the LLM
+FAST_PATH_MIN_BRAND_LATIN_CHARS = 4
+FAST_PATH_MIN_BRAND_CHARS = 3
+# Everyday English words (besides category, color, size and condition names). A brand named or
+# spelled like one ("apple", "coach", マザー for "mother") is left to the LLM, which has the context
+FAST_PATH_ORDINARY_WORDS = {
+    # Shopping and products
+    "new", "used", "old", "vintage", "antique", "retro", "classic", "original", "genuine", "authentic",
+    "handmade", "custom", "limited", "edition", "special", "standard", "basic", "premium", "deluxe",
+    "pro", "plus", "max", "mini", "lite", "light", "air", "one", "set", "pair", "pack", "lot", "box",
+    "case", "cover", "bag", "bags", "watch", "watches", "clock", "shoes", "shoe", "boots", "jacket",
+    "coat", "shirt", "dress", "skirt", "pants", "jeans", "denim", "hat", "cap", "ring", "necklace",
+    "book", "books", "game", "games", "toy", "toys", "card", "cards", "phone", "camera", "lens",
+    "table", "chair", "desk", "lamp", "cup", "bottle", "glass", "mirror", "pen", "paper", "note",
+    "kids", "kid", "baby", "child", "children", "girl", "girls", "boy", "boys", "men", "mens",
+    "women", "womens", "ladies", "lady", "man", "woman", "mother", "father", "mom", "family",
+    "home", "house", "room", "kitchen", "garden", "outdoor", "indoor", "sport", "sports", "golf",
+    "tennis", "running", "walking", "travel", "beauty", "care", "health", "fashion", "style",
+    "design", "art", "arts", "craft", "crafts", "music", "studio", "works", "factory", "shop",
+    "store", "market", "select", "collection", "line", "label", "brand", "company", "club",
+    "team", "world", "japan", "japanese", "tokyo", "paris", "london", "new york", "city", "urban",
+    "country", "nature", "natural", "organic", "earth", "sun", "moon", "star", "sky", "sea",
+    "ocean", "river", "mountain", "forest", "tree", "flower", "rose", "lily", "apple", "orange",
+    "lemon", "cherry", "peach", "berry", "almond", "coffee", "tea", "milk", "honey", "sugar",
+    "salt", "water", "fire", "ice", "snow", "rain", "wind", "stone", "gold", "silver", "diamond",
+    "pearl", "crystal", "black", "white", "red", "blue", "green", "yellow", "pink", "brown",
+    "grey", "gray", "navy", "beige", "free", "mac", "coach", "supreme", "other", "another",
+    # Everyday words
+    "to", "up", "in", "out", "on", "off", "over", "under", "all", "any", "every", "more", "most",
+    "good", "great", "best", "nice", "happy", "lucky", "love", "sweet", "cute", "cool", "hot",
+    "smart", "simple", "pure", "real", "true", "big", "small", "little", "long", "short", "high",
+    "low", "fast", "first", "last", "next", "double", "single", "twin", "half", "full", "open",
+    "active", "act", "action", "arch", "archive", "arcade", "against", "actually", "beyond",
+    "forever", "always", "today", "day", "night", "time", "life", "living", "people", "friends",
+    "heart", "mind", "soul", "dream", "spirit", "angel", "king", "queen", "prince", "princess",
+    "lion", "tiger", "bear", "wolf", "fox", "cat", "dog", "bird", "eagle", "horse", "rabbit",
+}
+
 
 ENG_TO_JPN_CATEGORY_MAP = {
     # NOTE: This is a partial mapping for demonstration purposes.
@@ -0,0 +1,327 @@
+import asyncio
+import contextvars
+import json
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+from internal.utils.constants import (
+    TELEMETRY_DURATION_BUCKETS,
+    TELEMETRY_METRIC_PREFIX,
+)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("telemetry_span", default=None)
+
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_key: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{key}="{_escape_label_value(value)}"' for key, value in label_key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _NullSpan:
+    """Returned by Telemetry.span() while disabled; does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """A timed section of work; nested spans share the trace ID of the outermost one."""
+
+    __slots__ = ("telemetry", "name", "attributes", "trace_id", "span_id", "parent_id", "_start", "_token")
+
+    def __init__(self, telemetry: "Telemetry", name: str, attributes: Dict[str, Any]) -> None:
+        self.telemetry = telemetry
+        self.name = name
+        self.attributes = attributes
+        self.span_id = uuid.uuid4().hex[:16]
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent is not None else None
+
+    def set(self, **attributes: Any) -> None:
+        """Adds attributes (e.g. result sizes) to the span's log line."""
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        duration = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        if exc_type is None:
+            status = "ok"
+        elif issubclass(exc_type, asyncio.CancelledError):
+            status = "cancelled"  # E.g. a page prefetch that was no longer needed
+        else:
+            status = "error"
+        self.telemetry.observe("stage_duration_seconds", duration, stage=self.name, status=status)
+        self.telemetry.log_line(
+            {
+                "type": "span",
+                "name": self.name,
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "duration_ms": round(duration * 1000, 3),
+                "status": status,
+                **self.attributes,
+            }
+        )
+        return False
+
+
+class Telemetry:
+    """
+    Spans, counters and histograms for the pipeline stages.
+
+    Disabled by default: span() then returns a shared no-op object and
+    count()/observe() return immediately, so instrumented code pays one
+    attribute check. When enabled, metrics are kept in memory and exported in
+    the Prometheus text format (render_prometheus() or the /metrics endpoint
+    of start_http_server()), and spans and events are written as JSON lines to
+    log_file if one is set.
+
+    Diagnostics go through event(): as JSON lines when a log file is set, and
+    otherwise printed as before, so the CLI output does not change.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        log_file: Optional[TextIO] = None,
+        buckets: Tuple[float, ...] = TELEMETRY_DURATION_BUCKETS,
+        prefix: str = TELEMETRY_METRIC_PREFIX,
+    ) -> None:
+        """
+        Args:
+            enabled: Record metrics and spans.
+            log_file: (Optional) Stream receiving one JSON object per line.
+            buckets: Upper bounds of the histogram buckets (seconds).
+            prefix: Prefix of every exported metric name.
+        """
+        self.enabled = enabled
+        self.log_file = log_file
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, list]] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def configure(self, enabled: Optional[bool] = None, log_file: Optional[TextIO] = None) -> None:
+        if enabled is not None:
+            self.enabled = enabled
+        if log_file is not None:
+            self.log_file = log_file
+
+    # --- Recording ---
+
+    def span(self, name: str, **attributes: Any):
+        """Context manager timing a stage, e.g. `with telemetry.span("search", page=2):`."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, attributes)
+
+    def annotate(self, **attributes: Any) -> None:
+        """Adds attributes to the current span, if any (e.g. from code that does not own it)."""
+        if not self.enabled:
+            return
+        span = _current_span.get()
+        if span is not None:
+            span.set(**attributes)
+
+    def count(self, metric: str, value: float = 1, **labels: Any) -> None:
+        """Adds value to the counter metric{labels}."""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(metric, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, metric: str, value: float, **labels: Any) -> None:
+        """Records value in the histogram metric{labels}."""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(metric, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][bisect_left(self.buckets, value)] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def record_ollama_stats(self, stats: Dict[str, Any], stage: str) -> None:
+        """Records the final statistics Ollama reports for a generation (durations are in ns)."""
+        if not self.enabled or not stats:
+            return
+        self.count("ollama_prompt_tokens_total", stats.get("prompt_eval_count") or 0, stage=stage)
+        self.count("ollama_eval_tokens_total", stats.get("eval_count") or 0, stage=stage)
+        for field in ("prompt_eval_duration", "eval_duration", "load_duration", "total_duration"):
+            if stats.get(field) is not None:
+                self.observe(f"ollama_{field}_seconds", stats[field] / 1e9, stage=stage)
+        span = _current_span.get()
+        if span is not None:
+            span.set(
+                prompt_eval_count=stats.get("prompt_eval_count"),
+                eval_count=stats.get("eval_count"),
+                prompt_eval_ms=round((stats.get("prompt_eval_duration") or 0) / 1e6, 1),
+                eval_ms=round((stats.get("eval_duration") or 0) / 1e6, 1),
+            )
+
+    def log_line(self, record: Dict[str, Any]) -> None:
+        if self.log_file is None:
+            return
+        record = {"ts": round(time.time(), 6), **record}
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self.log_file.write(line + "\n")
+            self.log_file.flush()
+
+    def event(self, level: str, name: str, message: str, **fields: Any) -> None:
+        """
+        Reports a diagnostic (info, warning or error).
+
+        Counted as events_total{level,event}. Written as a JSON line when a log
+        file is configured, otherwise printed like the CLI always did.
+
+        Args:
+            level: "info", "warning" or "error".
+            name: Stable event name, e.g. "category_unmatched".
+            message: Human-readable message.
+            **fields: Structured details for the JSON line.
+        """
+        self.count("events_total", level=level, event=name)
+        if self.log_file is not None:
+            span = _current_span.get()
+            self.log_line(
+                {
+                    "type": "event",
+                    "level": level,
+                    "name": name,
+                    "message": message,
+                    "trace_id": span.trace_id if span is not None else None,
+                    **fields,
+                }
+            )
+        else:
+            print(f"{level.capitalize()}: {message}")
+
+    # --- Export ---
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copies of all counters and histograms (for tests and JSON export)."""
+        with self._lock:
+            return {
+                "counters": {
+                    name: {_format_labels(key): value for key, value in series.items()}
+                    for name, series in self._counters.items()
+                },
+                "histograms": {
+                    name: {
+                        _format_labels(key): {"count": histogram[2], "sum": histogram[1]}
+                        for key, histogram in series.items()
+                    }
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                metric = f"{self.prefix}{name}"
+                lines.append(f"# TYPE {metric} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{metric}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                metric = f"{self.prefix}{name}"
+                lines.append(f"# TYPE {metric} histogram")
+                for key, (bucket_counts, total, count) in sorted(series.items()):
+                    cumulative = 0
+                    for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                        cumulative += bucket_count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        bucket_labels = _format_labels(key, 'le="%s"' % le)
+                        lines.append(f"{metric}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{metric}_sum{_format_labels(key)} {total}")
+                    lines.append(f"{metric}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serves render_prometheus() at http://host:port/metrics on a daemon thread."""
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        self._server = server
+        return server
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+# Shared instance; disabled until the CLI (or a benchmark) enables it
+telemetry = Telemetry()
+
+if __name__ == "__main__":
+    telemetry.configure(enabled=True, log_file=sys.stdout)
+    with telemetry.span("extraction", request="nintendo switch"):
+        with telemetry.span("llm_generate"):
+            time.sleep(0.01)
+            telemetry.record_ollama_stats(
+                {"prompt_eval_count": 900, "eval_count": 60, "prompt_eval_duration": 4e8, "eval_duration": 1.2e9},
+                stage="extraction",
+            )
+        telemetry.event("warning", "category_unmatched", "Category 'foo' did not match.", category="foo")
+    telemetry.count("llm_cache_lookups_total", result="miss")
+    print(telemetry.render_prometheus())
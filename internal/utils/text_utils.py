@@ -0,0 +1,21 @@
+import re
+import unicodedata
+
+# Hiragana -> katakana, so "ないき" and "ナイキ" normalise to the same text
+HIRAGANA_TO_KATAKANA = {code: code + 0x60 for code in range(0x3041, 0x3097)}
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def fold_text(text):
+    """
+    Normalises width (NFKC) and case and collapses whitespace, keeping the kana as typed.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def normalize_text(text):
+    """
+    Normalises width (NFKC), case and kana (hiragana to katakana) and collapses whitespace.
+    """
+    return fold_text(text).translate(HIRAGANA_TO_KATAKANA)
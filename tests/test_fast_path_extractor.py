@@ -0,0 +1,71 @@
+"""
+Brand handling of FastPathExtractor on the bundled facet data.
+
+Run from the project root with:
+    python -m pytest tests
+"""
+
+import pytest
+
+from internal.parameter_matching.fast_path_extractor import FastPathExtractor
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return FastPathExtractor()
+
+
+@pytest.mark.parametrize(
+    "request_text",
+    [
+        "mac book air 2020 under 50000 yen",  # マック (cosmetics), エアー
+        "apple watch",
+        "gift for mother",  # マザー
+        "mother bag",
+        "coach bag 新品",
+    ],
+)
+def test_brand_spelled_like_an_ordinary_word_goes_to_the_llm(extractor, request_text):
+    result = extractor.extract(request_text)
+
+    assert not result.confident
+    assert result.params["brands"] == []
+
+
+def test_short_brand_mention_goes_to_the_llm(extractor):
+    result = extractor.extract("ugg boots")
+
+    assert not result.confident
+    assert "ugg" in result.unexplained
+
+
+def test_mention_of_several_brands_goes_to_the_llm(extractor):
+    result = extractor.extract("triumph bag")  # Two brands are spelled TRIUMPH
+
+    assert not result.confident
+    assert result.params["brands"] == []
+    assert "triumph" in result.unexplained
+
+
+def test_brand_inside_a_longer_word_is_not_a_mention(extractor):
+    result = extractor.extract("tシャツ 1000円以下")  # Not the brand シャツ
+
+    assert result.confident
+    assert result.params["brands"] == []
+    assert result.params["query"] == "tシャツ"
+
+
+@pytest.mark.parametrize(
+    "request_text, query",
+    [
+        ("seiko watch under 5000 yen", "seiko watch"),
+        ("louis vuitton bag", "louis vuitton bag"),
+        ("ナイキのスニーカー 1万円以下", "ナイキのスニーカー"),
+    ],
+)
+def test_unambiguous_brand_becomes_a_filter(extractor, request_text, query):
+    result = extractor.extract(request_text)
+
+    assert result.confident
+    assert len(result.params["brands"]) == 1
+    assert result.params["query"] == query
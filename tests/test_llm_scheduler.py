@@ -0,0 +1,242 @@
+"""
+Behaviour of OllamaScheduler against fake Ollama servers (benchmarks.stand_ins).
+
+Run from the project root with:
+    python -m pytest tests
+"""
+
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from benchmarks.stand_ins import make_fake_ollama_server
+from internal.llm.llm_scheduler import OllamaScheduler
+from internal.llm.ollama_client import OllamaError
+from internal.utils.constants import LLM_PRIORITY_BATCH, LLM_PRIORITY_INTERACTIVE
+
+PROMPT = "User Request:\nvintage watch under 5000 yen\n"
+
+
+def wait_until(condition, timeout=3.0):
+    """Polls condition until it holds; returns whether it did within timeout seconds."""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture
+def fake_ollama():
+    """Starts fake Ollama servers in this process; returns their URL. Stopped after the test."""
+    servers = []
+
+    def start(port=0, **options):
+        server = make_fake_ollama_server(port, **{"token_rate": 2000.0, "latency": 0.0, **options})
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def make_scheduler():
+    """Creates started schedulers (without health checks unless given); closed after the test."""
+    schedulers = []
+
+    def make(urls, **options):
+        options.setdefault("health_check_interval", None)
+        scheduler = OllamaScheduler.from_urls(urls, **options)
+        scheduler.start()
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.close()
+
+
+async def gather_calls(scheduler, count, **options):
+    return await asyncio.gather(*(scheduler.agenerate(PROMPT, **options) for _ in range(count)))
+
+
+def test_generation_returns_the_streamed_output(fake_ollama, make_scheduler):
+    scheduler = make_scheduler([fake_ollama()])
+    pieces = []
+
+    generation = scheduler.generate(PROMPT, on_text=pieces.append)
+
+    assert json.loads(generation.text)["query"] == "vintage watch"
+    assert "".join(pieces) == generation.text
+    assert generation.stats["done"] is True
+
+
+def test_calls_go_to_the_least_loaded_endpoint(fake_ollama, make_scheduler):
+    urls = [fake_ollama(latency=0.5, parallel=2) for _ in range(3)]
+    scheduler = make_scheduler(urls, max_concurrency=2, hedge_percentile=None)
+
+    async def run():
+        first = asyncio.ensure_future(gather_calls(scheduler, 3))
+        await asyncio.sleep(0.2)
+        spread = [endpoint.in_flight for endpoint in scheduler.endpoints]
+        second = asyncio.ensure_future(gather_calls(scheduler, 4))
+        await asyncio.sleep(0.2)
+        full = [endpoint.in_flight for endpoint in scheduler.endpoints]
+        queued = scheduler.stats()["queued"]
+        await asyncio.gather(first, second)
+        return spread, full, queued
+
+    spread, full, queued = asyncio.run(run())
+
+    assert spread == [1, 1, 1]
+    assert full == [2, 2, 2]  # Never more than max_concurrency per endpoint
+    assert queued == 1
+    assert sum(endpoint.completed for endpoint in scheduler.endpoints) == 7
+
+
+def test_queued_calls_run_in_priority_order(fake_ollama, make_scheduler):
+    scheduler = make_scheduler([fake_ollama(latency=0.1)], max_concurrency=1, hedge_percentile=None)
+    finished = []
+
+    async def call(label, priority):
+        await scheduler.agenerate(PROMPT, priority=priority)
+        finished.append(label)
+
+    async def run():
+        calls = [asyncio.ensure_future(call("running", LLM_PRIORITY_BATCH))]
+        await asyncio.sleep(0.05)
+        calls += [asyncio.ensure_future(call(f"batch {index}", LLM_PRIORITY_BATCH)) for index in range(3)]
+        await asyncio.sleep(0.05)
+        calls.append(asyncio.ensure_future(call("interactive", LLM_PRIORITY_INTERACTIVE)))
+        await asyncio.gather(*calls)
+
+    asyncio.run(run())
+
+    assert finished == ["running", "interactive", "batch 0", "batch 1", "batch 2"]
+
+
+def test_slow_call_is_hedged_and_the_loser_cancelled(fake_ollama, make_scheduler):
+    slow, fast = fake_ollama(latency=3.0), fake_ollama()
+    scheduler = make_scheduler([slow, fast], hedge_percentile=50.0, hedge_min_samples=1)
+    scheduler.first_token_seconds.append(0.1)  # Hedge after 0.1 s without a first token
+    slow_endpoint, fast_endpoint = scheduler.endpoints
+
+    start = time.perf_counter()
+    generation = scheduler.generate(PROMPT)
+    elapsed = time.perf_counter() - start
+
+    assert json.loads(generation.text)["query"] == "vintage watch"
+    assert elapsed < 2.0
+    assert (scheduler.hedges_sent, scheduler.hedges_won) == (1, 1)
+    assert fast_endpoint.completed == 1
+    # The primary request is cancelled, not left running until the slow server answers
+    assert wait_until(lambda: slow_endpoint.in_flight == 0, timeout=1.0)
+    assert slow_endpoint.completed == 0 and slow_endpoint.failures == 0
+
+
+def test_no_hedge_while_calls_are_queued(fake_ollama, make_scheduler):
+    scheduler = make_scheduler(
+        [fake_ollama(latency=0.3), fake_ollama(latency=0.3)],
+        max_concurrency=1,
+        hedge_percentile=50.0,
+        hedge_min_samples=1,
+    )
+    scheduler.first_token_seconds.append(0.01)
+
+    asyncio.run(gather_calls(scheduler, 4))
+
+    assert scheduler.hedges_sent == 0
+
+
+def test_failing_endpoint_is_ejected_and_readmitted(fake_ollama, make_scheduler):
+    port = free_port()  # Nothing listens here yet
+    scheduler = make_scheduler(
+        [f"http://127.0.0.1:{port}", fake_ollama()],
+        hedge_percentile=None,
+        eject_after_failures=1,
+        health_check_interval=0.2,
+    )
+    dead_endpoint, live_endpoint = scheduler.endpoints
+
+    for _ in range(3):  # The dead endpoint is tried first until ejected; every call fails over
+        scheduler.generate(PROMPT)
+
+    assert not dead_endpoint.healthy
+    assert dead_endpoint.failures >= 1 and dead_endpoint.completed == 0
+    assert live_endpoint.completed == 3
+
+    fake_ollama(port=port)
+    assert wait_until(lambda: dead_endpoint.healthy)
+    scheduler.generate(PROMPT)
+    assert dead_endpoint.completed == 1  # Back in rotation (and not yet slower than the other)
+
+
+def test_stream_broken_before_any_text_reached_the_caller_fails_over(fake_ollama, make_scheduler):
+    scheduler = make_scheduler(
+        [fake_ollama(break_after_tokens=3), fake_ollama()], hedge_percentile=None, eject_after_failures=10
+    )
+    broken_endpoint, working_endpoint = scheduler.endpoints
+
+    generation = scheduler.generate(PROMPT)
+
+    assert json.loads(generation.text)["query"] == "vintage watch"
+    assert broken_endpoint.failures == 1
+    assert working_endpoint.completed == 1
+
+
+def test_stream_broken_after_text_reached_the_caller_raises(fake_ollama, make_scheduler):
+    scheduler = make_scheduler(
+        [fake_ollama(break_after_tokens=3), fake_ollama()], hedge_percentile=None, eject_after_failures=10
+    )
+    pieces = []
+
+    with pytest.raises(OllamaError):
+        scheduler.generate(PROMPT, on_text=pieces.append)
+
+    assert len(pieces) == 3  # Retrying elsewhere would have repeated these
+    assert scheduler.endpoints[1].completed == 0
+
+
+def test_every_endpoint_failing_raises(make_scheduler):
+    scheduler = make_scheduler([f"http://127.0.0.1:{free_port()}", f"http://127.0.0.1:{free_port()}"])
+
+    with pytest.raises(OllamaError):
+        scheduler.generate(PROMPT)
+
+
+def test_close_cancels_calls_in_flight_and_queued(fake_ollama, make_scheduler):
+    scheduler = make_scheduler([fake_ollama(latency=5.0)], max_concurrency=1)
+    errors = []
+
+    def call():
+        try:
+            scheduler.generate(PROMPT)
+        except OllamaError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    assert wait_until(lambda: scheduler.stats()["queued"] == 2)
+
+    scheduler.close()
+    for thread in threads:
+        thread.join(2)
+
+    assert len(errors) == 3
+    assert scheduler.endpoints[0].in_flight == 0